@@ -0,0 +1,293 @@
+import asyncio
+import contextlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from dataclasses import asdict
+
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from budgets import RunBudget
+from checkpoints import is_resumable, read_meta
+from code_pool import get_code_pool
+from memory_watchdog import get_watchdog
+from messages import image_refs
+from run_channel import RunChannel, execute
+from run_options import RunOptions
+from runs import new_run_id, read_summary
+from scheduler import PRIORITIES, QueueFull, get_scheduler
+from single_flight import single_flight
+from tracing import setup_tracing
+from transcripts import FORMATS, export_filename, export_transcript, transcript_path
+from worker_pool import get_worker_pool
+
+load_dotenv()
+
+KEEPALIVE_SECONDS = 15
+# RunOptions fields a request may set; the rest of the app's configuration stays with the operator
+REQUEST_OPTIONS = ("stable_prefix", "page_index", "surfer_mode", "coding_agents", "prefetch", "context_budget")
+
+
+class RunRegistry:
+    """Runs started by this server; finished ones are kept until max_finished is exceeded"""
+
+    def __init__(self, max_finished=1000):
+        self.max_finished = max_finished
+        self.channels = OrderedDict()
+        self.tasks = {}
+
+    def submit(self, task, budget, options, resume_from=None, user=None, priority=0):
+        """Start a run, or attach to an identical one in progress; returns (channel, coalesced)"""
+
+        def start():
+            pool = get_worker_pool()
+            if pool is not None:
+                return pool.submit(task, budget, options, resume_from, user, priority)
+            channel = RunChannel(new_run_id(), task)
+            self.tasks[channel.run_id] = asyncio.create_task(
+                self._run(channel, budget, options, resume_from, user, priority)
+            )
+            return channel
+
+        if resume_from:
+            channel, started = start(), True
+        else:
+            channel, started = single_flight.run(task, start, budget, options)
+        self.channels[channel.run_id] = channel
+        self._evict()
+        return channel, not started
+
+    async def _run(self, channel, budget, options, resume_from, user, priority):
+        try:
+            await execute(channel, budget, options, resume_from, user=user, priority=priority)
+        finally:
+            self.tasks.pop(channel.run_id, None)
+            self._evict()
+
+    def _evict(self):
+        finished = [run_id for run_id, channel in self.channels.items() if channel.done]
+        for run_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.channels[run_id]
+
+    @property
+    def active(self):
+        return sum(1 for channel in self.channels.values() if not channel.done)
+
+    def cancel(self, run_id):
+        pool = get_worker_pool()
+        if pool is not None:
+            return pool.cancel(run_id)
+        task = self.tasks.get(run_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+
+registry = RunRegistry(int(os.getenv("API_MAX_FINISHED_RUNS", "1000")))
+
+
+def _with_overrides(cls, defaults, overrides, allowed=None):
+    """Build a dataclass from its env defaults and the fields given in a request"""
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{cls.__name__} overrides must be an object")
+    refused = sorted(set(overrides) - set(allowed)) if allowed is not None else []
+    if refused:
+        raise ValueError(f"{cls.__name__} fields that cannot be set per request: {', '.join(refused)}")
+    return cls(**{**asdict(defaults), **overrides})
+
+
+def _run_options(overrides):
+    """RunOptions of a request; coding agents run model-written code, so only the operator can turn them on"""
+    defaults = RunOptions.from_env()
+    options = _with_overrides(RunOptions, defaults, overrides, REQUEST_OPTIONS)
+    if options.coding_agents and not defaults.coding_agents:
+        raise ValueError("'coding_agents' is disabled on this server; the operator enables it with CODING_AGENTS=1")
+    return options
+
+
+def _error(message, status, headers=None):
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+async def submit_run(request):
+    """Submit a task: {"task": ..., "budget": {...}, "options": {...}, "resume_from": run_id, "priority": ...}"""
+    try:
+        body = await request.json()
+        task = body.get("task", "")
+        resume_from = body.get("resume_from")
+        if resume_from is not None and not isinstance(resume_from, str):
+            raise ValueError("'resume_from' must be a run id")
+        if not isinstance(task, str) or not (task.strip() or resume_from):
+            raise ValueError("'task' must be a non-empty string")
+        budget = _with_overrides(RunBudget, RunBudget.from_env(), body.get("budget", {}))
+        options = _run_options(body.get("options", {}))
+        priority = PRIORITIES.get(body.get("priority", "normal"))
+        if priority is None:
+            raise ValueError(f"'priority' must be one of {', '.join(PRIORITIES)}")
+    except (ValueError, TypeError, AttributeError) as e:
+        return _error(str(e), 400)
+    if resume_from:
+        # Run ids are hex, so this also keeps the id from naming a path outside RUNS_DIR
+        meta = read_meta(resume_from) if resume_from.isalnum() else None
+        if meta is None:
+            return _error(f"No checkpoint for run {resume_from}", 404)
+        if meta["status"] == "finished":
+            # A finished run is followed up with a new task
+            if not task.strip():
+                return _error(f"Run {resume_from} is finished; a follow-up needs a 'task'", 400)
+        elif not is_resumable(meta):
+            return _error(f"Run {resume_from} is {meta['status']} and cannot be resumed", 409)
+    user = request.headers.get("x-user-id") or request.client.host
+
+    admitted, reason = get_watchdog().admit()
+    if not admitted:
+        return _error(f"Server is low on memory: {reason}", 503, {"Retry-After": "60"})
+
+    try:
+        get_scheduler().check(user)
+    except QueueFull as e:
+        return _error(str(e), 429, {"Retry-After": "60"})
+
+    channel, coalesced = registry.submit(task, budget, options, resume_from, user, priority)
+    return JSONResponse({
+        "run_id": channel.run_id,
+        "coalesced": coalesced,
+        "events": f"/runs/{channel.run_id}/events",
+        "result": f"/runs/{channel.run_id}",
+    }, status_code=202)
+
+
+async def get_run(request):
+    """Current state of a run, with the final result once it is done"""
+    run_id = request.path_params["run_id"]
+    channel = registry.channels.get(run_id)
+    if channel is None:
+        # Runs from before a restart only have their summary on disk
+        summary = read_summary(run_id)
+        if summary is None:
+            return _error(f"Unknown run {run_id}", 404)
+        return JSONResponse({"run_id": run_id, "done": True, "outcome": summary["outcome"],
+                             "result": None, "summary": summary})
+    return JSONResponse({
+        "run_id": run_id,
+        "task": channel.task,
+        "done": channel.done,
+        "outcome": channel.outcome,
+        "result": channel.result,
+        "events": len(channel.events),
+        "summary": read_summary(run_id) if channel.done else None,
+    })
+
+
+async def cancel_run(request):
+    """Cancel a run that is still in progress"""
+    run_id = request.path_params["run_id"]
+    channel = registry.channels.get(run_id)
+    if channel is None:
+        return _error(f"Unknown run {run_id}", 404)
+    if channel.done or not registry.cancel(run_id):
+        return _error("Run already finished", 409)
+    return JSONResponse({"run_id": run_id, "cancelling": True}, status_code=202)
+
+
+async def _sse(channel, after):
+    yield "retry: 3000\n\n"
+    async for item in channel.subscribe(after, timeout=KEEPALIVE_SECONDS):
+        if item is None:
+            yield ": keep-alive\n\n"
+        else:
+            event_id, event, data = item
+            yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def run_events(request):
+    """Stream the run's events as SSE, replaying everything after Last-Event-ID.
+
+    The server waits for each chunk to be sent before taking the next one
+    from the run's log, so a slow client only holds back its own stream.
+    """
+    run_id = request.path_params["run_id"]
+    channel = registry.channels.get(run_id)
+    if channel is None:
+        return _error(f"Unknown run {run_id}", 404)
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id", "0")
+    try:
+        after = int(last_event_id)
+    except ValueError:
+        return _error("Last-Event-ID must be an integer", 400)
+    return StreamingResponse(_sse(channel, after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def run_image(request):
+    """JPEG thumbnail of a screenshot listed in a message event's images"""
+    thumbnail = image_refs.thumbnail(f"{request.path_params['run_id']}/{request.path_params['number']}")
+    if thumbnail is None:
+        return _error("Image not available", 404)
+    return Response(thumbnail, media_type="image/jpeg", headers={"Cache-Control": "max-age=3600"})
+
+
+async def run_transcript(request):
+    """The run's messages as gzip-compressed NDJSON (default) or Markdown (?format=markdown), streamed from disk"""
+    run_id = request.path_params["run_id"]
+    format = request.query_params.get("format", "ndjson")
+    if format not in FORMATS:
+        return _error(f"format must be one of {', '.join(FORMATS)}", 400)
+    if not run_id.isalnum() or not os.path.exists(transcript_path(run_id)):
+        return _error(f"No transcript for run {run_id}", 404)
+    # A sync generator: Starlette reads it on a worker thread, one chunk at a time
+    return StreamingResponse(export_transcript(run_id, format), media_type="application/gzip", headers={
+        "Content-Disposition": f'attachment; filename="{export_filename(run_id, format)}"',
+    })
+
+
+async def health(request):
+    watchdog = get_watchdog()
+    return JSONResponse({
+        "active_runs": registry.active,
+        "scheduler": get_scheduler().snapshot(),
+        "memory_state": watchdog.state,
+        "memory_mb": round(watchdog.total_rss / 2**20),
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    metrics.start_metrics_server()
+    setup_tracing()
+    pool = get_worker_pool()
+    if pool is None and RunOptions.from_env().coding_agents:
+        # Warm the code workers before the first run needs them
+        get_code_pool()
+    yield
+    if pool is not None:
+        pool.shutdown()
+    # Cancel what is still running so every run writes its summary and checkpoint
+    tasks = list(registry.tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+app = Starlette(routes=[
+    Route("/runs", submit_run, methods=["POST"]),
+    Route("/runs/{run_id}", get_run, methods=["GET"]),
+    Route("/runs/{run_id}", cancel_run, methods=["DELETE"]),
+    Route("/runs/{run_id}/events", run_events, methods=["GET"]),
+    Route("/runs/{run_id}/images/{number:int}", run_image, methods=["GET"]),
+    Route("/runs/{run_id}/transcript", run_transcript, methods=["GET"]),
+    Route("/healthz", health, methods=["GET"]),
+], lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8600")))
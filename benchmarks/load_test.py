@@ -0,0 +1,302 @@
+"""Ramp concurrent sessions against mock backends and report latency, throughput and resource use.
+
+Every session submits tasks one after another, like a user waiting for each
+answer, for --duration seconds per step. The model and the web are the local
+mocks of mock_backends.py, so only the app's own overhead (orchestration,
+Chromium, rendering) and the mocks' latencies are measured:
+
+    python benchmarks/load_test.py --sessions 1,2,4,8 --duration 60
+    python benchmarks/load_test.py --target api --sessions 4,8,16 --json results.json
+
+In-process mode runs each session on its own thread and event loop, the way
+streamlit_app.py runs each browser session's script. API mode starts
+api_server.py against the same mocks and follows each run's SSE stream.
+CPU and RSS are those of the app process and its browsers. With --max-p95 the
+ramp stops at the first step whose p95 latency exceeds it.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_backends import mock_env, serve  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPICS = ("solar panels", "sourdough bread", "electric bikes", "home networking", "rust programming", "tide pools")
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _task(session, number):
+    return f"[load s{session}-{number}-{os.getpid()}] Summarize what the web says about {TOPICS[number % len(TOPICS)]}."
+
+
+def _wait_for(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=2).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            time.sleep(0.2)
+
+
+class ResourceSampler:
+    """Samples host CPU and the CPU and RSS of a process and its children, excluding `exclude` pids"""
+
+    def __init__(self, pid, exclude=(), interval=0.5):
+        self.root = psutil.Process(pid)
+        self.exclude = set(exclude)
+        self.interval = interval
+        self._processes = {}
+        self._samples = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name="load-test-sampler", daemon=True).start()
+
+    def _tree(self):
+        try:
+            processes = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+        excluded = set(self.exclude)
+        for pid in self.exclude:
+            try:
+                excluded.update(child.pid for child in psutil.Process(pid).children(recursive=True))
+            except psutil.NoSuchProcess:
+                pass
+        # Reuse Process objects so cpu_percent() measures since the last sample
+        tree = []
+        for process in processes:
+            if process.pid not in excluded:
+                tree.append(self._processes.setdefault(process.pid, process))
+        return tree
+
+    def _loop(self):
+        psutil.cpu_percent(None)
+        while True:
+            time.sleep(self.interval)
+            app_cpu = rss = 0.0
+            for process in self._tree():
+                try:
+                    app_cpu += process.cpu_percent(None)
+                    rss += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    self._processes.pop(process.pid, None)
+            with self._lock:
+                self._samples.append((psutil.cpu_percent(None), app_cpu, rss))
+
+    def take(self):
+        """Return (mean host CPU %, mean app CPU %, peak app RSS) since the last call"""
+        with self._lock:
+            samples, self._samples = self._samples, []
+        if not samples:
+            return 0.0, 0.0, 0.0
+        return (statistics.mean(sample[0] for sample in samples),
+                statistics.mean(sample[1] for sample in samples),
+                max(sample[2] for sample in samples))
+
+
+def _inprocess_run(task, user, budget):
+    """One run the way the Streamlit app executes it: a fresh event loop on the session's thread"""
+    from pipeline import RunReporter
+    from run_channel import RunChannel, execute, follow
+    from runs import new_run_id
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        channel = RunChannel(new_run_id(), task)
+        loop.create_task(execute(channel, budget, user=user))
+        loop.run_until_complete(follow(channel, RunReporter()))
+        return channel.outcome
+    finally:
+        for pending in asyncio.all_tasks(loop):
+            pending.cancel()
+        loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+        loop.close()
+
+
+def _api_run(port, task, user, budget):
+    """Submit one run to api_server.py and follow its events until the result"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    try:
+        body = {"task": task, "budget": {"max_turns": budget.max_turns}} if budget else {"task": task}
+        connection.request("POST", "/runs", json.dumps(body), {"Content-Type": "application/json", "X-User-Id": user})
+        response = connection.getresponse()
+        submitted = json.loads(response.read())
+        if response.status in (429, 503):
+            return "rejected"
+        if response.status != 202:
+            return "error"
+        connection.request("GET", submitted["events"])
+        response = connection.getresponse()
+        event = None
+        for line in response:
+            line = line.decode().rstrip("\n")
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "result":
+                return json.loads(line[6:])["outcome"]
+        return "error"
+    finally:
+        connection.close()
+
+
+def run_step(sessions, duration, think, submit):
+    """Run `sessions` closed-loop sessions for `duration` seconds; return (latency, outcome) pairs"""
+    results = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def session(index):
+        number = 0
+        while time.monotonic() < stop_at:
+            number += 1
+            started = time.perf_counter()
+            try:
+                outcome = submit(_task(index, number), f"load-{index}")
+            except Exception as e:
+                print(f"  session {index}: {e}")
+                outcome = "error"
+            with lock:
+                results.append((time.perf_counter() - started, outcome))
+            time.sleep(think)
+
+    threads = [threading.Thread(target=session, args=(index,), daemon=True) for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(sessions, results, elapsed, resources):
+    completed = [latency for latency, outcome in results if outcome == "completed"]
+    host_cpu, app_cpu, peak_rss = resources
+    return {
+        "sessions": sessions,
+        "runs": len(results),
+        "completed": len(completed),
+        "error_rate": round(1 - len(completed) / len(results), 3) if results else 0.0,
+        "throughput_per_min": round(len(completed) / elapsed * 60, 2),
+        "p50": round(_percentile(completed, 0.50), 2) if completed else None,
+        "p95": round(_percentile(completed, 0.95), 2) if completed else None,
+        "p99": round(_percentile(completed, 0.99), 2) if completed else None,
+        "host_cpu_percent": round(host_cpu, 1),
+        "app_cpu_percent": round(app_cpu, 1),
+        "peak_rss_mb": round(peak_rss / 2**20),
+        "outcomes": {outcome: sum(1 for _, o in results if o == outcome) for outcome in {o for _, o in results}},
+    }
+
+
+def report(row):
+    def seconds(value):
+        return f"{value:6.1f}s" if value is not None else "     -"
+
+    print(f"{row['sessions']:>8} | {row['runs']:>5} | {row['error_rate']:6.1%} | {row['throughput_per_min']:7.2f}/min | "
+          f"p50 {seconds(row['p50'])} | p95 {seconds(row['p95'])} | p99 {seconds(row['p99'])} | "
+          f"host {row['host_cpu_percent']:5.1f}% | app {row['app_cpu_percent']:6.1f}% | {row['peak_rss_mb']:6d} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=("inprocess", "api"), default="inprocess")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma-separated concurrency steps")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per step")
+    parser.add_argument("--think", type=float, default=1.0, help="Seconds a session waits between tasks")
+    parser.add_argument("--steps", type=int, default=3, help="Surfer actions per task")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Mean seconds per mock model call")
+    parser.add_argument("--web-latency", type=float, default=0.05, help="Mean seconds per mock page")
+    parser.add_argument("--max-turns", type=int, default=None, help="Turn budget per run")
+    parser.add_argument("--max-p95", type=float, default=None, help="Stop ramping once p95 exceeds this many seconds")
+    parser.add_argument("--mock-port", type=int, default=8700)
+    parser.add_argument("--api-port", type=int, default=8601)
+    parser.add_argument("--json", help="Write the per-step results to this file")
+    args = parser.parse_args()
+
+    mocks = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(args.mock_port, args.steps, args.model_latency, args.web_latency), daemon=True
+    )
+    mocks.start()
+    _wait_for(f"http://127.0.0.1:{args.mock_port}/page/0")
+
+    # Keep the load test's runs, summaries and checkpoints out of the real ones
+    scratch = tempfile.mkdtemp(prefix="magentic-load-")
+    env = {
+        **mock_env(args.mock_port),
+        "RUNS_DIR": os.path.join(scratch, "runs"),
+        "DOWNLOADS_DIR": os.path.join(scratch, "downs"),
+        "SURFER_BROWSER_DATA_DIR": "",
+        "METRICS_PORT": "0",
+        "COALESCE_RUNS": "0",
+    }
+    os.environ.update(env)
+
+    from budgets import RunBudget
+
+    budget = RunBudget.from_env()
+    if args.max_turns is not None:
+        budget.max_turns = args.max_turns
+
+    server = None
+    if args.target == "api":
+        server_log = open(os.path.join(scratch, "api_server.log"), "w")
+        print(f"api_server.py output goes to {server_log.name}")
+        server = subprocess.Popen([sys.executable, "api_server.py"], cwd=ROOT, stdout=server_log, stderr=subprocess.STDOUT,
+                                  env={**os.environ, "API_PORT": str(args.api_port)})
+        _wait_for(f"http://127.0.0.1:{args.api_port}/healthz")
+        sampler = ResourceSampler(server.pid)
+
+        def submit(task, user):
+            return _api_run(args.api_port, task, user, budget)
+    else:
+        sampler = ResourceSampler(os.getpid(), exclude=[mocks.pid])
+
+        def submit(task, user):
+            return _inprocess_run(task, user, budget)
+
+    print(f"target {args.target}, {args.steps} surfer actions per task, mock model latency {args.model_latency}s")
+    print(f"{'sessions':>8} | {'runs':>5} | {'errors':>6} | {'throughput':>11} | {'latency':^35} | {'cpu':^25} | peak RSS")
+    rows = []
+    try:
+        for sessions in [int(value) for value in args.sessions.split(",")]:
+            sampler.take()
+            started = time.monotonic()
+            results = run_step(sessions, args.duration, args.think, submit)
+            row = summarize(sessions, results, time.monotonic() - started, sampler.take())
+            rows.append(row)
+            report(row)
+            if args.max_p95 is not None and (row["p95"] is None or row["p95"] > args.max_p95):
+                print(f"p95 above {args.max_p95}s at {sessions} sessions; stopping the ramp")
+                break
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(30)
+        mocks.terminate()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"target": args.target, "args": vars(args), "steps": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
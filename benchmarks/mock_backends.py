@@ -0,0 +1,150 @@
+"""Local stand-ins for Azure OpenAI and the web, for load tests without real traffic.
+
+The model endpoint answers the orchestrator's prompts and the surfer's tool
+calls with scripted replies: each task takes `--steps` surfer actions, each
+visiting a page of the mock web, before the orchestrator is told the request
+is satisfied. Tasks are told apart by a "[load <id>]" tag in their text.
+
+    python benchmarks/mock_backends.py --port 8700
+
+prints the environment that points the app at the mocks.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Route
+
+DEPLOYMENT = "gpt-4o"
+TASK_TAG = re.compile(r"\[load ([\w-]+)\]")
+
+
+def mock_env(port):
+    """Environment that points create_model_client() and create_surfer() at the mocks"""
+    base = f"http://127.0.0.1:{port}"
+    return {
+        "AZURE_OPENAI_ENDPOINT": base,
+        "AZURE_OPENAI_KEY": "mock",
+        "AZURE_OPENAI_DEPLOYMENT": DEPLOYMENT,
+        "AZURE_API_VERSION": "2024-10-21",
+        "SURFER_START_PAGE": f"{base}/page/0",
+    }
+
+
+def _text(messages):
+    """Text parts of a chat request; images are skipped, not decoded"""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+def _completion(content=None, tool_call=None, prompt_text=""):
+    message = {"role": "assistant", "content": content}
+    if tool_call is not None:
+        name, arguments = tool_call
+        message["tool_calls"] = [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)},
+        }]
+    completion_tokens = len(content or json.dumps(tool_call)) // 4
+    prompt_tokens = len(prompt_text) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": DEPLOYMENT,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _ledger(satisfied):
+    return json.dumps({
+        "is_request_satisfied": {"reason": "All pages were visited." if satisfied else "More pages to read.",
+                                 "answer": satisfied},
+        "is_in_loop": {"reason": "Each step visits a new page.", "answer": False},
+        "is_progress_being_made": {"reason": "A page was read.", "answer": True},
+        "next_speaker": {"reason": "Only the surfer can browse.", "answer": "MultimodalWebSurfer"},
+        "instruction_or_question": {"reason": "Continue reading.", "answer": "Open the next page and summarize it."},
+    })
+
+
+def create_app(steps=3, model_latency=0.5, web_latency=0.05, pages=50):
+    """Starlette app serving the mock model under /openai and the mock web under /page"""
+    ledger_calls = defaultdict(int)
+
+    async def delay(mean):
+        if mean > 0:
+            await asyncio.sleep(random.uniform(0.5 * mean, 1.5 * mean))
+
+    async def chat_completions(request):
+        body = await request.json()
+        prompt_text = _text(body.get("messages", []))
+        await delay(model_latency)
+        base = str(request.base_url).rstrip("/")
+        if body.get("tools"):
+            url = f"{base}/page/{random.randrange(pages)}"
+            return JSONResponse(_completion(tool_call=("visit_url", {"reasoning": "Read the next page.", "url": url}),
+                                            prompt_text=prompt_text))
+        if "is_request_satisfied" in prompt_text:
+            match = TASK_TAG.search(prompt_text)
+            key = match.group(1) if match else "untagged"
+            ledger_calls[key] += 1
+            satisfied = ledger_calls[key] > steps
+            if satisfied:
+                ledger_calls.pop(key, None)
+            return JSONResponse(_completion(_ledger(satisfied), prompt_text=prompt_text))
+        return JSONResponse(_completion("The pages describe the requested topic in some detail. " * 4,
+                                        prompt_text=prompt_text))
+
+    async def page(request):
+        number = request.path_params["number"]
+        await delay(web_latency)
+        links = "".join(f'<li><a href="/page/{(number + i) % pages}">Page {(number + i) % pages}</a></li>'
+                        for i in range(1, 6))
+        paragraphs = "".join(f"<p>Paragraph {i} of page {number}. " + "Lorem ipsum dolor sit amet. " * 20 + "</p>"
+                             for i in range(8))
+        return HTMLResponse(f"<html><head><title>Mock page {number}</title></head>"
+                            f"<body><h1>Mock page {number}</h1>{paragraphs}<ul>{links}</ul></body></html>")
+
+    return Starlette(routes=[
+        Route("/openai/deployments/{deployment}/chat/completions", chat_completions, methods=["POST"]),
+        Route("/page/{number:int}", page, methods=["GET"]),
+    ])
+
+
+def serve(port, steps=3, model_latency=0.5, web_latency=0.05):
+    """Run the mocks until the process is stopped"""
+    app = create_app(steps, model_latency, web_latency)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--steps", type=int, default=3, help="Surfer actions per task")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Mean seconds per model call")
+    parser.add_argument("--web-latency", type=float, default=0.05, help="Mean seconds per page")
+    args = parser.parse_args()
+    for name, value in mock_env(args.port).items():
+        print(f"{name}={value}")
+    serve(args.port, args.steps, args.model_latency, args.web_latency)
+
+
+if __name__ == "__main__":
+    main()
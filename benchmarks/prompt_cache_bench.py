@@ -0,0 +1,177 @@
+"""Compare latency, cached tokens and cost with and without a stable prompt prefix.
+
+Replays MagenticOne's real prompt sequence against the deployment configured
+in .env: the orchestrator's facts, plan and progress-ledger prompts and the
+surfer's tool-calling prompt, built from autogen's own templates and tool
+definitions, with the threads growing the way the team grows them. The
+surfer's scroll tools come and go with the page position, as they do in a
+browser:
+
+    python benchmarks/prompt_cache_bench.py --steps 8
+
+The surfer's page prompt is sent as text (the text-only surfer's variant)
+since there is no browser; screenshots sit after the cached prefix anyway.
+Prices are USD per million tokens and default to Azure OpenAI gpt-4o rates.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_agentchat.teams._group_chat._magentic_one._prompts import (  # noqa: E402
+    ORCHESTRATOR_PROGRESS_LEDGER_PROMPT,
+    ORCHESTRATOR_TASK_LEDGER_FACTS_PROMPT,
+    ORCHESTRATOR_TASK_LEDGER_FULL_PROMPT,
+    ORCHESTRATOR_TASK_LEDGER_PLAN_PROMPT,
+)
+from autogen_core.models import AssistantMessage, UserMessage  # noqa: E402
+from autogen_ext.agents.web_surfer._prompts import WEB_SURFER_TOOL_PROMPT_TEXT  # noqa: E402
+from autogen_ext.agents.web_surfer._tool_definitions import (  # noqa: E402
+    TOOL_CLICK,
+    TOOL_HISTORY_BACK,
+    TOOL_HOVER,
+    TOOL_READ_PAGE_AND_ANSWER,
+    TOOL_SCROLL_DOWN,
+    TOOL_SCROLL_UP,
+    TOOL_SLEEP,
+    TOOL_SUMMARIZE_PAGE,
+    TOOL_TYPE,
+    TOOL_VISIT_URL,
+    TOOL_WEB_SEARCH,
+)
+from dotenv import load_dotenv  # noqa: E402
+
+from model_client import create_model_client  # noqa: E402
+
+ORCHESTRATOR = "MagenticOneOrchestrator"
+SURFER = "MultimodalWebSurfer"
+TEAM = f"{SURFER}: A web surfing assistant that can browse and interact with web pages."
+TASK = "Compare the three most reviewed electric bikes under $1500 and summarize their range and weight."
+# MultimodalWebSurfer.default_tools, in its order
+DEFAULT_TOOLS = [TOOL_VISIT_URL, TOOL_WEB_SEARCH, TOOL_HISTORY_BACK, TOOL_CLICK, TOOL_TYPE,
+                 TOOL_READ_PAGE_AND_ANSWER, TOOL_SUMMARIZE_PAGE, TOOL_SLEEP, TOOL_HOVER]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _surfer_tools(step, nonce):
+    # Tools go before the messages, so the nonce keeps one mode's calls from warming the other's
+    first = dict(DEFAULT_TOOLS[0], description=f"{DEFAULT_TOOLS[0]['description']} [{nonce}]")
+    tools = [first, *DEFAULT_TOOLS[1:]]
+    # Scrolled down the page: the surfer offers scroll_up; not at the bottom: scroll_down
+    if step % 2:
+        tools.append(TOOL_SCROLL_UP)
+    if step % 3:
+        tools.append(TOOL_SCROLL_DOWN)
+    return tools
+
+
+def _page_prompt(step, tools):
+    targets = "\n".join(f'{{"id": {step * 10 + i}, "name": "Result {i} for electric bikes", "role": "link", '
+                        f'"tools": ["click", "hover"]}}' for i in range(12))
+    return WEB_SURFER_TOOL_PROMPT_TEXT.format(
+        state_description=f"web browser is open to the page [Results page {step}](https://example.com/search?page={step}).",
+        visible_targets=targets + "\n\n", other_targets_str="", focused_hint="",
+        tool_names="\n".join(tool["name"] for tool in tools),
+        title=f"Results page {step}", url=f"https://example.com/search?page={step}",
+    ).strip()
+
+
+def _instruction(content):
+    try:
+        return json.loads(content)["instruction_or_question"]["answer"]
+    except (ValueError, KeyError, TypeError):
+        return str(content)
+
+
+async def run_mode(stable_prefix, steps, nonce):
+    client = create_model_client(stable_prefix=stable_prefix)
+    task = f"{TASK} ({nonce})"
+    latencies = []
+    completion_tokens = 0
+
+    async def create(messages, **kwargs):
+        nonlocal completion_tokens
+        started = time.perf_counter()
+        result = await client.create(messages, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        completion_tokens += result.usage.completion_tokens
+        return result.content
+
+    # Task ledger, as in MagenticOneOrchestrator.handle_start
+    planning = [UserMessage(content=ORCHESTRATOR_TASK_LEDGER_FACTS_PROMPT.format(task=task), source=ORCHESTRATOR)]
+    facts = await create(planning)
+    planning += [AssistantMessage(content=facts, source=ORCHESTRATOR),
+                 UserMessage(content=ORCHESTRATOR_TASK_LEDGER_PLAN_PROMPT.format(team=TEAM), source=ORCHESTRATOR)]
+    plan = await create(planning)
+    ledger = ORCHESTRATOR_TASK_LEDGER_FULL_PROMPT.format(task=task, team=TEAM, facts=facts, plan=plan)
+    # The orchestrator's thread and the surfer's chat history, which only grow at the end
+    thread = [AssistantMessage(content=ledger, source=ORCHESTRATOR)]
+    surfer_history = [UserMessage(content=ledger, source=ORCHESTRATOR)]
+
+    for step in range(steps):
+        progress = ORCHESTRATOR_PROGRESS_LEDGER_PROMPT.format(task=task, team=TEAM, names=SURFER)
+        content = await create([*thread, UserMessage(content=progress, source=ORCHESTRATOR)], json_output=True)
+        instruction = _instruction(content)
+        thread.append(AssistantMessage(content=instruction, source=ORCHESTRATOR))
+        surfer_history.append(UserMessage(content=instruction, source=ORCHESTRATOR))
+
+        # As in MultimodalWebSurfer._generate_reply: history, page state, then the request
+        tools = _surfer_tools(step, nonce)
+        page = UserMessage(content=re.sub(r"(\n\s*){3,}", "\n\n", _page_prompt(step, tools)), source=SURFER)
+        reply = await create([*surfer_history[:-1], page, surfer_history[-1]], tools=tools,
+                             extra_create_args={"tool_choice": "auto"})
+        action = reply if isinstance(reply, str) else "I " + ", ".join(
+            f"called {call.name}({call.arguments})" for call in reply)
+        action = f"{action}\n\nThe web browser is open to the page [Results page {step + 1}]."
+        surfer_history.append(AssistantMessage(content=action, source=SURFER))
+        thread.append(UserMessage(content=action, source=SURFER))
+
+    await client.close()
+    stats = client.cache_stats
+    return {
+        "latencies": latencies,
+        "prompt_tokens": stats.prompt_tokens,
+        "cached_tokens": stats.cached_tokens,
+        "completion_tokens": completion_tokens,
+    }
+
+
+def report(name, result, args):
+    uncached = result["prompt_tokens"] - result["cached_tokens"]
+    cost = (uncached * args.input_price + result["cached_tokens"] * args.cached_price
+            + result["completion_tokens"] * args.output_price) / 1_000_000
+    ratio = result["cached_tokens"] / result["prompt_tokens"] if result["prompt_tokens"] else 0.0
+    latencies = result["latencies"]
+    print(f"{name:>14} | p50 {statistics.median(latencies):6.2f}s | p95 {_percentile(latencies, 0.95):6.2f}s | "
+          f"prompt {result['prompt_tokens']:7d} | cached {result['cached_tokens']:7d} ({ratio:5.1%}) | ${cost:.4f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=8, help="orchestrator + surfer rounds after planning")
+    parser.add_argument("--input-price", type=float, default=2.50)
+    parser.add_argument("--cached-price", type=float, default=1.25)
+    parser.add_argument("--output-price", type=float, default=10.00)
+    args = parser.parse_args()
+
+    load_dotenv()
+    # A fresh nonce per mode keeps one mode from warming the cache for the other
+    baseline = await run_mode(False, args.steps, uuid.uuid4().hex)
+    stable = await run_mode(True, args.steps, uuid.uuid4().hex)
+    report("baseline", baseline, args)
+    report("stable prefix", stable, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,306 @@
+"""Measure what each UI rendering and logging path costs per streamed message.
+
+Synthetic message streams are fed through the real code of every path,
+with no model, browser or Streamlit server:
+
+    python benchmarks/render_bench.py
+    python benchmarks/render_bench.py --streams images --paths current,transcript --scale 0.5 --json results.json
+
+Paths:
+
+  old         streamlit_app_old.py: StreamlitConsole re-writes the last 5
+              outputs into its container on every message
+  new         streamlit_app_new.py: str() of the message, HTML of the last
+              2000 characters into a placeholder
+  current     streamlit_app.py: view_message, the LiveRun reporter and one
+              render of the monitor fragment every --refresh messages (the
+              app renders it at most once a second)
+  transcript  pipeline.py's TranscriptWriter, one NDJSON line per message
+  events      the API's SSE "message" event of every message
+
+Streams are "text" (long agent replies), "images" (a screenshot with every
+message) and "long" (a long run of short tool calls and results).
+
+For each message the report gives the CPU time of the calling thread, the
+peak of memory allocated while handling it, and the bytes of the Streamlit
+messages sent to the browser (serialized ForwardMsg protobufs, before the
+websocket's own framing). Memory is measured in a second pass under
+tracemalloc so it does not slow the timed one. The legacy apps' team, model
+client and surfer are replaced by stand-ins that replay the stream.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+# Keep the apps' import-time servers and run artifacts out of the way
+os.environ["METRICS_PORT"] = "0"
+os.environ["TRACING_EXPORTER"] = "none"
+os.environ["RUNS_DIR"] = tempfile.mkdtemp(prefix="render-bench-")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit as st  # noqa: E402
+from autogen_agentchat.messages import (  # noqa: E402
+    MultiModalMessage,
+    TextMessage,
+    ToolCallExecutionEvent,
+    ToolCallRequestEvent,
+)
+from autogen_core import FunctionCall, Image  # noqa: E402
+from autogen_core.models import FunctionExecutionResult  # noqa: E402
+from PIL import Image as PILImage  # noqa: E402
+from streamlit.runtime.fragment import MemoryFragmentStorage  # noqa: E402
+from streamlit.runtime.memory_uploaded_file_manager import MemoryUploadedFileManager  # noqa: E402
+from streamlit.runtime.pages_manager import PagesManager  # noqa: E402
+from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext, add_script_run_ctx  # noqa: E402
+from streamlit.runtime.state import SafeSessionState, SessionState  # noqa: E402
+
+PATHS = ("old", "new", "current", "transcript", "events")
+STREAMS = ("text", "images", "long")
+SOURCES = ("MagenticOneOrchestrator", "MultimodalWebSurfer")
+WORDS = ("the", "page", "shows", "results", "for", "solar", "panel", "efficiency", "with", "a", "table", "of",
+         "prices", "and", "links", "to", "reviews", "from", "2024", "next", "I", "will", "click", "compare")
+
+
+class Frontend:
+    """A ScriptRunContext for the benchmark thread that counts what Streamlit would send to the browser"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.ctx = ScriptRunContext(
+            session_id="render-bench", _enqueue=self._enqueue, query_string="",
+            session_state=SafeSessionState(SessionState(), lambda: None),
+            uploaded_file_mgr=MemoryUploadedFileManager("/upload"), main_script_path="",
+            user_info={"email": "bench@example.com"}, fragment_storage=MemoryFragmentStorage(),
+            pages_manager=PagesManager(""),
+        )
+        add_script_run_ctx(threading.current_thread(), self.ctx)
+
+    def _enqueue(self, message):
+        self.messages += 1
+        self.bytes += message.ByteSize()
+
+
+def _sentence(index, words):
+    return " ".join(WORDS[(index * 7 + i) % len(WORDS)] for i in range(words)).capitalize() + "."
+
+
+def make_stream(kind, scale):
+    """The messages of one synthetic run"""
+    if kind == "text":
+        return [TextMessage(source=SOURCES[i % 2], content=" ".join(_sentence(i + j, 20) for j in range(30)))
+                for i in range(max(1, int(200 * scale)))]
+    if kind == "images":
+        # One shared 1440x900 screenshot; every path sees a new message around it
+        screenshot = Image.from_pil(PILImage.effect_noise((1440, 900), 64).convert("RGB"))
+        return [MultiModalMessage(source="MultimodalWebSurfer", content=[_sentence(i, 60), screenshot])
+                for i in range(max(1, int(100 * scale)))]
+    messages = []
+    for i in range(max(1, int(2000 * scale)) // 3):
+        call = FunctionCall(id=f"call_{i}", name="click", arguments=json.dumps({"target_id": i, "reasoning": _sentence(i, 12)}))
+        messages += [
+            ToolCallRequestEvent(source="MultimodalWebSurfer", content=[call]),
+            ToolCallExecutionEvent(source="MultimodalWebSurfer", content=[
+                FunctionExecutionResult(call_id=call.id, name=call.name, content=_sentence(i, 40), is_error=False)]),
+            TextMessage(source=SOURCES[i % 2], content=_sentence(i, 15)),
+        ]
+    return messages
+
+
+class Meter:
+    """Attributes the cost of handling each message to it, from inside the stream the path consumes"""
+
+    def __init__(self, frontend, trace_memory):
+        self.frontend = frontend
+        self.trace_memory = trace_memory
+        self.cpu = []
+        self.peak = []
+        self.sent = []
+
+    def _mark(self):
+        self._cpu = time.thread_time()
+        self._sent = self.frontend.bytes
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._memory = tracemalloc.get_traced_memory()[0]
+
+    def _record(self):
+        self.cpu.append(time.thread_time() - self._cpu)
+        self.sent.append(self.frontend.bytes - self._sent)
+        if self.trace_memory:
+            self.peak.append(tracemalloc.get_traced_memory()[1] - self._memory)
+
+    async def stream(self, messages):
+        for message in messages:
+            self._mark()
+            yield message
+            # Resumed once the path has handled the message
+            self._record()
+
+
+class ScriptedTeam:
+    """Stand-in for MagenticOneGroupChat that replays the benchmark's stream"""
+
+    stream = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def run_stream(self, task):
+        return ScriptedTeam.stream
+
+
+class Idle:
+    """Stand-in for the legacy apps' model client and surfer"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+
+@contextlib.contextmanager
+def replaying(module, stream):
+    names = ("AzureOpenAIChatCompletionClient", "MultimodalWebSurfer", "MagenticOneGroupChat")
+    saved = {name: getattr(module, name) for name in names}
+    module.AzureOpenAIChatCompletionClient = module.MultimodalWebSurfer = Idle
+    module.MagenticOneGroupChat = ScriptedTeam
+    ScriptedTeam.stream = stream
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+async def run_old(stream, args):
+    import streamlit_app_old
+
+    with replaying(streamlit_app_old, stream):
+        await streamlit_app_old.process_with_magnetic_one("benchmark", st.container(height=400), st.container())
+
+
+async def run_new(stream, args):
+    import streamlit_app_new
+
+    with replaying(streamlit_app_new, stream):
+        await streamlit_app_new.process_with_magnetic_one("benchmark", st.empty(), st.empty())
+
+
+async def run_current(stream, args):
+    import streamlit_app
+    from messages import view_message
+
+    live = st.session_state.live_run = streamlit_app.LiveRun()
+    reporter = streamlit_app.StreamlitReporter(live)
+    run_id = uuid.uuid4().hex
+    count = 0
+    async for message in stream:
+        reporter.message(view_message(message, run_id))
+        count += 1
+        if count % args.refresh == 0:
+            streamlit_app.render_monitor()
+    st.session_state.live_run = None
+
+
+async def run_transcript(stream, args):
+    from messages import view_message
+    from runs import new_run_id
+    from transcripts import TranscriptWriter
+
+    run_id = new_run_id()
+    transcript = TranscriptWriter(run_id)
+    try:
+        async for message in stream:
+            transcript.write(message, view_message(message, run_id))
+    finally:
+        transcript.close()
+
+
+async def run_events(stream, args):
+    from messages import view_message
+
+    run_id = uuid.uuid4().hex
+    async for message in stream:
+        # What RunChannel publishes and api_server.py writes to each subscriber
+        data = json.dumps(view_message(message, run_id).to_event(), default=str)
+        f"id: 0\nevent: message\ndata: {data}\n\n".encode("utf-8")
+
+
+RUNNERS = {"old": run_old, "new": run_new, "current": run_current, "transcript": run_transcript, "events": run_events}
+
+
+def measure(path, messages, frontend, args):
+    """Per-message CPU seconds, sent bytes and (second pass) peak allocated bytes"""
+    timed = Meter(frontend, trace_memory=False)
+    asyncio.run(RUNNERS[path](timed.stream(messages), args))
+    traced = Meter(frontend, trace_memory=True)
+    tracemalloc.start()
+    try:
+        asyncio.run(RUNNERS[path](traced.stream(messages), args))
+    finally:
+        tracemalloc.stop()
+    return {"messages": len(timed.cpu), "cpu": timed.cpu, "sent": timed.sent, "peak": traced.peak}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(result):
+    cpu, sent, peak = result["cpu"], result["sent"], result["peak"]
+    return {
+        "messages": result["messages"],
+        "cpu_us_mean": statistics.fmean(cpu) * 1e6,
+        "cpu_us_p95": _percentile(cpu, 0.95) * 1e6,
+        "peak_alloc_kb_mean": statistics.fmean(peak) / 1024,
+        "sent_kb_per_message": statistics.fmean(sent) / 1024,
+        "sent_kb_last": sent[-1] / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", default=",".join(PATHS))
+    parser.add_argument("--streams", default=",".join(STREAMS))
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the number of messages per stream")
+    parser.add_argument("--refresh", type=int, default=1, help="messages per monitor render on the current path")
+    parser.add_argument("--json", help="also write the summaries to this file")
+    args = parser.parse_args()
+
+    frontend = Frontend()
+    # Import the apps up front so their page setup is not counted against a path
+    with contextlib.redirect_stdout(sys.stderr):
+        import streamlit_app  # noqa: F401
+        import streamlit_app_new  # noqa: F401
+        import streamlit_app_old  # noqa: F401
+
+    results = {}
+    print(f"{'stream':>7} {'path':>10} | {'msgs':>5} | {'cpu µs/msg':>10} {'p95':>8} | "
+          f"{'peak alloc KB':>13} | {'sent KB/msg':>11} {'last':>8}")
+    for kind in args.streams.split(","):
+        messages = make_stream(kind, args.scale)
+        for path in args.paths.split(","):
+            summary = results.setdefault(kind, {})[path] = summarize(measure(path, messages, frontend, args))
+            print(f"{kind:>7} {path:>10} | {summary['messages']:5d} | {summary['cpu_us_mean']:10.1f} "
+                  f"{summary['cpu_us_p95']:8.1f} | {summary['peak_alloc_kb_mean']:13.1f} | "
+                  f"{summary['sent_kb_per_message']:11.2f} {summary['sent_kb_last']:8.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import atexit
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+import psutil
+from prometheus_client import Counter, Gauge
+
+from web_surfer import add_launch_hook, browser_processes
+
+LEAKED_PROCESSES = Counter("magentic_browser_processes_leaked",
+                           "Browser processes still alive after their run's grace period, then killed", ["process"])
+LEAKY_RUNS = Counter("magentic_runs_leaking_browsers", "Runs that left browser processes behind")
+TRACKED_PROCESSES = Gauge("magentic_browser_processes_tracked", "Browser processes accounted to runs")
+
+
+@dataclass
+class _Run:
+    surfer: object
+    processes: dict = field(default_factory=dict)
+    released_at: float = None
+
+
+def _alive(process):
+    try:
+        return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+    except psutil.Error:
+        return False
+
+
+def _kill(processes):
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.Error:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=3)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.Error:
+            pass
+    psutil.wait_procs(alive, timeout=3)
+
+
+class BrowserReaper:
+    """Accounts every browser process tree a run's surfer starts and kills what outlives the run.
+
+    The Playwright driver and Chromium processes are recorded at each launch
+    and re-read while the run is active, since renderers start later and
+    Chromium is reparented once its driver dies. `grace` seconds after a run
+    releases its browser, any of them still alive are counted as leaked and
+    killed.
+    """
+
+    def __init__(self, grace=10.0, interval=5.0):
+        self.grace = grace
+        self.interval = interval
+        self._runs = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name="browser-reaper", daemon=True).start()
+
+    def track(self, surfer, run_id):
+        """Account the processes of every browser the surfer launches to run_id"""
+        with self._lock:
+            run = self._runs[run_id] = _Run(surfer)
+        add_launch_hook(surfer, lambda surfer: self._remember(run))
+
+    def _remember(self, run):
+        processes = browser_processes(run.surfer)
+        with self._lock:
+            for process in processes:
+                run.processes.setdefault(process.pid, process)
+            TRACKED_PROCESSES.set(sum(len(run.processes) for run in self._runs.values()))
+
+    def release(self, run_id):
+        """The run has closed its browser; start its grace period"""
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is None:
+            return
+        self._remember(run)
+        run.released_at = time.monotonic()
+
+    def _collect(self, run_id, run):
+        """Kill a released run's leftovers and stop tracking it"""
+        leftovers = [process for process in run.processes.values() if _alive(process)]
+        if leftovers:
+            LEAKY_RUNS.inc()
+            roots = set(getattr(run.surfer, "_browser_pids", []))
+            for process in leftovers:
+                LEAKED_PROCESSES.labels("driver" if process.pid in roots else "chromium").inc()
+            print(f"Run {run_id} left {len(leftovers)} browser processes running; killing them")
+            _kill(leftovers)
+        with self._lock:
+            self._runs.pop(run_id, None)
+            TRACKED_PROCESSES.set(sum(len(run.processes) for run in self._runs.values()))
+        return len(leftovers)
+
+    def reap(self, wait=True):
+        """Collect released runs now, waiting out their grace periods if `wait`; returns processes killed"""
+        with self._lock:
+            released = [(run_id, run) for run_id, run in self._runs.items() if run.released_at is not None]
+        if wait and released:
+            remaining = max(run.released_at for _, run in released) + self.grace - time.monotonic()
+            deadline = time.monotonic() + max(0.0, remaining)
+            while time.monotonic() < deadline and any(
+                _alive(process) for _, run in released for process in run.processes.values()
+            ):
+                time.sleep(0.2)
+        return sum(self._collect(run_id, run) for run_id, run in released)
+
+    def shutdown(self):
+        """Kill the browsers of every tracked run, e.g. at interpreter exit"""
+        with self._lock:
+            runs = list(self._runs.items())
+        for run_id, run in runs:
+            self._remember(run)
+            run.released_at = run.released_at or time.monotonic()
+        self.reap(wait=False)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self._lock:
+                    runs = list(self._runs.items())
+                now = time.monotonic()
+                for run_id, run in runs:
+                    if run.released_at is None:
+                        self._remember(run)
+                    elif now - run.released_at >= self.grace:
+                        self._collect(run_id, run)
+            except Exception as e:
+                print(f"Browser reaper failed: {e}")
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def get_reaper():
+    """Return the process-wide reaper, starting its thread on first use"""
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = BrowserReaper(
+                grace=float(os.getenv("BROWSER_REAP_GRACE_SECONDS", "10")),
+                interval=float(os.getenv("BROWSER_REAP_INTERVAL_SECONDS", "5")),
+            )
+            atexit.register(_reaper.shutdown)
+        return _reaper
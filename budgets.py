@@ -0,0 +1,137 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from autogen_agentchat.base import TerminationCondition
+from autogen_agentchat.messages import MultiModalMessage, StopMessage, TextMessage
+
+
+def _env_int(name, default=None):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+@dataclass
+class RunBudget:
+    """Per-request limits for a MagenticOne run (None means unlimited)"""
+
+    max_turns: int = 20
+    max_stalls: int = 3
+    max_navigations: Optional[int] = None
+    max_download_bytes: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    @classmethod
+    def from_env(cls):
+        """Read budget defaults from RUN_MAX_* environment variables"""
+        return cls(
+            max_turns=_env_int("RUN_MAX_TURNS", 20),
+            max_stalls=_env_int("RUN_MAX_STALLS", 3),
+            max_navigations=_env_int("RUN_MAX_NAVIGATIONS"),
+            max_download_bytes=_env_int("RUN_MAX_DOWNLOAD_BYTES"),
+            max_tokens=_env_int("RUN_MAX_TOKENS"),
+        )
+
+
+class BudgetTermination(TerminationCondition):
+    """Stop the team as soon as a navigation, byte or token budget is used up.
+
+    Turn and stall limits are enforced by MagenticOneGroupChat itself through
+    its max_turns/max_stalls arguments.
+    """
+
+    def __init__(self, budget, model_client=None, browser_usage=None):
+        self._budget = budget
+        self._model_client = model_client
+        self._browser_usage = browser_usage
+        self._terminated = False
+        self._baseline = (0, 0, 0)
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    def _totals(self):
+        tokens = 0
+        if self._model_client is not None:
+            usage = self._model_client.total_usage()
+            tokens = usage.prompt_tokens + usage.completion_tokens
+        browser = self._browser_usage
+        if browser is None:
+            return tokens, 0, 0
+        return tokens, browser.navigations, browser.bytes_downloaded
+
+    def start_run(self, budget=None):
+        """Count usage from now on, for the next run of a team that is kept alive"""
+        if budget is not None:
+            self._budget = budget
+        self._baseline = self._totals()
+
+    def tokens_used(self):
+        return self._totals()[0] - self._baseline[0]
+
+    def exhausted(self):
+        """Return a description of the first exhausted budget, or None"""
+        budget = self._budget
+        tokens, navigations, bytes_downloaded = (
+            total - base for total, base in zip(self._totals(), self._baseline)
+        )
+        if budget.max_tokens is not None and tokens >= budget.max_tokens:
+            return f"token budget of {budget.max_tokens} used up"
+        if self._browser_usage is not None:
+            if budget.max_navigations is not None and navigations >= budget.max_navigations:
+                return f"navigation budget of {budget.max_navigations} pages used up"
+            if budget.max_download_bytes is not None and bytes_downloaded >= budget.max_download_bytes:
+                return f"download budget of {budget.max_download_bytes} bytes used up"
+        return None
+
+    async def __call__(self, messages: Sequence) -> StopMessage | None:
+        if self._terminated:
+            raise RuntimeError("Termination condition has already been reached")
+        reason = self.exhausted()
+        if reason is None:
+            return None
+        self._terminated = True
+        return StopMessage(content=f"Budget exhausted: {reason}", source="BudgetTermination")
+
+    async def reset(self) -> None:
+        self._terminated = False
+
+
+# The orchestrator's name in MagenticOneGroupChat; its messages are the team's instructions and answers
+ORCHESTRATOR = "MagenticOneOrchestrator"
+# How MultimodalWebSurfer reports a failed step: a traceback, never an answer
+SURFER_ERROR_PREFIX = "Web surfing error"
+
+
+def _message_text(message):
+    if isinstance(message, TextMessage):
+        return message.content
+    if isinstance(message, MultiModalMessage):
+        return "\n".join(part for part in message.content if isinstance(part, str))
+    return None
+
+
+def best_effort_answer(messages, stop_reason=None):
+    """Build an answer from the last substantive message of a stopped run.
+
+    The orchestrator's last instruction or answer is preferred, then the last
+    message of another agent; surfer error reports are skipped.
+    """
+    fallback = None
+    for message in reversed(messages):
+        if message.source == "user" or isinstance(message, StopMessage):
+            continue
+        text = _message_text(message)
+        if not text or not text.strip() or text.startswith(SURFER_ERROR_PREFIX):
+            continue
+        if message.source == ORCHESTRATOR:
+            fallback = text
+            break
+        if fallback is None:
+            fallback = text
+    if fallback is not None:
+        return f"⚠️ Stopped early ({stop_reason}). Best-effort answer:\n\n{fallback}"
+    return f"⚠️ Stopped early ({stop_reason}) before any answer was produced."
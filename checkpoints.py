@@ -0,0 +1,226 @@
+import asyncio
+import json
+import os
+import time
+
+import psutil
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.teams import MagenticOneGroupChat
+from autogen_agentchat.teams._group_chat._events import GroupChatAgentResponse, GroupChatMessage, GroupChatStart
+from autogen_agentchat.teams._group_chat._magentic_one._magentic_one_orchestrator import MagenticOneOrchestrator
+from autogen_core import DefaultTopicId, MessageContext, rpc
+
+from runs import RUNS_DIR, run_dir
+
+CHECKPOINT_FILE = "checkpoint.json"
+META_FILE = "checkpoint_meta.json"
+IMAGE_PLACEHOLDER = "[screenshot omitted from checkpoint]"
+
+
+def _strip_images(value):
+    """Replace serialized images ({"data": base64}) with a short placeholder"""
+    if isinstance(value, dict):
+        if set(value) == {"data"} and isinstance(value["data"], str):
+            return IMAGE_PLACEHOLDER
+        return {key: _strip_images(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_strip_images(item) for item in value]
+    return value
+
+
+def _write_json(path, data):
+    """Write through a temporary file so a crash never leaves half a checkpoint"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_meta(run_id):
+    """Return the run's checkpoint meta (task, status, turns, url), or None"""
+    return _read_json(os.path.join(RUNS_DIR, run_id, META_FILE))
+
+
+def load_checkpoint(run_id):
+    """Return the run's last checkpoint (meta fields plus "state"), or None"""
+    meta = read_meta(run_id)
+    state = _read_json(os.path.join(RUNS_DIR, run_id, CHECKPOINT_FILE))
+    if meta is None or state is None:
+        return None
+    return {**meta, "state": state}
+
+
+def is_resumable(meta):
+    """Unfinished runs whose owning process is gone, or that stopped early"""
+    if meta["status"] == "running":
+        return not psutil.pid_exists(meta["pid"])
+    return meta["status"] in ("stopped", "failed")
+
+
+def list_checkpoints():
+    """Meta of every checkpointed run, newest first"""
+    if not os.path.isdir(RUNS_DIR):
+        return []
+    checkpoints = []
+    for run_id in os.listdir(RUNS_DIR):
+        meta = read_meta(run_id)
+        if meta is not None:
+            checkpoints.append(meta)
+    return sorted(checkpoints, key=lambda meta: meta["saved_at"], reverse=True)
+
+
+def mark_resumed(run_id, by_run_id):
+    """Hide a checkpoint from the resume list once another run has taken it over"""
+    meta = read_meta(run_id)
+    if meta is not None:
+        meta.update(status="resumed", resumed_by=by_run_id)
+        _write_json(os.path.join(RUNS_DIR, run_id, META_FILE), meta)
+
+
+class RunCheckpointer:
+    """Saves a run's team state and surfer URL under runs/<run_id>/.
+
+    The orchestrator calls save() at every turn boundary, so a checkpoint
+    never holds half a turn.
+    """
+
+    def __init__(self, run_id, task, surfer, parent=None):
+        self.run_id = run_id
+        self.task = task
+        self.surfer = surfer
+        self.parent = parent
+        self.team = None
+        self.mode = None
+        self.turns = 0
+
+    def current_url(self):
+        page = getattr(self.surfer, "_page", None)
+        return page.url if page is not None else None
+
+    async def save(self, status="running"):
+        state = _strip_images(await self.team.save_state())
+        meta = {
+            "run_id": self.run_id,
+            "task": self.task,
+            "status": status,
+            "turns": self.turns,
+            "url": self.current_url(),
+            "parent": self.parent,
+            "pid": os.getpid(),
+            "saved_at": time.time(),
+        }
+        directory = run_dir(self.run_id)
+        await asyncio.to_thread(_write_json, os.path.join(directory, CHECKPOINT_FILE), state)
+        await asyncio.to_thread(_write_json, os.path.join(directory, META_FILE), meta)
+
+    async def restore(self, checkpoint, follow_up=False):
+        """Load a checkpoint into the (not yet started) team and surfer.
+
+        With follow_up the next task builds on the finished run's thread;
+        otherwise the run continues where the checkpoint left off.
+        """
+        await self.team.load_state(checkpoint["state"])
+        if checkpoint.get("url"):
+            self.surfer.start_page = checkpoint["url"]
+        self.turns = checkpoint.get("turns", 0)
+        self.mode = "follow_up" if follow_up else "resume"
+
+
+class CheckpointingOrchestrator(MagenticOneOrchestrator):
+    """MagenticOne orchestrator that checkpoints each turn and can pick up a restored run"""
+
+    def __init__(self, *args, checkpointer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checkpointer = checkpointer
+
+    @rpc
+    async def handle_start(self, message: GroupChatStart, ctx: MessageContext) -> None:  # type: ignore
+        mode, self._checkpointer.mode = self._checkpointer.mode, None
+        if mode is None or not self._plan:
+            await super().handle_start(message, ctx)
+            return
+        assert message is not None and message.messages is not None
+
+        await self.validate_group_state(message.messages)
+        await self.publish_message(message, topic_id=DefaultTopicId(type=self._output_topic_type))
+        for msg in message.messages:
+            await self._output_message_queue.put(msg)
+
+        if mode == "follow_up":
+            # Keep the earlier thread as context and update the ledger for the new task
+            self._task = " ".join([msg.to_model_text() for msg in message.messages])
+            await self._update_task_ledger(ctx.cancellation_token)
+            self._n_rounds = 0
+            self._n_stalls = 0
+            ledger_message = TextMessage(
+                content=self._get_task_ledger_full_prompt(self._task, self._team_description, self._facts, self._plan),
+                source=self._name,
+            )
+            await self.update_message_thread([ledger_message])
+            await self.publish_message(
+                GroupChatMessage(message=ledger_message), topic_id=DefaultTopicId(type=self._output_topic_type)
+            )
+            await self._output_message_queue.put(ledger_message)
+            await self.publish_message(
+                GroupChatAgentResponse(response=Response(chat_message=ledger_message), name=self._name),
+                topic_id=DefaultTopicId(type=self._group_topic_type),
+            )
+
+        await self._orchestrate_step(ctx.cancellation_token)
+
+    async def _orchestrate_step(self, cancellation_token):
+        # Every step starts after a complete turn, so this is where to checkpoint
+        try:
+            await self._checkpointer.save()
+        except Exception as e:
+            print(f"Checkpoint failed: {e}")
+        self._checkpointer.turns += 1
+        await super()._orchestrate_step(cancellation_token)
+
+
+class CheckpointedMagenticOneGroupChat(MagenticOneGroupChat):
+    """MagenticOneGroupChat whose orchestrator checkpoints through `checkpointer`"""
+
+    def __init__(self, participants, model_client, checkpointer, **kwargs):
+        super().__init__(participants, model_client, **kwargs)
+        self._checkpointer = checkpointer
+        checkpointer.team = self
+
+    def _create_group_chat_manager_factory(
+        self,
+        name,
+        group_topic_type,
+        output_topic_type,
+        participant_topic_types,
+        participant_names,
+        participant_descriptions,
+        output_message_queue,
+        termination_condition,
+        max_turns,
+        message_factory,
+    ):
+        return lambda: CheckpointingOrchestrator(
+            name,
+            group_topic_type,
+            output_topic_type,
+            participant_topic_types,
+            participant_names,
+            participant_descriptions,
+            max_turns,
+            message_factory,
+            self._model_client,
+            self._max_stalls,
+            self._final_answer_prompt,
+            output_message_queue,
+            termination_condition,
+            self._emit_team_events,
+            checkpointer=self._checkpointer,
+        )
@@ -0,0 +1,236 @@
+import asyncio
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from autogen_agentchat.agents import CodeExecutorAgent
+from autogen_core.code_executor import CodeExecutor, CodeResult
+from autogen_ext.agents.file_surfer import FileSurfer
+from autogen_ext.agents.magentic_one import MagenticOneCoderAgent
+from prometheus_client import Counter, Gauge, Histogram
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_worker.py")
+LANGUAGES = {"python": "python", "py": "python", "sh": "sh", "bash": "sh", "shell": "sh"}
+# The only variables workers inherit: API keys and the rest of the app's environment stay out of reach of the code
+WORKER_ENV = ("PATH", "LANG", "LC_ALL", "SYSTEMROOT", "TMPDIR", "TEMP", "TMP")
+
+CODE_BLOCKS = Histogram("magentic_code_block_duration_seconds", "Run time of code blocks", ["language", "outcome"],
+                        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, float("inf")))
+WORKER_LEASES = Counter("magentic_code_worker_leases", "Code workers handed to runs", ["kind"])
+IDLE_WORKERS = Gauge("magentic_code_workers_idle", "Pre-warmed code workers waiting for a run")
+
+
+class _Worker:
+    """A code_worker.py process; blocks until it has imported its preloads"""
+
+    def __init__(self, env):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", WORKER_SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            env=env, text=True, encoding="utf-8", bufsize=1,
+        )
+        self.uses = 0
+        self._lock = threading.Lock()
+        if not self.process.stdout.readline():
+            raise RuntimeError(f"Code worker exited with {self.process.wait()} while starting")
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, language, code, work_dir, timeout, memory_mb):
+        """Run one block (blocking); returns the worker's reply"""
+        request = {"language": language, "code": code, "work_dir": work_dir, "timeout": timeout, "memory_mb": memory_mb}
+        with self._lock:
+            try:
+                self.process.stdin.write(json.dumps(request) + "\n")
+                self.process.stdin.flush()
+                line = self.process.stdout.readline()
+            except OSError:
+                line = ""
+        if not line:
+            raise RuntimeError("Code worker exited while running a block")
+        self.uses += 1
+        return json.loads(line)
+
+    def stop(self):
+        """Stop the worker and the block it may be running"""
+        self.process.terminate()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class CodePool:
+    """Pre-warmed code workers shared by the terminal agents of every run.
+
+    Workers have already imported `preload`, so a run's first block starts
+    without an interpreter start-up. A run leases one worker for its whole
+    life and returns it when it ends. Workers never run code themselves:
+    every block runs in a forked child with the run's working directory,
+    `timeout` seconds and `memory_mb` of address space, so a returned worker
+    is as clean as a new one. Workers are replaced after `max_uses` blocks.
+    """
+
+    def __init__(self, size=2, preload=(), timeout=60.0, memory_mb=1024, max_uses=200):
+        self.size = size
+        self.preload = preload
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_uses = max_uses
+        self._idle = []
+        self._warming = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._refill()
+
+    def _spawn(self):
+        env = {name: os.environ[name] for name in WORKER_ENV if name in os.environ}
+        env["CODE_WORKER_PRELOAD"] = ",".join(self.preload)
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+        return _Worker(env)
+
+    def _refill(self):
+        with self._lock:
+            missing = 0 if self._closed else self.size - len(self._idle) - self._warming
+            self._warming += max(0, missing)
+        if missing > 0:
+            threading.Thread(target=self._warm, args=(missing,), name="code-pool-warm", daemon=True).start()
+
+    def _warm(self, count):
+        for _ in range(count):
+            try:
+                worker = self._spawn()
+            except Exception as e:
+                print(f"Could not start a code worker: {e}")
+                worker = None
+            with self._lock:
+                self._warming -= 1
+                if worker is not None and not self._closed:
+                    self._idle.append(worker)
+                    worker = None
+                IDLE_WORKERS.set(len(self._idle))
+            if worker is not None:
+                worker.stop()
+
+    def lease(self):
+        """A warm worker if one is idle, else a new one (blocking)"""
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+            IDLE_WORKERS.set(len(self._idle))
+        self._refill()
+        if worker is not None and worker.alive():
+            WORKER_LEASES.labels("warm").inc()
+            return worker
+        WORKER_LEASES.labels("cold").inc()
+        return self._spawn()
+
+    def give_back(self, worker):
+        with self._lock:
+            if not self._closed and worker.alive() and worker.uses < self.max_uses and len(self._idle) < self.size:
+                self._idle.append(worker)
+                IDLE_WORKERS.set(len(self._idle))
+                return
+        worker.stop()
+        self._refill()
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            IDLE_WORKERS.set(0)
+        for worker in idle:
+            worker.stop()
+
+
+class PooledCodeExecutor(CodeExecutor):
+    """Runs a run's code blocks on a worker leased from the code pool, in the run's working directory"""
+
+    def __init__(self, pool, work_dir):
+        super().__init__()
+        self.pool = pool
+        self.work_dir = os.path.abspath(work_dir)
+        self._worker = None
+
+    async def start(self):
+        if self._worker is None:
+            self._worker = await asyncio.to_thread(self.pool.lease)
+
+    async def stop(self):
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            await asyncio.to_thread(self.pool.give_back, worker)
+
+    async def restart(self):
+        await self.stop()
+        await self.start()
+
+    async def _discard(self):
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            await asyncio.to_thread(worker.stop)
+
+    async def execute_code_blocks(self, code_blocks, cancellation_token):
+        await self.start()
+        outputs = []
+        for block in code_blocks:
+            language = LANGUAGES.get(block.language.lower())
+            if language is None:
+                outputs.append(f"Unsupported language {block.language}: use python or sh")
+                return CodeResult(exit_code=1, output="\n".join(outputs))
+            started = time.perf_counter()
+            future = asyncio.ensure_future(asyncio.to_thread(
+                self._worker.run, language, block.code, self.work_dir, self.pool.timeout, self.pool.memory_mb
+            ))
+            cancellation_token.link_future(future)
+            try:
+                reply = await future
+            except asyncio.CancelledError:
+                # The worker is still running the block; stopping it kills the block
+                await self._discard()
+                raise
+            except RuntimeError as e:
+                await self._discard()
+                outputs.append(str(e))
+                return CodeResult(exit_code=1, output="\n".join(outputs))
+            outcome = "timeout" if reply["timed_out"] else "ok" if reply["exit_code"] == 0 else "error"
+            CODE_BLOCKS.labels(language, outcome).observe(time.perf_counter() - started)
+            outputs.append(reply["output"])
+            if reply["exit_code"] != 0:
+                return CodeResult(exit_code=reply["exit_code"], output="\n".join(outputs))
+        return CodeResult(exit_code=0, output="\n".join(outputs))
+
+
+def create_coding_agents(model_client, work_dir):
+    """FileSurfer, Coder and ComputerTerminal working in work_dir; returns them and the terminal's executor"""
+    executor = PooledCodeExecutor(get_code_pool(), work_dir)
+    agents = [
+        FileSurfer("FileSurfer", model_client=model_client, base_path=executor.work_dir),
+        MagenticOneCoderAgent("Coder", model_client=model_client),
+        CodeExecutorAgent("ComputerTerminal", code_executor=executor),
+    ]
+    return agents, executor
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_code_pool():
+    """Return the process-wide code pool, warming its workers on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CodePool(
+                size=int(os.getenv("CODE_POOL_SIZE", "2")),
+                preload=tuple(filter(None, os.getenv("CODE_WORKER_PRELOAD", "numpy,pandas").split(","))),
+                timeout=float(os.getenv("CODE_TIMEOUT_SECONDS", "60")),
+                memory_mb=int(os.getenv("CODE_MEMORY_MB", "1024")),
+                max_uses=int(os.getenv("CODE_WORKER_MAX_USES", "200")),
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,159 @@
+"""Pre-warmed code execution worker, started by code_pool.py.
+
+Reads one JSON request per line on stdin and answers with one JSON line on
+stdout. The worker never runs code itself: every block runs in a forked
+child, in its own session, in the request's working directory and under
+its time and memory limits, so a block cannot change the worker or the
+blocks that follow. Modules in CODE_WORKER_PRELOAD are imported once up
+front, so forked Python blocks get them without paying for the import.
+"""
+import importlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+MAX_OUTPUT_CHARS = 20_000
+TIMEOUT_EXIT_CODE = 124
+
+_child = None
+_channel = None
+
+
+def _kill_child(*_):
+    if _child is not None:
+        try:
+            os.killpg(_child, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def _on_term(*_):
+    # Stopping the worker stops the block it is running
+    _kill_child()
+    os._exit(1)
+
+
+def _limit(timeout, memory_mb):
+    import resource
+
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # A backstop: the worker kills the block once its wall-clock timeout has passed
+    cpu = int(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+
+
+def _run_in_child(language, code, output):
+    """Body of the forked child; never returns"""
+    # Keep the block off the worker's protocol pipes
+    _channel.close()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(output.fileno(), 1)
+    os.dup2(output.fileno(), 2)
+    if language == "python":
+        sys.stdout = os.fdopen(1, "w", buffering=1)
+        sys.stderr = os.fdopen(2, "w", buffering=1)
+        exit_code = 0
+        try:
+            exec(compile(code, "<code block>", "exec"), {"__name__": "__main__"})
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if e.code is not None and not isinstance(e.code, int):
+                print(e.code, file=sys.stderr)
+        except BaseException as e:
+            # Leave this module's frame out of the traceback
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            exit_code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+    os.execvp("sh", ["sh", "-c", code])
+
+
+def _fork_block(language, code, work_dir, timeout, memory_mb, output):
+    global _child
+    pid = os.fork()
+    if pid == 0:
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.setsid()
+            os.chdir(work_dir)
+            _limit(timeout, memory_mb)
+            _run_in_child(language, code, output)
+        finally:
+            os._exit(1)
+    _child = pid
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return os.waitstatus_to_exitcode(status), False
+            if time.monotonic() > deadline:
+                _kill_child()
+                os.waitpid(pid, 0)
+                return TIMEOUT_EXIT_CODE, True
+            time.sleep(0.005)
+    finally:
+        # Whatever the block started in the background goes with it
+        _kill_child()
+        _child = None
+
+
+def _spawn_block(language, code, work_dir, timeout, output):
+    """Fallback where fork is not available; memory is not limited"""
+    command = [sys.executable, "-c", code] if language == "python" else ["sh", "-c", code]
+    try:
+        completed = subprocess.run(command, cwd=work_dir, stdout=output, stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL, timeout=timeout)
+        return completed.returncode, False
+    except subprocess.TimeoutExpired:
+        return TIMEOUT_EXIT_CODE, True
+
+
+def run(request):
+    with tempfile.TemporaryFile() as output:
+        if hasattr(os, "fork"):
+            exit_code, timed_out = _fork_block(request["language"], request["code"], request["work_dir"],
+                                               request["timeout"], request.get("memory_mb"), output)
+        else:
+            exit_code, timed_out = _spawn_block(request["language"], request["code"], request["work_dir"],
+                                                request["timeout"], output)
+        output.seek(0)
+        text = output.read().decode("utf-8", errors="replace")
+    if len(text) > MAX_OUTPUT_CHARS:
+        text = text[:MAX_OUTPUT_CHARS] + f"\n… [{len(text) - MAX_OUTPUT_CHARS} more characters]"
+    if timed_out:
+        text += f"\nTimeout: the code ran longer than {request['timeout']:g}s and was stopped"
+    return {"exit_code": exit_code, "output": text, "timed_out": timed_out}
+
+
+def main():
+    global _channel
+    signal.signal(signal.SIGTERM, _on_term)
+    for name in filter(None, os.getenv("CODE_WORKER_PRELOAD", "").split(",")):
+        try:
+            importlib.import_module(name.strip())
+        except ImportError:
+            pass
+    # The protocol owns the real stdout; stray prints go to stderr
+    _channel = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    _channel.write(json.dumps({"ready": True}) + "\n")
+    for line in sys.stdin:
+        try:
+            reply = run(json.loads(line))
+        except Exception as e:
+            reply = {"exit_code": 1, "output": f"Code worker error: {e}", "timed_out": False}
+        _channel.write(json.dumps(reply) + "\n")
+
+
+if __name__ == "__main__":
+    main()
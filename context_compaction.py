@@ -0,0 +1,161 @@
+from dataclasses import asdict, dataclass
+
+from autogen_core import Image
+from autogen_core.models import AssistantMessage, FunctionExecutionResultMessage, SystemMessage, UserMessage
+from prometheus_client import Counter, Histogram
+
+# Roughly what a 1440x900 screenshot costs at high detail
+IMAGE_TOKENS = 1105
+CHARS_PER_TOKEN = 4
+OMITTED_IMAGE = "[earlier screenshot omitted]"
+DIGEST_LINE_CHARS = 160
+DIGEST_MAX_CHARS = 3000
+
+COMPACTED_CALLS = Counter("magentic_context_compactions", "Model calls whose history was compacted", ["stage"])
+TOKENS_SAVED = Counter("magentic_context_tokens_saved", "Estimated prompt tokens removed by compaction")
+PROMPT_ESTIMATE = Histogram("magentic_prompt_tokens_estimate", "Estimated prompt tokens sent per model call",
+                            buckets=(1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000, float("inf")))
+
+
+def _text(content):
+    if isinstance(content, str):
+        return content
+    return "\n".join(part if isinstance(part, str) else getattr(part, "content", str(part)) for part in content)
+
+
+def estimate_tokens(message):
+    content = message.content
+    images = sum(1 for part in content if isinstance(part, Image)) if isinstance(content, list) else 0
+    text = _text([part for part in content if not isinstance(part, Image)]) if images else _text(content)
+    if isinstance(message, AssistantMessage) and not isinstance(content, str):
+        text = "\n".join(f"{call.name}({call.arguments})" for call in content)
+    return len(text) // CHARS_PER_TOKEN + images * IMAGE_TOKENS + 4
+
+
+def _without_images(message):
+    content = [OMITTED_IMAGE if isinstance(part, Image) else part for part in message.content]
+    return UserMessage(content=content, source=message.source)
+
+
+def _turns(messages, start, end):
+    """Split messages[start:end] into turns that must be kept or dropped whole.
+
+    A tool call and its results form one turn, since the API rejects
+    results whose call is missing.
+    """
+    turns = []
+    for index in range(start, end):
+        if isinstance(messages[index], FunctionExecutionResultMessage) and turns:
+            turns[-1].append(index)
+        else:
+            turns.append([index])
+    return turns
+
+
+def _digest(messages):
+    """One line per dropped message, so the model keeps a trail of what happened"""
+    lines = []
+    size = 0
+    for message in messages:
+        if isinstance(message, FunctionExecutionResultMessage):
+            continue
+        first_line = next((line for line in _text(message.content).splitlines() if line.strip()), "")
+        if isinstance(message, AssistantMessage) and not isinstance(message.content, str):
+            first_line = "called " + ", ".join(call.name for call in message.content)
+        line = f"- {getattr(message, 'source', 'assistant')}: {first_line[:DIGEST_LINE_CHARS]}"
+        size += len(line)
+        if size > DIGEST_MAX_CHARS:
+            lines.append("- …")
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+@dataclass
+class CompactionStats:
+    calls: int = 0
+    compacted_calls: int = 0
+    images_dropped: int = 0
+    messages_dropped: int = 0
+    tokens_saved: int = 0
+
+    def take(self):
+        """The stats since the last call, for the run summary"""
+        values = asdict(self)
+        for name in values:
+            setattr(self, name, 0)
+        return values
+
+
+def compact_messages(messages, budget, keep_recent=6, keep_images=1, drop_step=4, stats=None):
+    """Fit a prompt's messages into about `budget` tokens; returns them unchanged when they fit.
+
+    First, screenshots are removed from all but the last `keep_images` image
+    messages. If that is not enough, the oldest turns are dropped, in steps
+    of `drop_step` turns so the compacted prefix (and the provider's prompt
+    cache) stays the same across several calls. The system messages, the
+    first message (the task, or the orchestrator's facts and plan) and the
+    last `keep_recent` messages are always kept. The dropped turns are
+    replaced by a one-line-per-message digest.
+    """
+    sizes = [estimate_tokens(message) for message in messages]
+    total = sum(sizes)
+    if stats is not None:
+        stats.calls += 1
+    if not budget or total <= budget:
+        PROMPT_ESTIMATE.observe(total)
+        return messages
+
+    messages = list(messages)
+    with_images = [index for index, message in enumerate(messages)
+                   if isinstance(message, UserMessage) and isinstance(message.content, list)
+                   and any(isinstance(part, Image) for part in message.content)]
+    old_images = with_images[:-keep_images] if keep_images else with_images
+    images_dropped = 0
+    for index in old_images:
+        images_dropped += sum(1 for part in messages[index].content if isinstance(part, Image))
+        messages[index] = _without_images(messages[index])
+        sizes[index] = estimate_tokens(messages[index])
+    stage = "images"
+
+    dropped = []
+    if sum(sizes) > budget:
+        head = 0
+        while head < len(messages) and isinstance(messages[head], SystemMessage):
+            head += 1
+        head += 1  # the task
+        while head < len(messages) and isinstance(messages[head], FunctionExecutionResultMessage):
+            head += 1
+        tail = max(head, len(messages) - keep_recent)
+        # The kept tail must not open with tool results whose call would be dropped
+        while head < tail < len(messages) and isinstance(messages[tail], FunctionExecutionResultMessage):
+            tail -= 1
+        turns = _turns(messages, head, tail)
+        excess = sum(sizes) - budget
+        count = 0
+        while count < len(turns) and excess > 0:
+            excess -= sum(sizes[index] for index in turns[count])
+            count += 1
+        count = min(len(turns), -(-count // drop_step) * drop_step)
+        dropped = [index for turn in turns[:count] for index in turn]
+        if dropped:
+            stage = "turns"
+            digest = UserMessage(content=f"[{len(dropped)} earlier messages were omitted to save context. "
+                                         f"What happened in them:]\n{_digest([messages[i] for i in dropped])}",
+                                 source="compaction")
+            removed = set(dropped)
+            messages = (messages[:head] + [digest]
+                        + [message for index, message in enumerate(messages) if index >= head and index not in removed])
+            sizes = [estimate_tokens(message) for message in messages]
+
+    compacted = sum(sizes)
+    COMPACTED_CALLS.labels(stage).inc()
+    TOKENS_SAVED.inc(max(0, total - compacted))
+    PROMPT_ESTIMATE.observe(compacted)
+    if stats is not None:
+        stats.compacted_calls += 1
+        stats.images_dropped += images_dropped
+        stats.messages_dropped += len(dropped)
+        stats.tokens_saved += max(0, total - compacted)
+    return messages
+
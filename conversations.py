@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import time
+
+from prometheus_client import Gauge
+
+from run_channel import execute
+from tracing import CurrentRunTracer
+
+ACTIVE_CONVERSATIONS = Gauge("magentic_conversations", "Conversations keeping a team and browser open")
+
+
+class Conversation:
+    """A chat whose team, context and open browser page survive between messages.
+
+    Playwright objects belong to the event loop that created them, so every
+    message of a conversation runs on the conversation's own loop thread.
+    """
+
+    def __init__(self, conversation_id):
+        self.id = conversation_id
+        self.resources = None
+        self.tracer = CurrentRunTracer()
+        self.runs = 0
+        self.last_run_id = None
+        self.busy = False
+        self.last_used = time.monotonic()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=f"conversation-{conversation_id}", daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        page = getattr(self.resources.surfer, "_page", None) if self.resources else None
+        return page.url if page is not None else None
+
+    def submit(self, channel, budget=None, options=None, user=None, priority=0):
+        """Run the next message on the conversation's loop, publishing to channel"""
+        self.busy = True
+        self.last_used = time.monotonic()
+        self.last_run_id = channel.run_id
+        return asyncio.run_coroutine_threadsafe(self._run(channel, budget, options, user, priority), self.loop)
+
+    async def _run(self, channel, budget, options, user, priority):
+        try:
+            await execute(channel, budget, options, conversation=self, user=user, priority=priority)
+        finally:
+            self.runs += 1
+            self.busy = False
+            self.last_used = time.monotonic()
+
+    def close(self, timeout=30.0):
+        """Close the browser and stop the loop thread"""
+        try:
+            if self.resources is not None:
+                asyncio.run_coroutine_threadsafe(self.resources.close(), self.loop).result(timeout)
+        except Exception as e:
+            print(f"Closing conversation {self.id} failed: {e}")
+        finally:
+            self.resources = None
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self.loop.close()
+
+
+class ConversationManager:
+    """Conversations by id; a background thread ends those idle for `idle_timeout` seconds"""
+
+    def __init__(self, idle_timeout=600.0, interval=30.0):
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self._conversations = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="conversation-reaper", daemon=True)
+        self._thread.start()
+
+    def get(self, conversation_id):
+        """Return the conversation, starting a new one if it does not exist or has expired"""
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self._conversations[conversation_id] = Conversation(conversation_id)
+                ACTIVE_CONVERSATIONS.set(len(self._conversations))
+            conversation.last_used = time.monotonic()
+            return conversation
+
+    def peek(self, conversation_id):
+        with self._lock:
+            return self._conversations.get(conversation_id)
+
+    def end(self, conversation_id):
+        with self._lock:
+            conversation = self._conversations.pop(conversation_id, None)
+            ACTIVE_CONVERSATIONS.set(len(self._conversations))
+        if conversation is not None:
+            conversation.close()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                idle = [conversation_id for conversation_id, conversation in self._conversations.items()
+                        if not conversation.busy and now - conversation.last_used > self.idle_timeout]
+                idle = [self._conversations.pop(conversation_id) for conversation_id in idle]
+                ACTIVE_CONVERSATIONS.set(len(self._conversations))
+            for conversation in idle:
+                conversation.close()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_conversations():
+    """Return the process-wide conversation manager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConversationManager(idle_timeout=float(os.getenv("CONVERSATION_IDLE_SECONDS", "600")))
+        return _manager
@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from prometheus_client import Counter, Gauge
+
+from web_surfer import add_launch_hook
+
+MB = 1024 * 1024
+CHUNK_SIZE = MB
+
+DOWNLOADED_BYTES = Counter("magentic_download_bytes", "Bytes of files downloaded by surfers", ["kind"])
+REFUSED_DOWNLOADS = Counter("magentic_downloads_refused", "Downloads refused by a quota", ["quota"])
+EVICTED_RUNS = Counter("magentic_download_runs_evicted", "Run download folders removed by cleanup", ["reason"])
+STORE_BYTES = Gauge("magentic_download_store_bytes", "Bytes held in the download blob store")
+
+
+class DownloadRefused(Exception):
+    pass
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link(source, target):
+    """Hard-link target to source, copying where links are not supported"""
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class DownloadStore:
+    """Content-addressed download folder shared by every surfer.
+
+    Files are stored once under blobs/<sha256> and hard-linked into
+    runs/<run_id>/<name>, so a blob's link count says how many runs still use
+    it. A background thread removes run folders past `max_age` or, oldest
+    first, while the store is over `global_quota`, then deletes unused blobs.
+    Cleanup walks the disk without holding the store's lock: folders are
+    only renamed into trash/ and blobs re-checked under it, so downloads of
+    other runs are not held up.
+    """
+
+    def __init__(self, root, run_quota=None, global_quota=None, max_age=24 * 3600, cleanup_interval=300.0):
+        self.root = root
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.runs_dir = os.path.join(root, "runs")
+        self.trash_dir = os.path.join(root, "trash")
+        self.run_quota = run_quota
+        self.global_quota = global_quota
+        self.max_age = max_age
+        self.cleanup_interval = cleanup_interval
+        self.total_bytes = 0
+        self._run_bytes = {}
+        self._lock = threading.Lock()
+        self._cleanup_lock = threading.Lock()
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.trash_dir, exist_ok=True)
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._loop, name="download-cleanup", daemon=True)
+        self._thread.start()
+
+    def run_folder(self, run_id):
+        """Create the run's folder and keep it from eviction until release()"""
+        path = os.path.join(self.runs_dir, run_id)
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._run_bytes.setdefault(run_id, 0)
+        return path
+
+    def _blob_path(self, sha):
+        return os.path.join(self.blobs_dir, sha[:2], sha)
+
+    def _global_quota_full(self, size):
+        return self.global_quota and self.total_bytes + size > self.global_quota
+
+    def _admit(self, run_id, size):
+        with self._lock:
+            if self.run_quota and self._run_bytes.get(run_id, 0) + size > self.run_quota:
+                REFUSED_DOWNLOADS.labels("run").inc()
+                raise DownloadRefused(f"download of {size // MB} MB would exceed the per-run quota of {self.run_quota // MB} MB")
+            if not self._global_quota_full(size):
+                return
+        self.cleanup(target_bytes=self.global_quota - size)
+        with self._lock:
+            if self._global_quota_full(size):
+                REFUSED_DOWNLOADS.labels("global").inc()
+                raise DownloadRefused(f"download folder is full ({self.global_quota // MB} MB quota)")
+
+    def store(self, run_id, source, target):
+        """Store a finished download from `source` and link it at `target` (blocking)"""
+        size = os.path.getsize(source)
+        self._admit(run_id, size)
+        sha = _sha256(source)
+        blob = self._blob_path(sha)
+        tmp_path = None
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp_path = f"{blob}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source, tmp_path)
+        with self._lock:
+            if os.path.exists(blob):
+                DOWNLOADED_BYTES.labels("deduplicated").inc(size)
+                if tmp_path is not None:
+                    os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob)
+                self.total_bytes += size
+                STORE_BYTES.set(self.total_bytes)
+                DOWNLOADED_BYTES.labels("stored").inc(size)
+            _link(blob, target)
+            self._run_bytes[run_id] = self._run_bytes.get(run_id, 0) + size
+        return sha
+
+    def release(self, run_id):
+        """Forget a finished run's quota usage; its files stay until cleanup"""
+        with self._lock:
+            self._run_bytes.pop(run_id, None)
+
+    def _run_folders(self):
+        folders = []
+        for name in os.listdir(self.runs_dir):
+            path = os.path.join(self.runs_dir, name)
+            try:
+                folders.append((os.path.getmtime(path), name, path))
+            except OSError:
+                pass
+        return sorted(folders)
+
+    def _collect_blobs(self):
+        """Delete blobs no run folder links to and return the bytes still stored"""
+        total = 0
+        for prefix in os.listdir(self.blobs_dir):
+            prefix_dir = os.path.join(self.blobs_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Skip fresh files another process may be about to link
+                if time.time() - stat.st_mtime < 60:
+                    total += stat.st_size
+                elif name.endswith(".tmp") or stat.st_nlink <= 1:
+                    if not self._remove_blob(path):
+                        total += stat.st_size
+                else:
+                    total += stat.st_size
+        return total
+
+    def _remove_blob(self, path):
+        """Delete an unlinked blob unless store() linked it since it was looked at"""
+        with self._lock:
+            try:
+                if not path.endswith(".tmp") and os.stat(path).st_nlink > 1:
+                    return False
+                os.remove(path)
+            except OSError:
+                pass
+        return True
+
+    def _evict(self, run_id, path):
+        """Move an inactive run's folder to the trash; the slow delete happens outside the lock"""
+        with self._lock:
+            if run_id in self._run_bytes:
+                return False
+            try:
+                os.replace(path, os.path.join(self.trash_dir, f"{run_id}.{time.time_ns()}"))
+            except OSError:
+                return False
+        return True
+
+    def _empty_trash(self):
+        for name in os.listdir(self.trash_dir):
+            shutil.rmtree(os.path.join(self.trash_dir, name), ignore_errors=True)
+
+    def cleanup(self, target_bytes=None):
+        """Evict run folders by age, then oldest first down to target_bytes"""
+        with self._cleanup_lock:
+            now = time.time()
+            for mtime, run_id, path in self._run_folders():
+                if now - mtime > self.max_age and self._evict(run_id, path):
+                    EVICTED_RUNS.labels("age").inc()
+            self._empty_trash()
+            total = self._collect_blobs()
+            target_bytes = target_bytes if target_bytes is not None else self.global_quota
+            if target_bytes is not None and total > target_bytes:
+                for mtime, run_id, path in self._run_folders():
+                    if now - mtime < 60 or not self._evict(run_id, path):
+                        continue
+                    EVICTED_RUNS.labels("size").inc()
+                    self._empty_trash()
+                    total = self._collect_blobs()
+                    if total <= target_bytes:
+                        break
+            with self._lock:
+                self.total_bytes = total
+                STORE_BYTES.set(self.total_bytes)
+
+    def _loop(self):
+        while True:
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"Download cleanup failed: {e}")
+            time.sleep(self.cleanup_interval)
+
+
+def _managed_save_as(store, run_id, download):
+    async def save_as(path):
+        # Playwright has already streamed the file to a temporary path
+        source = await download.path()
+        await asyncio.to_thread(store.store, run_id, source, str(path))
+
+    return save_as
+
+
+def manage_downloads(surfer, run_id):
+    """Save the surfer's downloads into the run's namespace of the shared store"""
+    store = get_download_store()
+    folder = store.run_folder(run_id)
+    surfer.downloads_folder = folder
+    controller = getattr(surfer, "_playwright_controller", None)
+    if controller is not None:
+        controller.downloads_folder = folder
+
+    def on_download(download):
+        download.save_as = _managed_save_as(store, run_id, download)
+
+    def attach(surfer):
+        for page in surfer._context.pages:
+            page.on("download", on_download)
+        surfer._context.on("page", lambda page: page.on("download", on_download))
+
+    add_launch_hook(surfer, attach)
+    return store
+
+
+def _env_megabytes(name):
+    value = os.getenv(name)
+    return int(float(value) * MB) if value else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_download_store():
+    """Return the process-wide store, starting its cleanup thread on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DownloadStore(
+                os.getenv("DOWNLOADS_DIR", "./downs"),
+                run_quota=_env_megabytes("DOWNLOADS_RUN_QUOTA_MB"),
+                global_quota=_env_megabytes("DOWNLOADS_QUOTA_MB"),
+                max_age=float(os.getenv("DOWNLOADS_MAX_AGE_HOURS", "24")) * 3600,
+                cleanup_interval=float(os.getenv("DOWNLOADS_CLEANUP_SECONDS", "300")),
+            )
+        return _store
@@ -2,12 +2,14 @@ import asyncio
 import sys
 import signal
 import atexit
-from autogen_ext.models.openai import OpenAIChatCompletionClient, AzureOpenAIChatCompletionClient
 from autogen_agentchat.teams import MagenticOneGroupChat
 from autogen_agentchat.ui import Console
 from autogen_ext.agents.web_surfer import MultimodalWebSurfer
-import os
 from dotenv import load_dotenv
+from browser_reaper import get_reaper
+from budgets import RunBudget, BudgetTermination
+from model_client import create_model_client
+from web_surfer import track_browser_usage
 
 load_dotenv()
 
@@ -17,11 +19,7 @@ if sys.platform == "win32":
 async def main() -> None:
     surfer = None
     try:
-        model_client = AzureOpenAIChatCompletionClient(model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-                                                       azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                                                       api_key=os.getenv("AZURE_OPENAI_KEY"),
-                                                       azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-                                                       api_version=os.getenv("AZURE_API_VERSION"))
+        model_client = create_model_client()
 
         # surfer = MultimodalWebSurfer(
         #     "WebSurfer",
@@ -40,15 +38,23 @@ async def main() -> None:
             browser_data_dir="./browser_data",
         )
 
-        team = MagenticOneGroupChat([surfer], model_client=model_client)
+        budget = RunBudget.from_env()
+        browser_usage = track_browser_usage(surfer)
+        get_reaper().track(surfer, "magtest")
+        team = MagenticOneGroupChat(
+            [surfer],
+            model_client=model_client,
+            max_turns=budget.max_turns,
+            max_stalls=budget.max_stalls,
+            termination_condition=BudgetTermination(budget, model_client, browser_usage),
+        )
         # await Console(team.run_stream(task="Summarize the top 10 AI papers in arxiv?"))
         await Console(team.run_stream(task="summarize content from https://www.gethalfbaked.com/p/startup-ideas-425-cognitive-fitness?"))
 
-        # # Note: you can also use  other agents in the team
-        # team = MagenticOneGroupChat([surfer, file_surfer, coder, terminal], model_client=model_client)
-        # file_surfer = FileSurfer( "FileSurfer",model_client=model_client)
-        # coder = MagenticOneCoderAgent("Coder",model_client=model_client)
-        # terminal = CodeExecutorAgent("ComputerTerminal",code_executor=LocalCommandLineCodeExecutor())
+        # # Note: you can also use  other agents in the team, with code running on the pooled workers
+        # coding_agents, code_executor = create_coding_agents(model_client, "./downs")
+        # team = MagenticOneGroupChat([surfer, *coding_agents], model_client=model_client)
+        # ...and `await code_executor.stop()` when done (see code_pool.py)
     except Exception as e:
         print(f"Exception in main: {e}")
     finally:
@@ -60,6 +66,10 @@ async def main() -> None:
                 await surfer._browser.close()
         except Exception as cleanup_error:
             print(f"Error during surfer cleanup: {cleanup_error}")
+        finally:
+            # Kill any browser process that outlived close()
+            get_reaper().release("magtest")
+            await asyncio.to_thread(get_reaper().reap)
         
         # Cancel all running tasks to help cleanup
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import psutil
+from prometheus_client import Counter, Gauge, Histogram
+
+from web_surfer import browser_processes, request_recycle
+
+MB = 1024 * 1024
+
+APP_RSS = Gauge("magentic_app_rss_bytes", "Resident memory of the app process")
+BROWSER_RSS = Gauge("magentic_browser_rss_bytes", "Resident memory of all surfer browser process trees")
+WATCHDOG_STATE = Gauge("magentic_memory_watchdog_state", "0 = ok, 1 = recycling browsers, 2 = refusing new runs")
+BROWSER_RECYCLES = Counter("magentic_browser_recycles", "Browsers restarted by the memory watchdog")
+REFUSED_RUNS = Counter("magentic_runs_refused_memory", "Runs refused because memory was above the high-water mark")
+RUN_PEAK_RSS = Histogram(
+    "magentic_run_peak_rss_bytes", "Peak resident memory seen during a run", ["process"],
+    buckets=[b * MB for b in (64, 128, 256, 512, 1024, 2048, 4096, 8192)] + [float("inf")],
+)
+
+STATES = ("ok", "recycling", "refusing")
+
+
+@dataclass
+class RunMemory:
+    """Memory samples for one run's browser"""
+
+    surfer: object
+    browser_rss: int = 0
+    peak_browser_rss: int = 0
+    peak_app_rss: int = 0
+    last_recycle: float = 0.0
+
+
+class MemoryWatchdog:
+    """Samples RSS of the app and every run's browser tree in a background thread.
+
+    Above `recycle_bytes` the largest browser is restarted at its next turn;
+    above `refuse_bytes` new runs are refused until memory drops again.
+    """
+
+    def __init__(self, interval=2.0, recycle_bytes=None, refuse_bytes=None, recycle_cooldown=60.0):
+        self.interval = interval
+        self.recycle_bytes = recycle_bytes
+        self.refuse_bytes = refuse_bytes
+        self.recycle_cooldown = recycle_cooldown
+        self.state = "ok"
+        self.app_rss = 0
+        self.browser_rss = 0
+        self._runs = {}
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._thread = threading.Thread(target=self._loop, name="memory-watchdog", daemon=True)
+        self._thread.start()
+
+    def register(self, run_id, surfer):
+        with self._lock:
+            self._runs[run_id] = RunMemory(surfer)
+
+    def unregister(self, run_id):
+        """Stop watching a run and return its peaks as (app_rss, browser_rss)"""
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return 0, 0
+        RUN_PEAK_RSS.labels("app").observe(run.peak_app_rss)
+        RUN_PEAK_RSS.labels("browser").observe(run.peak_browser_rss)
+        return run.peak_app_rss, run.peak_browser_rss
+
+    def admit(self):
+        """Return (True, None) if a new run may start, else (False, reason)"""
+        if self.state == "refusing":
+            REFUSED_RUNS.inc()
+            return False, (f"memory use {self.total_rss // MB} MB is above the "
+                           f"{self.refuse_bytes // MB} MB limit")
+        return True, None
+
+    @property
+    def total_rss(self):
+        return self.app_rss + self.browser_rss
+
+    def _tree_rss(self, surfer):
+        total = 0
+        for process in browser_processes(surfer):
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def sample(self):
+        self.app_rss = self._process.memory_info().rss
+        with self._lock:
+            runs = list(self._runs.values())
+        for run in runs:
+            run.browser_rss = self._tree_rss(run.surfer)
+            run.peak_browser_rss = max(run.peak_browser_rss, run.browser_rss)
+            run.peak_app_rss = max(run.peak_app_rss, self.app_rss)
+        self.browser_rss = sum(run.browser_rss for run in runs)
+
+        total = self.total_rss
+        if self.refuse_bytes and total >= self.refuse_bytes:
+            self.state = "refusing"
+        elif self.recycle_bytes and total >= self.recycle_bytes:
+            self.state = "recycling"
+        else:
+            self.state = "ok"
+        if self.state != "ok" and runs:
+            self._recycle_largest(runs)
+
+        APP_RSS.set(self.app_rss)
+        BROWSER_RSS.set(self.browser_rss)
+        WATCHDOG_STATE.set(STATES.index(self.state))
+
+    def _recycle_largest(self, runs):
+        now = time.monotonic()
+        candidates = [run for run in runs if now - run.last_recycle > self.recycle_cooldown]
+        if not candidates:
+            return
+        run = max(candidates, key=lambda run: run.browser_rss)
+        if run.browser_rss:
+            run.last_recycle = now
+            request_recycle(run.surfer)
+            BROWSER_RECYCLES.inc()
+
+    def _loop(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Memory watchdog sample failed: {e}")
+            time.sleep(self.interval)
+
+
+def _env_megabytes(name):
+    value = os.getenv(name)
+    return int(float(value) * MB) if value else None
+
+
+_watchdog = None
+_watchdog_lock = threading.Lock()
+
+
+def get_watchdog():
+    """Return the process-wide watchdog, starting it on first use"""
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is None:
+            _watchdog = MemoryWatchdog(
+                interval=float(os.getenv("MEMORY_SAMPLE_SECONDS", "2")),
+                recycle_bytes=_env_megabytes("MEMORY_RECYCLE_MB"),
+                refuse_bytes=_env_megabytes("MEMORY_REFUSE_MB"),
+            )
+        return _watchdog
@@ -0,0 +1,118 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import (
+    MultiModalMessage,
+    TextMessage,
+    ThoughtEvent,
+    ToolCallExecutionEvent,
+    ToolCallRequestEvent,
+    ToolCallSummaryMessage,
+)
+from autogen_core import Image
+
+PREVIEW_CHARS = int(os.getenv("MESSAGE_PREVIEW_CHARS", "2000"))
+THUMBNAIL_SIZE = (320, 320)
+
+
+def truncate(text, limit=PREVIEW_CHARS):
+    """Cut text to limit characters before anything else formats it"""
+    if limit is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [{len(text) - limit} more characters]"
+
+
+class ImageRefs:
+    """Images of streamed messages, held by reference until a thumbnail is asked for.
+
+    Screenshots are never encoded for logs or the output monitor; a JPEG
+    thumbnail is made the first time one is shown. Only the newest
+    `max_images` are kept.
+    """
+
+    def __init__(self, max_images=200):
+        self.max_images = max_images
+        self._images = OrderedDict()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, run_id, image):
+        with self._lock:
+            number = self._counts[run_id] = self._counts.get(run_id, 0) + 1
+            ref = f"{run_id}/{number}"
+            self._images[ref] = [image, None]
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return ref
+
+    def thumbnail(self, ref):
+        """JPEG thumbnail bytes of ref, or None if it was dropped or belongs to another process"""
+        with self._lock:
+            entry = self._images.get(ref)
+        if entry is None:
+            return None
+        if entry[1] is None:
+            thumb = entry[0].image.copy()
+            thumb.thumbnail(THUMBNAIL_SIZE)
+            buffer = io.BytesIO()
+            thumb.save(buffer, format="JPEG", quality=80)
+            # Drop the full image once its thumbnail exists
+            entry[:] = [None, buffer.getvalue()]
+        return entry[1]
+
+
+image_refs = ImageRefs(max_images=int(os.getenv("MESSAGE_IMAGES_KEPT", "200")))
+
+
+@dataclass
+class MessageView:
+    """What reporters, logs and the final answer need from a streamed message"""
+
+    source: str
+    type: str
+    text: str
+    images: list = field(default_factory=list)
+    # Untruncated text for the final answer; only agents' chat messages have one
+    answer: str = None
+
+    def line(self):
+        images = f" [{len(self.images)} image{'s' if len(self.images) > 1 else ''}]" if self.images else ""
+        return f"{self.source}: {self.text}{images}"
+
+    def to_event(self):
+        return {"source": self.source, "type": self.type, "content": self.text, "images": self.images}
+
+    @classmethod
+    def from_event(cls, data):
+        return cls(data["source"], data["type"], data["content"], data.get("images", []))
+
+
+def _tool_calls(calls):
+    return "; ".join(f"{call.name}({truncate(call.arguments, 200)})" for call in calls)
+
+
+def view_message(message, run_id, limit=PREVIEW_CHARS):
+    """Describe a streamed message by its type without serializing its payload"""
+    kind = type(message).__name__
+    if isinstance(message, TaskResult):
+        return MessageView("TaskResult", kind, f"Stopped: {message.stop_reason or 'done'}")
+    source = getattr(message, "source", "unknown")
+    if isinstance(message, MultiModalMessage):
+        parts = [part for part in message.content if isinstance(part, str)]
+        images = [image_refs.add(run_id, part) for part in message.content if isinstance(part, Image)]
+        text = "\n".join(parts)
+        return MessageView(source, kind, truncate(text, limit), images, text)
+    if isinstance(message, (TextMessage, ToolCallSummaryMessage, ThoughtEvent)):
+        answer = None if isinstance(message, ThoughtEvent) else message.content
+        return MessageView(source, kind, truncate(message.content, limit), answer=answer)
+    if isinstance(message, ToolCallRequestEvent):
+        return MessageView(source, kind, truncate(_tool_calls(message.content), limit))
+    if isinstance(message, ToolCallExecutionEvent):
+        results = "; ".join(truncate(result.content, 200) for result in message.content)
+        return MessageView(source, kind, truncate(results, limit))
+    text = message.to_text() if hasattr(message, "to_text") else repr(message)
+    return MessageView(source, kind, truncate(text, limit))
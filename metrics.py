@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily
+
+from rate_limiter import get_rate_limiter
+from web_surfer import add_close_hook, add_launch_hook
+
+RUN_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, float("inf"))
+
+ACTIVE_RUNS = Gauge("magentic_active_runs", "MagenticOne runs currently executing")
+QUEUE_DEPTH = Gauge("magentic_queue_depth", "Runs waiting to start")
+CHROMIUM_INSTANCES = Gauge("magentic_chromium_instances", "Live Chromium browsers launched by surfers")
+RUNS = Counter("magentic_runs", "Finished runs by outcome", ["outcome"])
+RUN_LATENCY = Histogram("magentic_run_duration_seconds", "End-to-end run latency", buckets=RUN_BUCKETS)
+TIME_TO_FIRST_MESSAGE = Histogram(
+    "magentic_time_to_first_message_seconds", "Time from run start to the first agent message", buckets=RUN_BUCKETS
+)
+PHASE_DURATION = Histogram("magentic_phase_duration_seconds", "Duration of run phases", ["phase"], buckets=RUN_BUCKETS)
+MODEL_CALLS = Counter("magentic_model_calls", "Model calls by outcome", ["outcome"])
+MODEL_CALL_LATENCY = Histogram("magentic_model_call_duration_seconds", "Model call latency")
+TOKENS = Counter("magentic_model_tokens", "Model tokens used", ["kind"])
+ERRORS = Counter("magentic_errors", "Errors by exception type", ["type"])
+
+
+class RateLimiterCollector:
+    """Exports the shared rate limiter's counters at scrape time"""
+
+    def collect(self):
+        stats = get_rate_limiter().stats
+        yield CounterMetricFamily(
+            "magentic_model_throttled_wait_seconds", "Time model calls waited on the rate limiter",
+            value=stats.throttled_wait_seconds,
+        )
+        yield CounterMetricFamily(
+            "magentic_model_throttled_requests", "Model calls that had to wait on the rate limiter",
+            value=stats.throttled_requests,
+        )
+        yield CounterMetricFamily(
+            "magentic_model_rate_limit_responses", "429 responses from the model deployment",
+            value=stats.rate_limit_responses,
+        )
+
+
+REGISTRY.register(RateLimiterCollector())
+
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+    """Serve /metrics (Prometheus and OpenMetrics formats) once per process"""
+    global _server_started
+    port = int(os.getenv("METRICS_PORT", "9464"))
+    with _server_lock:
+        if _server_started or port == 0:
+            return
+        try:
+            start_http_server(port, addr=os.getenv("METRICS_ADDR", "0.0.0.0"))
+        except OSError as e:
+            print(f"Metrics server not started on port {port}: {e}")
+        _server_started = True
+
+
+@contextmanager
+def phase(name):
+    """Time a block of a run as one phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_DURATION.labels(name).observe(time.perf_counter() - started)
+
+
+def record_error(error):
+    ERRORS.labels(type(error).__name__).inc()
+
+
+def track_chromium(surfer):
+    """Keep the live Chromium gauge in step with a surfer's browser"""
+    live = []
+
+    def launched(surfer):
+        live.append(True)
+        CHROMIUM_INSTANCES.inc()
+
+    def closed(surfer):
+        while live:
+            live.pop()
+            CHROMIUM_INSTANCES.dec()
+
+    add_launch_hook(surfer, launched)
+    add_close_hook(surfer, closed)
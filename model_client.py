@@ -0,0 +1,267 @@
+import asyncio
+import os
+import time
+
+import openai
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+import metrics
+from context_compaction import CompactionStats, compact_messages
+from prompt_cache import (
+    PromptCacheStats,
+    ToolSetRegistry,
+    end_call,
+    install_cached_tokens_handler,
+    start_call,
+)
+from rate_limiter import get_rate_limiter
+
+# Completion tokens reserved per call before the real usage is known
+COMPLETION_TOKEN_ESTIMATE = 1000
+
+
+class ChatCompletionClientWrapper(ChatCompletionClient):
+    """Forwards every call to an inner ChatCompletionClient"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        # Expose attributes of inner wrappers, e.g. cache_stats
+        if name == "_client":
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+    async def create(self, messages, **kwargs):
+        return await self._client.create(messages, **kwargs)
+
+    async def create_stream(self, messages, **kwargs):
+        async for chunk in self._client.create_stream(messages, **kwargs):
+            yield chunk
+
+    async def close(self):
+        await self._client.close()
+
+    def actual_usage(self):
+        return self._client.actual_usage()
+
+    def total_usage(self):
+        return self._client.total_usage()
+
+    def count_tokens(self, messages, **kwargs):
+        return self._client.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs):
+        return self._client.remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self._client.capabilities
+
+    @property
+    def model_info(self):
+        return self._client.model_info
+
+
+def _retry_after_seconds(error):
+    """Read Retry-After (or Azure's retry-after-ms) from a 429 response"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _is_transient(error):
+    """Errors the OpenAI SDK would retry itself: connection problems, timeouts, 408, 409 and 5xx"""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code in (408, 409) or error.status_code >= 500)
+
+
+class RateLimitedChatCompletionClient(ChatCompletionClientWrapper):
+    """Sends every call through the shared RateLimiter and retries 429s and transient errors.
+
+    A 429 pauses every caller of the limiter; connection errors, timeouts,
+    408/409 and 5xx responses only delay the failed call. Either way the
+    call's reserved tokens are given back, since it used none.
+    """
+
+    def __init__(self, client, limiter, max_retries=6):
+        super().__init__(client)
+        self._limiter = limiter
+        self._max_retries = max_retries
+
+    def _estimate_tokens(self, messages, kwargs):
+        try:
+            prompt_tokens = self._client.count_tokens(messages, tools=kwargs.get("tools", []))
+        except Exception:
+            prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        return prompt_tokens + COMPLETION_TOKEN_ESTIMATE
+
+    async def _retry_delay(self, error, estimate, attempt):
+        """Handle a failed call; returns whether to retry it"""
+        self._limiter.adjust(estimate, 0)
+        if isinstance(error, openai.RateLimitError):
+            self._limiter.backoff(attempt, _retry_after_seconds(error))
+            return attempt < self._max_retries
+        if not _is_transient(error) or attempt >= self._max_retries:
+            return False
+        await asyncio.sleep(self._limiter.retry_delay(attempt))
+        return True
+
+    async def create(self, messages, **kwargs):
+        estimate = self._estimate_tokens(messages, kwargs)
+        attempt = 0
+        while True:
+            await self._limiter.acquire(estimate)
+            try:
+                result = await self._client.create(messages, **kwargs)
+            except openai.OpenAIError as e:
+                if not await self._retry_delay(e, estimate, attempt):
+                    raise
+                attempt += 1
+                continue
+            self._limiter.adjust(estimate, result.usage.prompt_tokens + result.usage.completion_tokens)
+            return result
+
+    async def create_stream(self, messages, **kwargs):
+        estimate = self._estimate_tokens(messages, kwargs)
+        attempt = 0
+        while True:
+            await self._limiter.acquire(estimate)
+            started = False
+            try:
+                async for chunk in self._client.create_stream(messages, **kwargs):
+                    started = True
+                    if not isinstance(chunk, str):
+                        self._limiter.adjust(estimate, chunk.usage.prompt_tokens + chunk.usage.completion_tokens)
+                    yield chunk
+                return
+            except openai.OpenAIError as e:
+                # Only retry if nothing has been handed to the caller yet
+                if started or not await self._retry_delay(e, estimate, attempt):
+                    raise
+                attempt += 1
+
+
+class InstrumentedChatCompletionClient(ChatCompletionClientWrapper):
+    """Records call latency, token usage and errors in the metrics registry"""
+
+    async def create(self, messages, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = await self._client.create(messages, **kwargs)
+        except Exception as e:
+            metrics.MODEL_CALLS.labels("error").inc()
+            metrics.record_error(e)
+            raise
+        metrics.MODEL_CALL_LATENCY.observe(time.perf_counter() - started)
+        metrics.MODEL_CALLS.labels("ok").inc()
+        metrics.TOKENS.labels("prompt").inc(result.usage.prompt_tokens)
+        metrics.TOKENS.labels("completion").inc(result.usage.completion_tokens)
+        return result
+
+
+class PromptCacheChatCompletionClient(ChatCompletionClientWrapper):
+    """Records the cached share of each prompt and can keep the prompt prefix byte-stable.
+
+    Azure OpenAI caches prompts by prefix, and tools are sent before the
+    messages. MagenticOne's message threads only ever grow at the end, so the
+    part of the prefix that changes between calls is the surfer's tool list;
+    with `stable_prefix` on it is kept identical between an agent's calls.
+    """
+
+    def __init__(self, client, stable_prefix=False):
+        super().__init__(client)
+        self.stable_prefix = stable_prefix
+        self.cache_stats = PromptCacheStats()
+        self._tool_sets = ToolSetRegistry()
+        install_cached_tokens_handler()
+
+    async def create(self, messages, **kwargs):
+        if self.stable_prefix and kwargs.get("tools"):
+            kwargs["tools"] = self._tool_sets.stabilize(kwargs["tools"])
+        call, token = start_call()
+        try:
+            result = await self._client.create(messages, **kwargs)
+        finally:
+            end_call(token)
+        self.cache_stats.calls += 1
+        self.cache_stats.prompt_tokens += call.prompt_tokens or result.usage.prompt_tokens
+        self.cache_stats.cached_tokens += call.cached_tokens
+        metrics.TOKENS.labels("cached_prompt").inc(call.cached_tokens)
+        return result
+
+
+class CompactingChatCompletionClient(ChatCompletionClientWrapper):
+    """Keeps every prompt within `budget` tokens by dropping old screenshots and turns (see context_compaction)"""
+
+    def __init__(self, client, budget, keep_recent=6):
+        super().__init__(client)
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.compaction_stats = CompactionStats()
+
+    def _compact(self, messages):
+        return compact_messages(messages, self.budget, self.keep_recent, stats=self.compaction_stats)
+
+    async def create(self, messages, **kwargs):
+        return await self._client.create(self._compact(messages), **kwargs)
+
+    async def create_stream(self, messages, **kwargs):
+        async for chunk in self._client.create_stream(self._compact(messages), **kwargs):
+            yield chunk
+
+
+class TracedChatCompletionClient(ChatCompletionClientWrapper):
+    """Wraps each model request in a span of the run's trace, with token attributes"""
+
+    def __init__(self, client, run_tracer):
+        super().__init__(client)
+        self._run_tracer = run_tracer
+
+    async def create(self, messages, **kwargs):
+        attributes = {
+            "gen_ai.system": "az.ai.openai",
+            "gen_ai.request.model": os.getenv("AZURE_OPENAI_DEPLOYMENT", ""),
+            "gen_ai.request.message_count": len(messages),
+            "gen_ai.request.tool_count": len(kwargs.get("tools", [])),
+        }
+        with self._run_tracer.span("model.create", **attributes) as span:
+            result = await self._client.create(messages, **kwargs)
+            span.set_attribute("gen_ai.usage.input_tokens", result.usage.prompt_tokens)
+            span.set_attribute("gen_ai.usage.output_tokens", result.usage.completion_tokens)
+            span.set_attribute("gen_ai.response.finish_reason", str(result.finish_reason))
+            return result
+
+
+def create_model_client(run_tracer=None, stable_prefix=None, context_budget=None):
+    """Create the Azure OpenAI client, routed through the process-wide rate limiter"""
+    if stable_prefix is None:
+        stable_prefix = os.getenv("PROMPT_STABLE_PREFIX", "0") == "1"
+    if context_budget is None:
+        context_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "30000"))
+    client = AzureOpenAIChatCompletionClient(
+        model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        api_version=os.getenv("AZURE_API_VERSION"),
+        # Retries are scheduled by RateLimitedChatCompletionClient instead of per client
+        max_retries=0,
+    )
+    model_client = PromptCacheChatCompletionClient(client, stable_prefix)
+    model_client = RateLimitedChatCompletionClient(InstrumentedChatCompletionClient(model_client), get_rate_limiter())
+    # Outside the limiter, so rate limits are reserved for the compacted prompt
+    model_client = CompactingChatCompletionClient(
+        model_client, context_budget, keep_recent=int(os.getenv("CONTEXT_KEEP_RECENT", "6"))
+    )
+    if run_tracer is not None:
+        model_client = TracedChatCompletionClient(model_client, run_tracer)
+    return model_client
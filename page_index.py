@@ -0,0 +1,195 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from autogen_agentchat.agents import AssistantAgent
+from autogen_core.tools import FunctionTool
+from prometheus_client import Counter
+
+from web_surfer import add_launch_hook
+
+PAGE_INDEX_AGENT = "PageIndex"
+MIN_TEXT_CHARS = 200
+MAX_TEXT_CHARS = 200_000
+READ_CHARS = 8000
+
+INDEXED_PAGES = Counter("magentic_pages_indexed", "Pages whose text was stored in the local page index")
+INDEX_SEARCHES = Counter("magentic_page_index_searches", "Searches of the local page index", ["result"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    title TEXT,
+    content TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(title, content, content='pages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts(pages_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+END;
+CREATE INDEX IF NOT EXISTS pages_fetched_at ON pages(fetched_at);
+"""
+
+
+def _match_query(text):
+    """FTS5 query matching any of the words of free text, without FTS5 syntax errors"""
+    words = re.findall(r"\w+", text.lower())
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+class PageIndex:
+    """SQLite FTS5 index of the text of pages the surfers have visited.
+
+    A page is stored once per URL and replaced when it is visited again.
+    Pages older than `max_age` seconds are not returned and are pruned from
+    time to time. Every call opens its own connection, so the index can be
+    shared by threads and worker processes.
+    """
+
+    def __init__(self, path, max_age=24 * 3600, prune_every=100):
+        self.path = path
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, url, title, content):
+        """Store or replace a page (blocking)"""
+        content = content[:MAX_TEXT_CHARS]
+        with self._connect() as connection:
+            connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+            connection.execute("INSERT INTO pages (url, title, content, fetched_at) VALUES (?, ?, ?, ?)",
+                               (url, title, content, time.time()))
+        INDEXED_PAGES.inc()
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.max_age,))
+
+    def search(self, query, limit=5):
+        """Fresh pages matching query, best first, with a snippet of the matching text"""
+        match = _match_query(query)
+        if not match:
+            return []
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT pages.url, pages.title, pages.fetched_at, "
+                "snippet(pages_fts, 1, '', '', ' … ', 48) "
+                "FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid "
+                "WHERE pages_fts MATCH ? AND pages.fetched_at >= ? ORDER BY rank LIMIT ?",
+                (match, time.time() - self.max_age, limit),
+            ).fetchall()
+        return [{"url": url, "title": title, "fetched_at": fetched_at, "snippet": snippet}
+                for url, title, fetched_at, snippet in rows]
+
+    def read(self, url):
+        """Stored text of a fresh page, or None"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT title, content, fetched_at FROM pages WHERE url = ? AND fetched_at >= ?",
+                                     (url, time.time() - self.max_age)).fetchone()
+        return None if row is None else {"url": url, "title": row[0], "content": row[1], "fetched_at": row[2]}
+
+
+def _age(fetched_at):
+    minutes = int((time.time() - fetched_at) / 60)
+    return f"{minutes} min ago" if minutes < 120 else f"{minutes // 60} h ago"
+
+
+def index_pages(surfer):
+    """Store the text of every page the surfer finishes loading in the page index"""
+    index = get_page_index()
+
+    async def store(page):
+        try:
+            url = page.url
+            if not url.startswith(("http://", "https://")):
+                return
+            title = await page.title()
+            text = await page.evaluate("() => document.body ? document.body.innerText : ''")
+            if len(text) >= MIN_TEXT_CHARS:
+                await asyncio.to_thread(index.add, url, title, text)
+        except Exception as e:
+            # Pages often navigate away or close before their text is read
+            print(f"Page not indexed: {e}")
+
+    def watch(page):
+        page.on("load", lambda page: asyncio.ensure_future(store(page)))
+
+    def attach(surfer):
+        for page in surfer._context.pages:
+            watch(page)
+        surfer._context.on("page", watch)
+
+    add_launch_hook(surfer, attach)
+
+
+def create_page_index_agent(model_client):
+    """Assistant that answers from pages visited in earlier runs, so the surfer can skip them"""
+    index = get_page_index()
+
+    async def search_visited_pages(query: str) -> str:
+        """Search the text of recently visited web pages. Returns matching pages with a snippet each."""
+        results = await asyncio.to_thread(index.search, query)
+        INDEX_SEARCHES.labels("hit" if results else "miss").inc()
+        if not results:
+            return "No recently visited page matches; the web has to be searched."
+        return "\n\n".join(f"{result['title']} ({result['url']}, visited {_age(result['fetched_at'])})\n{result['snippet']}"
+                           for result in results)
+
+    async def read_visited_page(url: str) -> str:
+        """Read the stored text of a recently visited page, as returned by search_visited_pages."""
+        page = await asyncio.to_thread(index.read, url)
+        if page is None:
+            return f"{url} is not in the index or is out of date."
+        content = page["content"]
+        more = f"\n… [{len(content) - READ_CHARS} more characters]" if len(content) > READ_CHARS else ""
+        return f"{page['title']} ({url}, visited {_age(page['fetched_at'])})\n\n{content[:READ_CHARS]}{more}"
+
+    return AssistantAgent(
+        PAGE_INDEX_AGENT,
+        model_client=model_client,
+        tools=[FunctionTool(search_visited_pages, description=search_visited_pages.__doc__),
+               FunctionTool(read_visited_page, description=read_visited_page.__doc__)],
+        description="Searches the text of web pages visited in recent runs. Ask it first: if it has fresh pages "
+                    "on the topic it answers from them, so the web surfer does not have to browse.",
+        system_message="You answer questions from the local index of recently visited web pages. Search it, read "
+                       "the most relevant pages, and answer with their URLs. If nothing relevant is found, say so "
+                       "plainly so the web surfer can browse instead.",
+        reflect_on_tool_use=True,
+        max_tool_iterations=4,
+    )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_page_index():
+    """Return the process-wide page index"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PageIndex(
+                os.getenv("PAGE_INDEX_PATH", "./page_index/pages.db"),
+                max_age=float(os.getenv("PAGE_INDEX_MAX_AGE_HOURS", "24")) * 3600,
+            )
+        return _index
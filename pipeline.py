@@ -0,0 +1,274 @@
+import asyncio
+import time
+from dataclasses import replace
+
+from autogen_agentchat.base import TaskResult
+
+import metrics
+from browser_reaper import get_reaper
+from budgets import RunBudget, BudgetTermination, best_effort_answer
+from checkpoints import CheckpointedMagenticOneGroupChat, RunCheckpointer, load_checkpoint, mark_resumed
+from code_pool import create_coding_agents
+from downloads import manage_downloads
+from messages import view_message
+from memory_watchdog import get_watchdog
+from model_client import create_model_client
+from page_index import create_page_index_agent, index_pages
+from prefetch import use_prefetch
+from run_options import RunOptions
+from runs import new_run_id, write_summary
+from surfer_modes import SurferModeClient, use_surfer_modes
+from tracing import RunTracer, trace_surfer
+from transcripts import TranscriptWriter
+from web_surfer import create_surfer, track_browser_usage
+
+
+class RunReporter:
+    """Receives a run's progress; the Streamlit UI and the HTTP API each render it their own way.
+
+    `kind` is one of "processing", "success" or "error".
+    """
+
+    def status(self, kind, text):
+        pass
+
+    def message(self, view):
+        """Called with a MessageView of every streamed message"""
+        pass
+
+    def warning(self, text):
+        print(text)
+
+
+class RunResources:
+    """Model client, surfer and team of a run; a conversation keeps them for its later runs.
+
+    `run_id` is the run that created them, which owns their downloads and browser processes.
+    `code_executor` holds the code worker of the coding agents, if the team has them, and
+    `prefetcher` the surfer's prefetcher, if prefetching is on.
+    """
+
+    def __init__(self, model_client, surfer, surfer_client, team, checkpointer, termination, download_store, run_id,
+                 code_executor=None, prefetcher=None):
+        self.model_client = model_client
+        self.surfer = surfer
+        self.surfer_client = surfer_client
+        self.team = team
+        self.checkpointer = checkpointer
+        self.termination = termination
+        self.download_store = download_store
+        self.run_id = run_id
+        self.code_executor = code_executor
+        self.prefetcher = prefetcher
+
+    def start_run(self, run_id, task, budget):
+        """Point the kept team at a new run that follows up on the previous one"""
+        checkpointer = self.checkpointer
+        checkpointer.parent, checkpointer.run_id, checkpointer.task = checkpointer.run_id, run_id, task
+        checkpointer.mode = "follow_up"
+        self.termination.start_run(budget)
+
+    async def close(self):
+        self.download_store.release(self.run_id)
+        try:
+            try:
+                if self.code_executor is not None:
+                    await self.code_executor.stop()
+            finally:
+                if hasattr(self.surfer, 'close'):
+                    await self.surfer.close()
+                elif hasattr(self.surfer, '_browser') and self.surfer._browser:
+                    await self.surfer._browser.close()
+        finally:
+            # Whatever close() left running is killed after a grace period
+            get_reaper().release(self.run_id)
+
+
+async def _create_resources(run_id, user_input, run_tracer, budget, options, resume_from, reporter):
+    reporter.status("processing", "🔄 Initializing Azure OpenAI client...")
+
+    # Initialize model client
+    with metrics.phase("client_init"):
+        model_client = create_model_client(run_tracer, stable_prefix=options.stable_prefix,
+                                           context_budget=options.context_budget)
+
+    reporter.status("processing", "🌐 Starting MultimodalWebSurfer...")
+
+    # Initialize web surfer
+    with metrics.phase("surfer_init"):
+        surfer_client = SurferModeClient(model_client)
+        surfer = create_surfer(surfer_client)
+        use_surfer_modes(surfer, surfer_client, text_first=options.surfer_mode == "text")
+        prefetcher = use_prefetch(surfer) if options.prefetch else None
+        browser_usage = track_browser_usage(surfer)
+        download_store = manage_downloads(surfer, run_id)
+        metrics.track_chromium(surfer)
+        get_reaper().track(surfer, run_id)
+        trace_surfer(surfer, run_tracer)
+        if options.page_index:
+            index_pages(surfer)
+
+    reporter.status("processing", "🤖 Creating MagenticOne team...")
+
+    # Create team
+    with metrics.phase("team_init"):
+        checkpointer = RunCheckpointer(run_id, user_input, surfer, parent=resume_from)
+        termination = BudgetTermination(budget, model_client, browser_usage)
+        participants = [surfer]
+        if options.page_index:
+            participants.append(create_page_index_agent(model_client))
+        code_executor = None
+        if options.coding_agents:
+            # Code runs in the run's download folder, next to the files the surfer fetched
+            coding_agents, code_executor = create_coding_agents(model_client, surfer.downloads_folder)
+            participants.extend(coding_agents)
+        team = CheckpointedMagenticOneGroupChat(
+            participants,
+            model_client=model_client,
+            checkpointer=checkpointer,
+            max_turns=budget.max_turns,
+            max_stalls=budget.max_stalls,
+            termination_condition=termination,
+        )
+    return RunResources(model_client, surfer, surfer_client, team, checkpointer, termination, download_store, run_id,
+                        code_executor, prefetcher)
+
+
+async def process_with_magnetic_one(user_input, reporter=None, budget=None, run_id=None, options=None, resume_from=None, conversation=None):
+    """Process user input with MagenticOne, optionally continuing a checkpointed run.
+
+    With a conversation, the team and browser of its previous message are
+    reused and kept open afterwards.
+    """
+    reporter = reporter or RunReporter()
+    resources = None
+    budget = budget or RunBudget.from_env()
+    options = options or RunOptions.from_env()
+    run_id = run_id or new_run_id()
+    # A finished run takes user_input as a follow-up task; an interrupted one resumes its own task
+    checkpoint = load_checkpoint(resume_from) if resume_from and conversation is None else None
+    follow_up = checkpoint is not None and checkpoint["status"] == "finished"
+    if checkpoint is not None and not follow_up:
+        user_input = checkpoint["task"]
+    run_started = time.perf_counter()
+    outcome = "error"
+    run_error = None
+    task_result = None
+    cache_before = None
+    transcript = None
+    run_tracer = RunTracer(user_input, **{"magentic.run_id": run_id})
+    metrics.ACTIVE_RUNS.inc()
+    try:
+        if conversation is not None and conversation.resources is not None:
+            reporter.status("processing", "💬 Continuing the conversation...")
+            resources = conversation.resources
+            resources.start_run(run_id, user_input, budget)
+        else:
+            tracer = conversation.tracer if conversation is not None else run_tracer
+            resources = await _create_resources(run_id, user_input, tracer, budget, options, resume_from, reporter)
+            if conversation is not None:
+                conversation.resources = resources
+        if conversation is not None:
+            conversation.tracer.current = run_tracer
+        model_client, surfer, team = resources.model_client, resources.surfer, resources.team
+        cache_before = replace(model_client.cache_stats)
+        get_watchdog().register(run_id, surfer)
+
+        if checkpoint is not None:
+            await resources.checkpointer.restore(checkpoint, follow_up=follow_up)
+            if not follow_up:
+                mark_resumed(resume_from, run_id)
+
+        reporter.status("processing", "✨ Processing your request...")
+
+        # Process the request
+        result_parts = []
+        first_message_seen = False
+        stream_started = time.perf_counter()
+        transcript = TranscriptWriter(run_id)
+
+        async for message in team.run_stream(task=user_input):
+            run_tracer.on_message(message)
+            if isinstance(message, TaskResult):
+                task_result = message
+            elif not first_message_seen and message.source != "user":
+                first_message_seen = True
+                metrics.TIME_TO_FIRST_MESSAGE.observe(time.perf_counter() - run_started)
+
+            # Handle by type; images stay references and text is cut before formatting
+            view = view_message(message, run_id)
+            if view.answer is not None:
+                result_parts.append(f"{view.source}: {view.answer}")
+            reporter.message(view)
+            transcript.write(message, view)
+
+        metrics.PHASE_DURATION.labels("stream").observe(time.perf_counter() - stream_started)
+
+        # Final result
+        stop_reason = task_result.stop_reason if task_result else None
+        if stop_reason and stop_reason.startswith("Budget exhausted"):
+            outcome = "budget_exhausted"
+            reporter.status("processing", f"⏱️ {stop_reason}")
+            return best_effort_answer(task_result.messages, stop_reason)
+
+        final_result = "\n".join(result_parts) if result_parts else "Task completed successfully!"
+
+        reporter.status("success", "✅ Task completed successfully!")
+
+        outcome = "completed"
+        return final_result
+
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        reporter.status("error", "🛑 Run cancelled")
+        raise
+
+    except Exception as e:
+        run_error = e
+        metrics.record_error(e)
+        error_msg = f"Error: {str(e)}"
+        reporter.status("error", f"❌ {error_msg}")
+        return error_msg
+
+    finally:
+        # Cleanup
+        if transcript is not None:
+            transcript.close()
+        if resources is not None:
+            try:
+                await resources.checkpointer.save({"completed": "finished", "error": "failed"}.get(outcome, "stopped"))
+            except Exception as checkpoint_error:
+                print(f"Final checkpoint failed: {checkpoint_error}")
+        peak_app_rss, peak_browser_rss = get_watchdog().unregister(run_id)
+        metrics.ACTIVE_RUNS.dec()
+        metrics.RUNS.labels(outcome).inc()
+        metrics.RUN_LATENCY.observe(time.perf_counter() - run_started)
+        run_tracer.end(task_result.stop_reason if task_result else None, run_error)
+        cache_stats = resources.model_client.cache_stats if resources else None
+        calls = cache_stats.calls - cache_before.calls if cache_before else 0
+        prompt_tokens = cache_stats.prompt_tokens - cache_before.prompt_tokens if cache_before else 0
+        cached_tokens = cache_stats.cached_tokens - cache_before.cached_tokens if cache_before else 0
+        write_summary(run_id, {
+            "task": user_input,
+            "outcome": outcome,
+            "stop_reason": task_result.stop_reason if task_result else None,
+            "duration_seconds": round(time.perf_counter() - run_started, 2),
+            "peak_app_rss": peak_app_rss,
+            "peak_browser_rss": peak_browser_rss,
+            "stable_prefix": options.stable_prefix,
+            "surfer_modes": resources.surfer_client.take() if resources else {},
+            "prefetch": resources.prefetcher.take_stats() if resources and resources.prefetcher else None,
+            "compaction": resources.model_client.compaction_stats.take() if resources else None,
+            "resumed_from": resume_from,
+            "conversation": conversation.id if conversation is not None else None,
+            "model_calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "cached_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+        })
+        # A conversation keeps its browser open for the next message
+        if resources is not None and conversation is None:
+            try:
+                await resources.close()
+            except Exception as cleanup_error:
+                reporter.warning(f"Cleanup warning: {cleanup_error}")
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import re
+from dataclasses import dataclass, field
+
+from prometheus_client import Counter
+
+from web_surfer import add_close_hook, add_launch_hook, mark_speculative, unmark_speculative
+
+LOAD_TIMEOUT_MS = 15_000
+MAX_LINKS = 300
+STOPWORDS = frozenset("""
+a an and are as at be by can do for from has have how i in into is it its me my of on or our please that the
+their then there this to up us was we what when where which who why will with you your page site web search
+find look click visit open go get tell give show about more home menu next summarize summary
+""".split())
+
+PREFETCHED_PAGES = Counter("magentic_prefetch_pages", "Pages loaded ahead of the surfer, by what became of them",
+                           ["result"])
+PREFETCH_BYTES = Counter("magentic_prefetch_bytes", "Bytes loaded by prefetch tabs, by what became of them",
+                         ["result"])
+
+# Visible links of the page, in document order
+LINKS_SCRIPT = """(limit) => {
+    const links = [];
+    for (const a of document.querySelectorAll("a[href]")) {
+        if (links.length >= limit) break;
+        const r = a.getBoundingClientRect();
+        if (r.width === 0 || r.height === 0) continue;
+        links.push({href: a.href, text: (a.innerText || a.title || "").trim().slice(0, 200)});
+    }
+    return links;
+}"""
+
+# Where clicking the element would navigate the tab to, if it is a plain same-tab link
+CLICK_TARGET_SCRIPT = """(id) => {
+    const el = document.querySelector(`[__elementId='${id}']`);
+    const a = el && el.closest("a[href]");
+    if (!a || (a.target && a.target !== "_self") || a.hasAttribute("download")) return null;
+    return a.href;
+}"""
+
+
+def _words(text):
+    return {word for word in re.findall(r"[a-z0-9]{3,}", text.lower()) if word not in STOPWORDS}
+
+
+def _normalize(url):
+    return url.split("#", 1)[0].rstrip("/")
+
+
+def _goal_text(surfer):
+    """The task and the orchestrator's latest instructions, as seen by the surfer"""
+    history = [message.content for message in surfer._chat_history if isinstance(message.content, str)]
+    return " ".join(history[:1] + history[-2:])
+
+
+def score_links(links, goal_words, current_url, skip=()):
+    """Links ranked by how many goal words their text (twice) and URL mention; unrelated links are dropped"""
+    scored = {}
+    current = _normalize(current_url)
+    for link in links:
+        url = _normalize(link["href"])
+        if not url.startswith(("http://", "https://")) or url == current or url in skip:
+            continue
+        score = 2 * len(_words(link["text"]) & goal_words) + len(_words(url) & goal_words)
+        if score > scored.get(url, 0):
+            scored[url] = score
+    return sorted(scored, key=scored.get, reverse=True)
+
+
+@dataclass(eq=False)
+class _Tab:
+    url: str
+    page: object = None
+    load: object = None
+    bytes: int = 0
+    # URL the surfer was on before this tab was swapped in, for history_back
+    came_from: str = None
+    loaded_urls: set = field(default_factory=set)
+    on_request_finished: object = None
+
+
+class Prefetcher:
+    """Loads the surfer's likeliest next pages in background tabs while the team is thinking.
+
+    After every surfer step, the visible links of its page are scored
+    against the task and the orchestrator's latest instructions, and the
+    best `max_tabs` are loaded, `concurrency` at a time, until `byte_budget`
+    bytes have been spent. When the surfer then visits or clicks a link to a
+    prefetched page, the warm tab is swapped in for its page. Tabs that are
+    not used before the next round, or before the browser closes, are
+    counted as wasted.
+    """
+
+    def __init__(self, surfer, max_tabs=3, concurrency=2, byte_budget=10 * 1024 * 1024):
+        self.surfer = surfer
+        self.max_tabs = max_tabs
+        self.byte_budget = byte_budget
+        self.spent = 0
+        self.stats = {"prefetched": 0, "hits": 0, "used_bytes": 0, "wasted_bytes": 0}
+        self._tabs = {}
+        self._visited = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._refresh = None
+        self._swapped = None
+
+    def _find(self, url):
+        url = _normalize(url)
+        return next((tab for tab in self._tabs.values() if url in tab.loaded_urls or url == tab.url), None)
+
+    async def _count(self, tab, request):
+        try:
+            sizes = await request.sizes()
+            size = sizes["responseBodySize"] + sizes["responseHeadersSize"]
+        except Exception:
+            return
+        tab.bytes += size
+        self.spent += size
+
+    async def _load(self, tab):
+        async with self._semaphore:
+            if self.spent >= self.byte_budget:
+                return False
+            try:
+                # Set up like the surfer's own page, so it can be swapped in as is
+                tab.page = await self.surfer._context.new_page()
+                # Speculative loads do not count toward the run's navigation and download budgets
+                mark_speculative(self.surfer, tab.page)
+                tab.page.on("download", self.surfer._download_handler)
+                tab.on_request_finished = lambda request: asyncio.ensure_future(self._count(tab, request))
+                tab.page.on("requestfinished", tab.on_request_finished)
+                if self.surfer._page is not None and self.surfer._page.viewport_size:
+                    await tab.page.set_viewport_size(self.surfer._page.viewport_size)
+                await tab.page.goto(tab.url, wait_until="load", timeout=LOAD_TIMEOUT_MS)
+            except Exception:
+                # Failed or superseded loads are counted as wasted when the tab is discarded
+                return False
+            tab.loaded_urls = {tab.url, _normalize(tab.page.url)}
+            self.stats["prefetched"] += 1
+            return True
+
+    async def _discard(self, tab, result="wasted"):
+        self._tabs.pop(tab.url, None)
+        if tab.load is not None and not tab.load.done():
+            tab.load.cancel()
+        PREFETCHED_PAGES.labels(result).inc()
+        PREFETCH_BYTES.labels(result).inc(tab.bytes)
+        if result == "wasted":
+            self.stats["wasted_bytes"] += tab.bytes
+        if tab.page is not None and result != "hit":
+            try:
+                await tab.page.close()
+            except Exception:
+                pass
+            unmark_speculative(self.surfer, tab.page)
+
+    async def refresh(self):
+        """Replace the tabs with the best links of the surfer's current page"""
+        page = self.surfer._page
+        if page is None or self.surfer._context is None:
+            return
+        self._visited.add(_normalize(page.url))
+        try:
+            links = await page.evaluate(LINKS_SCRIPT, MAX_LINKS)
+        except Exception:
+            return
+        wanted = score_links(links, _words(_goal_text(self.surfer)), page.url, self._visited)[:self.max_tabs]
+        for tab in list(self._tabs.values()):
+            if tab.url not in wanted:
+                await self._discard(tab)
+        for url in wanted:
+            if url not in self._tabs and self.spent < self.byte_budget:
+                tab = self._tabs[url] = _Tab(url)
+                tab.load = asyncio.ensure_future(self._load(tab))
+
+    def after_step(self):
+        """Start a prefetch round in the background; the previous one is superseded"""
+        if self._refresh is not None and not self._refresh.done():
+            self._refresh.cancel()
+        self._refresh = asyncio.ensure_future(self.refresh())
+
+    async def take(self, url):
+        """Swap the warm tab for url in as the surfer's page; False if there is none"""
+        tab = self._find(url)
+        if tab is None:
+            return False
+        try:
+            loaded = await asyncio.wait_for(asyncio.shield(tab.load), LOAD_TIMEOUT_MS / 1000)
+        except Exception:
+            loaded = False
+        if not loaded or tab.page is None or tab.page.is_closed():
+            await self._discard(tab)
+            return False
+        old_page = self.surfer._page
+        tab.came_from = old_page.url
+        await self._discard(tab, "hit")
+        self.stats["hits"] += 1
+        self.stats["used_bytes"] += tab.bytes
+        # From here on the page is the surfer's own: its browsing is neither prefetch spend nor free
+        tab.page.remove_listener("requestfinished", tab.on_request_finished)
+        unmark_speculative(self.surfer, tab.page, tab.bytes)
+        await tab.page.bring_to_front()
+        self.surfer._page = tab.page
+        self._swapped = tab
+        await old_page.close()
+        return True
+
+    async def close(self):
+        if self._refresh is not None:
+            self._refresh.cancel()
+        for tab in list(self._tabs.values()):
+            await self._discard(tab)
+
+    def take_stats(self):
+        """Stats since the last call, for the run summary; also starts a new byte budget"""
+        stats = dict(self.stats, hit_rate=round(self.stats["hits"] / self.stats["prefetched"], 3)
+                     if self.stats["prefetched"] else 0.0)
+        self.stats = dict.fromkeys(self.stats, 0)
+        self.spent = 0
+        return stats
+
+
+def use_prefetch(surfer):
+    """Attach a Prefetcher to the surfer; returns it"""
+    prefetcher = Prefetcher(
+        surfer,
+        max_tabs=int(os.getenv("PREFETCH_TABS", "3")),
+        concurrency=int(os.getenv("PREFETCH_CONCURRENCY", "2")),
+        byte_budget=int(float(os.getenv("PREFETCH_BUDGET_MB", "10")) * 1024 * 1024),
+    )
+    controller = surfer._playwright_controller
+    original_visit_page = controller.visit_page
+    original_click_id = controller.click_id
+    original_back = controller.back
+    original_generate_reply = surfer._generate_reply
+
+    async def visit_page(page, url):
+        if page is surfer._page and await prefetcher.take(url):
+            return True, False
+        return await original_visit_page(page, url)
+
+    async def click_id(page, identifier):
+        if page is surfer._page:
+            try:
+                href = await page.evaluate(CLICK_TARGET_SCRIPT, str(identifier))
+            except Exception:
+                href = None
+            if href and await prefetcher.take(href):
+                return None
+        return await original_click_id(page, identifier)
+
+    async def back(page):
+        # A swapped-in tab has no history of its own
+        swapped = prefetcher._swapped
+        if swapped is not None and page is swapped.page and _normalize(page.url) in swapped.loaded_urls:
+            prefetcher._swapped = None
+            await page.goto(swapped.came_from)
+            await page.wait_for_load_state()
+            return
+        await original_back(page)
+
+    async def _generate_reply(*args, **kwargs):
+        try:
+            return await original_generate_reply(*args, **kwargs)
+        finally:
+            if surfer.did_lazy_init:
+                prefetcher.after_step()
+
+    controller.visit_page = visit_page
+    controller.click_id = click_id
+    controller.back = back
+    surfer._generate_reply = _generate_reply
+    add_close_hook(surfer, lambda surfer: prefetcher.close())
+    # A relaunched browser starts without tabs or history
+    add_launch_hook(surfer, lambda surfer: prefetcher._visited.clear())
+    return prefetcher
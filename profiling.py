@@ -0,0 +1,84 @@
+import json
+import os
+from collections import defaultdict
+
+
+def _label(frame):
+    return f"{frame.function} ({frame.file_path_short}:{frame.line_no})"
+
+
+def _walk(frame, stack, folded, self_times, await_times):
+    """Collect collapsed stacks, self time per function and await time per caller"""
+    from pyinstrument.frame import AWAIT_FRAME_IDENTIFIER, SELF_TIME_FRAME_IDENTIFIER
+
+    if frame.is_synthetic:
+        caller = stack[-1] if stack else "<root>"
+        if frame.identifier == AWAIT_FRAME_IDENTIFIER:
+            await_times[caller] += frame.time
+        elif frame.identifier == SELF_TIME_FRAME_IDENTIFIER:
+            self_times[caller] += frame.time
+        folded[";".join(stack + [frame.identifier])] += frame.time
+        return
+
+    label = _label(frame)
+    stack = stack + [label]
+    remainder = frame.time - sum(child.time for child in frame.children)
+    if remainder > 0:
+        self_times[label] += remainder
+        folded[";".join(stack)] += remainder
+    for child in frame.children:
+        _walk(child, stack, folded, self_times, await_times)
+
+
+def save_profile(session, directory, top_n=20):
+    """Write a flamegraph-compatible folded file and a summary, and return the summary"""
+    folded = defaultdict(float)
+    self_times = defaultdict(float)
+    await_times = defaultdict(float)
+    root = session.root_frame()
+    if root is not None:
+        _walk(root, [], folded, self_times, await_times)
+
+    folded_path = os.path.join(directory, "profile.folded")
+    with open(folded_path, "w", encoding="utf-8") as f:
+        for stack, seconds in folded.items():
+            microseconds = int(seconds * 1_000_000)
+            if microseconds:
+                f.write(f"{stack} {microseconds}\n")
+
+    total = session.duration or 1.0
+    total_await = sum(await_times.values())
+    summary = {
+        "duration_seconds": session.duration,
+        "cpu_seconds": session.cpu_time,
+        "await_seconds": total_await,
+        "top_functions": [
+            {"function": name, "self_seconds": round(seconds, 4), "percent": round(100 * seconds / total, 1)}
+            for name, seconds in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        ],
+        "top_awaits": [
+            {"function": name, "await_seconds": round(seconds, 4), "percent": round(100 * seconds / total, 1)}
+            for name, seconds in sorted(await_times.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        ],
+        "folded_path": folded_path,
+    }
+    with open(os.path.join(directory, "profile_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+async def profile_run(coro, directory, interval=0.001):
+    """Await coro under pyinstrument and save its profile into directory.
+
+    pyinstrument is only needed when profiling is switched on, so it is
+    imported here rather than at module level.
+    """
+    from pyinstrument import Profiler
+
+    profiler = Profiler(interval=interval, async_mode="enabled")
+    profiler.start()
+    try:
+        result = await coro
+    finally:
+        profiler.stop()
+    return result, save_profile(profiler.last_session, directory)
@@ -0,0 +1,102 @@
+import contextvars
+import logging
+import threading
+from dataclasses import dataclass
+
+from autogen_core import EVENT_LOGGER_NAME, MessageHandlerContext
+from autogen_core.logging import LLMCallEvent
+
+_current_call = contextvars.ContextVar("prompt_cache_call", default=None)
+
+
+@dataclass
+class CallUsage:
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+
+@dataclass
+class PromptCacheStats:
+    """Prompt and cached-prompt token totals for one model client"""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def cached_ratio(self):
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+class CachedTokensHandler(logging.Handler):
+    """Reads cached prompt tokens from the LLMCallEvent logged by the OpenAI client.
+
+    The event is logged inside the client's create() call, so the contextvar
+    set by the caller identifies which call the numbers belong to.
+    """
+
+    def emit(self, record):
+        call = _current_call.get()
+        if call is None or not isinstance(record.msg, LLMCallEvent):
+            return
+        usage = record.msg.kwargs.get("response", {}).get("usage") or {}
+        details = usage.get("prompt_tokens_details") or {}
+        call.prompt_tokens = usage.get("prompt_tokens") or 0
+        call.cached_tokens = details.get("cached_tokens") or 0
+
+
+_handler_installed = False
+_handler_lock = threading.Lock()
+
+
+def install_cached_tokens_handler():
+    global _handler_installed
+    with _handler_lock:
+        if _handler_installed:
+            return
+        logger = logging.getLogger(EVENT_LOGGER_NAME)
+        logger.addHandler(CachedTokensHandler(level=logging.INFO))
+        if logger.getEffectiveLevel() > logging.INFO:
+            logger.setLevel(logging.INFO)
+        _handler_installed = True
+
+
+def start_call():
+    """Begin collecting cache usage for a call made in the current context"""
+    call = CallUsage()
+    return call, _current_call.set(call)
+
+
+def end_call(token):
+    _current_call.reset(token)
+
+
+def _tool_name(tool):
+    return tool["name"] if isinstance(tool, dict) else tool.schema["name"]
+
+
+class ToolSetRegistry:
+    """Keeps each agent's tool list identical from call to call.
+
+    The web surfer adds or drops its scroll tools depending on the page
+    position; since tools are sent before the messages, that changes the
+    prompt prefix. Sending the union of the tools an agent has used, sorted by
+    name, keeps the prefix byte-stable.
+    """
+
+    def __init__(self):
+        self._tools = {}
+        self._lock = threading.Lock()
+
+    def stabilize(self, tools):
+        if not tools:
+            return tools
+        try:
+            agent = MessageHandlerContext.agent_id().type
+        except RuntimeError:
+            agent = None
+        with self._lock:
+            known = self._tools.setdefault(agent, {})
+            for tool in tools:
+                known.setdefault(_tool_name(tool), tool)
+            return [known[name] for name in sorted(known)]
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute.
+
+    Reservations may drive the level negative; the caller then waits until the
+    bucket has refilled, which keeps callers in FIFO order without a queue.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount, now):
+        """Take `amount` units and return how long the caller must wait"""
+        self._refill(now)
+        self._level -= min(amount, self.capacity)
+        return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount, now):
+        """Give back units that were over-reserved (negative takes more)"""
+        self._refill(now)
+        self._level = min(self.capacity, self._level + amount)
+
+
+@dataclass
+class ThrottleStats:
+    """Counters describing how much the limiter has slowed callers down"""
+
+    requests: int = 0
+    throttled_requests: int = 0
+    throttled_wait_seconds: float = 0.0
+    rate_limit_responses: int = 0
+
+
+class RateLimiter:
+    """Process-wide requests-per-minute and tokens-per-minute limiter.
+
+    State is guarded by a threading lock so that Streamlit sessions, each
+    running their own event loop in their own thread, share one schedule.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None,
+                 base_delay=1.0, max_delay=60.0):
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = ThrottleStats()
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None and tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            self.stats.requests += 1
+            if wait > 0:
+                self.stats.throttled_requests += 1
+                self.stats.throttled_wait_seconds += wait
+            return wait
+
+    async def acquire(self, tokens=0):
+        """Wait until a request using roughly `tokens` tokens may be sent"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def adjust(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real usage of a call is known"""
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.refund(estimated_tokens - actual_tokens, time.monotonic())
+
+    def retry_delay(self, attempt):
+        """Exponential backoff with jitter, for retries that should not pause other callers"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling)
+
+    def backoff(self, attempt, retry_after=None):
+        """Pause every caller after a 429 and return the chosen delay.
+
+        Uses Retry-After when the service sends it, otherwise exponential
+        backoff; both get jitter so that sessions do not retry in lockstep.
+        """
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.base_delay)
+        else:
+            delay = self.retry_delay(attempt)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.stats.rate_limit_responses += 1
+        return delay
+
+
+def _env_float(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the limiter shared by every model client in this process"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=_env_float("AZURE_OPENAI_RPM"),
+                tokens_per_minute=_env_float("AZURE_OPENAI_TPM"),
+            )
+        return _limiter
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+from messages import MessageView
+from pipeline import RunReporter, process_with_magnetic_one
+from runs import read_summary
+from scheduler import QueueFull, get_scheduler
+
+
+class RunChannel:
+    """Append-only event log of one run that any number of subscribers can follow.
+
+    Events are numbered from 1 so a subscriber can resume after the last id it
+    saw. Publishing never waits for subscribers; each one reads at its own pace
+    from the log. Subscribers may live on other threads' event loops, so they
+    are woken with call_soon_threadsafe.
+    """
+
+    def __init__(self, run_id, task):
+        self.run_id = run_id
+        self.task = task
+        self.created_at = time.time()
+        self.events = []
+        self.done = False
+        self.result = None
+        self.outcome = None
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    def publish(self, event, data):
+        with self._lock:
+            if self.done:
+                return
+            self.events.append((len(self.events) + 1, event, data))
+            waiters = list(self._waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def finish(self, outcome, result):
+        """Publish the final "result" event and close the log"""
+        self.publish("result", {"outcome": outcome, "result": result})
+        with self._lock:
+            self.done = True
+            self.outcome = outcome
+            self.result = result
+            waiters = list(self._waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def subscribe(self, after=0, timeout=None):
+        """Yield (id, event, data) after event id `after`, ending when the run is done.
+
+        With `timeout`, None is yielded whenever no event arrived for that many
+        seconds, which lets SSE handlers send keep-alives.
+        """
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            while True:
+                with self._lock:
+                    pending = self.events[after:]
+                    done = self.done
+                    wakeup.clear()
+                for item in pending:
+                    yield item
+                after += len(pending)
+                if done and not pending:
+                    return
+                if not pending:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+class ChannelReporter(RunReporter):
+    """Publishes a run's status phases and agent messages to a RunChannel"""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def status(self, kind, text):
+        self.channel.publish("status", {"kind": kind, "text": text})
+
+    def message(self, view):
+        if view.type == "TaskResult":
+            return
+        self.channel.publish("message", view.to_event())
+
+    def warning(self, text):
+        self.channel.publish("warning", {"text": text})
+
+
+def queue_status(reporter):
+    """Scheduler on_wait callback that reports the run's place in the queue whenever it changes"""
+    last = None
+
+    def on_wait(position, queued, waited):
+        nonlocal last
+        if (position, queued) != last:
+            last = (position, queued)
+            reporter.status("processing", f"⏳ Waiting for a free slot: number {position} of {queued} in the queue")
+
+    return on_wait
+
+
+async def execute(channel, budget=None, options=None, resume_from=None, conversation=None, user=None, priority=0):
+    """Run the pipeline for channel.task once the scheduler admits it, publishing to the channel and finishing it"""
+    reporter = ChannelReporter(channel)
+    try:
+        async with get_scheduler().slot(user or "anonymous", priority, queue_status(reporter)):
+            result = await process_with_magnetic_one(
+                channel.task, reporter, budget, channel.run_id, options, resume_from, conversation
+            )
+        summary = read_summary(channel.run_id) or {}
+        channel.finish(summary.get("outcome", "completed"), result)
+    except QueueFull as e:
+        reporter.status("error", f"⛔ {e}")
+        channel.finish("rejected", f"⛔ {e}")
+    except asyncio.CancelledError:
+        channel.finish("cancelled", None)
+    except Exception as e:
+        channel.finish("error", f"Error: {e}")
+
+
+async def follow(channel, reporter):
+    """Replay a channel into a reporter until the run finishes, and return its result"""
+    async for _, event, data in channel.subscribe():
+        if event == "status":
+            reporter.status(data["kind"], data["text"])
+        elif event == "message":
+            reporter.message(MessageView.from_event(data))
+        elif event == "warning":
+            reporter.warning(data["text"])
+    return channel.result
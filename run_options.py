@@ -0,0 +1,29 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class RunOptions:
+    """Per-request switches for how a run is executed"""
+
+    stable_prefix: bool = False
+    page_index: bool = True
+    # "text" works from the page text and element list, taking screenshots only where needed
+    surfer_mode: str = "multimodal"
+    # Adds FileSurfer, Coder and ComputerTerminal, running code on the pre-warmed code pool
+    coding_agents: bool = False
+    # Loads the likeliest next pages in background tabs while the orchestrator thinks
+    prefetch: bool = False
+    # Estimated prompt tokens above which old screenshots and turns are dropped; 0 turns compaction off
+    context_budget: int = 30000
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            stable_prefix=os.getenv("PROMPT_STABLE_PREFIX", "0") == "1",
+            page_index=os.getenv("PAGE_INDEX", "1") == "1",
+            surfer_mode=os.getenv("SURFER_MODE", "multimodal"),
+            coding_agents=os.getenv("CODING_AGENTS", "0") == "1",
+            prefetch=os.getenv("PREFETCH", "0") == "1",
+            context_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "30000")),
+        )
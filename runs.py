@@ -0,0 +1,30 @@
+import json
+import os
+import uuid
+
+RUNS_DIR = os.getenv("RUNS_DIR", "./runs")
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
+
+
+def run_dir(run_id):
+    """Directory holding the artifacts of one run, created on first use"""
+    path = os.path.join(RUNS_DIR, run_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_summary(run_id, summary):
+    """Save the run's summary (usage, peaks, outcome) as summary.json"""
+    with open(os.path.join(run_dir(run_id), "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, default=str)
+
+
+def read_summary(run_id):
+    path = os.path.join(RUNS_DIR, run_id, "summary.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import Counter as Tally
+from dataclasses import dataclass
+
+from prometheus_client import Counter, Histogram
+
+from metrics import QUEUE_DEPTH, RUN_BUCKETS
+
+PRIORITIES = {"low": -1, "normal": 0, "high": 1}
+
+QUEUE_WAIT = Histogram("magentic_queue_wait_seconds", "Time runs waited for a free slot", buckets=RUN_BUCKETS)
+REJECTED_RUNS = Counter("magentic_runs_rejected", "Runs rejected because the queue was full", ["limit"])
+
+
+class QueueFull(Exception):
+    """Raised when a run cannot start now and cannot be queued either"""
+
+    def __init__(self, message, limit):
+        super().__init__(message)
+        self.limit = limit
+
+
+@dataclass(eq=False)
+class _Waiter:
+    user: str
+    priority: int
+    enqueued: float
+    loop: object
+    future: object
+
+
+class Scheduler:
+    """Admits runs under global and per-user concurrency limits, queueing the rest.
+
+    A freed slot goes to the waiter with the highest priority, where waiting
+    `aging` seconds counts as one priority level so low-priority runs are not
+    starved. Ties go to the user with the fewest runs in progress, then to the
+    oldest request. Runs that would have to wait are rejected once the queue
+    (or the user's share of it) is full. Waiters may be on any thread's event
+    loop. A limit of 0 means unlimited.
+    """
+
+    def __init__(self, max_runs=4, max_runs_per_user=2, max_queue=20, max_queued_per_user=5, aging=60.0):
+        self.max_runs = max_runs
+        self.max_runs_per_user = max_runs_per_user
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.aging = aging
+        self._running = Tally()
+        self._waiting = []
+        self._lock = threading.Lock()
+
+    def _can_start(self, user):
+        if self.max_runs and sum(self._running.values()) >= self.max_runs:
+            return False
+        return not self.max_runs_per_user or self._running[user] < self.max_runs_per_user
+
+    def _check(self, user):
+        if self.max_queue and len(self._waiting) >= self.max_queue:
+            REJECTED_RUNS.labels("queue").inc()
+            raise QueueFull(f"The server is busy: {len(self._waiting)} runs are already waiting. "
+                            "Please try again in a few minutes.", "queue")
+        queued = sum(1 for waiter in self._waiting if waiter.user == user)
+        if self.max_queued_per_user and queued >= self.max_queued_per_user:
+            REJECTED_RUNS.labels("user_queue").inc()
+            raise QueueFull(f"You already have {queued} runs waiting. Wait for one of them to start.", "user_queue")
+
+    def check(self, user):
+        """Raise QueueFull if a run of user's would be rejected right now"""
+        with self._lock:
+            if self._waiting or not self._can_start(user):
+                self._check(user)
+
+    def _order(self, now):
+        return sorted(self._waiting, key=lambda waiter: (
+            -(waiter.priority + (now - waiter.enqueued) / self.aging),
+            self._running[waiter.user],
+            waiter.enqueued,
+        ))
+
+    def _dispatch(self):
+        """Grant slots to waiters while any can start; call with the lock held"""
+        while True:
+            waiter = next((waiter for waiter in self._order(time.monotonic()) if self._can_start(waiter.user)), None)
+            if waiter is None:
+                break
+            self._waiting.remove(waiter)
+            try:
+                waiter.loop.call_soon_threadsafe(_grant, waiter.future)
+            except RuntimeError:
+                # The waiter's event loop has been closed
+                continue
+            self._running[waiter.user] += 1
+        QUEUE_DEPTH.set(len(self._waiting))
+
+    def position(self, waiter):
+        """1-based place of waiter in the current order, and the queue length"""
+        with self._lock:
+            order = self._order(time.monotonic())
+            return (order.index(waiter) + 1 if waiter in order else 0), len(order)
+
+    async def acquire(self, user, priority=0, on_wait=None):
+        """Wait for a slot; on_wait(position, queued, waited_seconds) is called about once a second"""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(user, priority, time.monotonic(), loop, loop.create_future())
+        with self._lock:
+            if self._waiting or not self._can_start(user):
+                self._check(user)
+            self._waiting.append(waiter)
+            self._dispatch()
+        try:
+            while not waiter.future.done():
+                if on_wait is not None:
+                    position, queued = self.position(waiter)
+                    on_wait(position, queued, time.monotonic() - waiter.enqueued)
+                await asyncio.wait([waiter.future], timeout=1.0)
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiting:
+                    self._waiting.remove(waiter)
+                    QUEUE_DEPTH.set(len(self._waiting))
+                    raise
+            # The slot was granted as the wait was cancelled
+            self.release(user)
+            raise
+        QUEUE_WAIT.observe(time.monotonic() - waiter.enqueued)
+
+    def release(self, user):
+        with self._lock:
+            self._running[user] -= 1
+            if self._running[user] <= 0:
+                del self._running[user]
+            self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user, priority=0, on_wait=None):
+        await self.acquire(user, priority, on_wait)
+        try:
+            yield
+        finally:
+            self.release(user)
+
+    def snapshot(self):
+        """Runs in progress and waiting, overall and by user"""
+        with self._lock:
+            return {
+                "running": sum(self._running.values()),
+                "queued": len(self._waiting),
+                "running_by_user": dict(self._running),
+                "queued_by_user": dict(Tally(waiter.user for waiter in self._waiting)),
+            }
+
+
+def _grant(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _env_limit(name, default):
+    value = float(os.getenv(name, default))
+    return math.ceil(value) if value > 0 else 0
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                max_runs=_env_limit("SCHEDULER_MAX_RUNS", "4"),
+                max_runs_per_user=_env_limit("SCHEDULER_MAX_RUNS_PER_USER", "2"),
+                max_queue=_env_limit("SCHEDULER_MAX_QUEUE", "20"),
+                max_queued_per_user=_env_limit("SCHEDULER_MAX_QUEUED_PER_USER", "5"),
+                aging=float(os.getenv("SCHEDULER_AGING_SECONDS", "60")),
+            )
+        return _scheduler
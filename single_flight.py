@@ -0,0 +1,41 @@
+import os
+import threading
+
+from prometheus_client import Counter
+
+COALESCED_RUNS = Counter("magentic_runs_coalesced", "Submissions attached to an identical run already in progress")
+
+
+def normalize_task(task):
+    """Case, spacing and trailing punctuation do not make two tasks different"""
+    return " ".join(task.lower().split()).rstrip(".?! ")
+
+
+class SingleFlight:
+    """At most one run in progress per normalized task (and budget/options).
+
+    Later identical submissions get the RunChannel of the run already in
+    flight; subscribing to it from the first event replays what they missed.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def run(self, task, start, *key_parts):
+        """Return (channel, True) if start() launched a new run, or (channel, False) if attached to one"""
+        if not self.enabled:
+            return start(), True
+        key = (normalize_task(task),) + tuple(repr(part) for part in key_parts)
+        with self._lock:
+            self._runs = {key: channel for key, channel in self._runs.items() if not channel.done}
+            channel = self._runs.get(key)
+            if channel is not None:
+                COALESCED_RUNS.inc()
+                return channel, False
+            channel = self._runs[key] = start()
+            return channel, True
+
+
+single_flight = SingleFlight(enabled=os.getenv("COALESCE_RUNS", "1") == "1")
@@ -2,16 +2,36 @@ import streamlit as st
 import asyncio
 import sys
 import atexit
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
-from autogen_agentchat.teams import MagenticOneGroupChat
-from autogen_ext.agents.web_surfer import MultimodalWebSurfer
 import os
 from dotenv import load_dotenv
 import threading
 from datetime import datetime
 import time
+import uuid
+from dataclasses import replace
+from budgets import RunBudget
+from checkpoints import is_resumable, list_checkpoints, read_meta
+from conversations import get_conversations
+from messages import image_refs
+from pipeline import RunReporter, process_with_magnetic_one
+from run_channel import RunChannel, execute, follow
+from single_flight import single_flight
+from worker_pool import get_worker_pool
+from rate_limiter import get_rate_limiter
+import metrics
+from tracing import setup_tracing
+from runs import new_run_id, run_dir, read_summary
+from run_options import RunOptions
+from transcripts import FORMATS, export_filename, export_transcript, transcript_path
+from scheduler import PRIORITIES, get_scheduler
+from profiling import profile_run
+from memory_watchdog import get_watchdog
+from code_pool import get_code_pool
+from ui_styles import APP_CSS, HEADER_HTML, IDLE_OUTPUT, WELCOME_HTML
 
 load_dotenv()
+metrics.start_metrics_server()
+setup_tracing()
 
 # Configure page
 st.set_page_config(
@@ -22,121 +42,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better styling
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        padding: 2rem 0;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border-radius: 15px;
-        margin-bottom: 2rem;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-    }
-    
-    .user-message {
-        background: linear-gradient(135deg, #007bff, #0056b3);
-        color: white;
-        padding: 1rem 1.5rem;
-        border-radius: 20px 20px 5px 20px;
-        margin: 1rem 0;
-        margin-left: 3rem;
-        box-shadow: 0 3px 10px rgba(0,123,255,0.3);
-        animation: slideInRight 0.3s ease;
-    }
-    
-    .assistant-message {
-        background: linear-gradient(145deg, #ffffff, #f8f9fa);
-        color: #333;
-        padding: 1rem 1.5rem;
-        border-radius: 20px 20px 20px 5px;
-        margin: 1rem 0;
-        margin-right: 3rem;
-        box-shadow: 0 3px 10px rgba(0,0,0,0.1);
-        border-left: 4px solid #28a745;
-        animation: slideInLeft 0.3s ease;
-    }
-    
-    .status-success {
-        background: linear-gradient(135deg, #28a745, #20c997);
-        color: white;
-        padding: 0.8rem 1.2rem;
-        border-radius: 25px;
-        margin: 0.5rem 0;
-        text-align: center;
-        font-weight: bold;
-        box-shadow: 0 2px 8px rgba(40,167,69,0.3);
-    }
-    
-    .status-processing {
-        background: linear-gradient(135deg, #ffc107, #fd7e14);
-        color: white;
-        padding: 0.8rem 1.2rem;
-        border-radius: 25px;
-        margin: 0.5rem 0;
-        text-align: center;
-        font-weight: bold;
-        animation: pulse 1.5s infinite;
-    }
-    
-    .status-error {
-        background: linear-gradient(135deg, #dc3545, #c82333);
-        color: white;
-        padding: 0.8rem 1.2rem;
-        border-radius: 25px;
-        margin: 0.5rem 0;
-        text-align: center;
-        font-weight: bold;
-        box-shadow: 0 2px 8px rgba(220,53,69,0.3);
-    }
-    
-    .output-container {
-        background: linear-gradient(145deg, #1e1e1e, #2d2d2d);
-        color: #00ff00;
-        padding: 1rem;
-        border-radius: 10px;
-        font-family: 'Courier New', monospace;
-        font-size: 0.85rem;
-        max-height: 400px;
-        overflow-y: auto;
-        border: 1px solid #444;
-        white-space: pre-wrap;
-    }
-    
-    @keyframes slideInRight {
-        from { transform: translateX(100%); opacity: 0; }
-        to { transform: translateX(0); opacity: 1; }
-    }
-    
-    @keyframes slideInLeft {
-        from { transform: translateX(-100%); opacity: 0; }
-        to { transform: translateX(0); opacity: 1; }
-    }
-    
-    @keyframes pulse {
-        0%, 100% { transform: scale(1); }
-        50% { transform: scale(1.05); }
-    }
-    
-    .metric-card {
-        background: linear-gradient(145deg, #ffffff, #f1f3f4);
-        padding: 1rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        border-left: 4px solid #007bff;
-        margin: 0.5rem 0;
-    }
-    
-    .welcome-container {
-        text-align: center; 
-        padding: 2rem; 
-        color: #666;
-        background: linear-gradient(145deg, #f8f9fa, #ffffff);
-        border-radius: 15px;
-        margin: 2rem 0;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
@@ -148,156 +54,178 @@ if "is_processing" not in st.session_state:
     st.session_state.is_processing = False
 if "processing_logs" not in st.session_state:
     st.session_state.processing_logs = []
+if "budget" not in st.session_state:
+    st.session_state.budget = RunBudget.from_env()
+if "last_profile" not in st.session_state:
+    st.session_state.last_profile = None
+if "options" not in st.session_state:
+    st.session_state.options = RunOptions.from_env()
+if "last_run_id" not in st.session_state:
+    st.session_state.last_run_id = None
+if "resume_from" not in st.session_state:
+    st.session_state.resume_from = None
+if "live_run" not in st.session_state:
+    st.session_state.live_run = None
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = None
+if "user_id" not in st.session_state:
+    # Each browser session counts as one user for the scheduler's fair share
+    st.session_state.user_id = uuid.uuid4().hex
 
-async def process_with_magnetic_one(user_input, status_placeholder, output_placeholder):
-    """Process user input with MagenticOne"""
-    surfer = None
+class LiveRun:
+    """A session's run in progress: written by its thread, read by the live monitor fragment"""
+
+    def __init__(self):
+        self.status = ("processing", "🚀 Starting...")
+        self.output_text = ""
+        self.images = []
+        self.warnings = []
+        self.run_id = None
+        self.profile = None
+        self.result = None
+        self.done = False
+
+
+class StreamlitReporter(RunReporter):
+    """Records a run's status and agent output in its LiveRun for the monitor to render"""
+
+    def __init__(self, live):
+        self.live = live
+
+    def status(self, kind, text):
+        self.live.status = (kind, text)
+
+    def message(self, view):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.live.images.extend(view.images)
+        
+        # Keep the last 2000 characters to prevent overflow
+        self.live.output_text = (self.live.output_text + f"[{timestamp}] {view.line()}\n")[-2000:]
+
+    def warning(self, text):
+        self.live.warnings.append(text)
+
+def render_screenshots(refs, index):
+    """Screenshots of a run; thumbnails are only made once the user asks for them"""
+    with st.expander(f"📷 {len(refs)} screenshot{'s' if len(refs) > 1 else ''}"):
+        if not st.toggle("Load thumbnails", key=f"thumbnails_{index}"):
+            return
+        thumbnails = [thumbnail for thumbnail in map(image_refs.thumbnail, refs) if thumbnail]
+        if thumbnails:
+            st.image(thumbnails, width=160)
+        else:
+            st.caption("These screenshots are no longer kept.")
+
+def run_magnetic_one_async(live, user_input, user, priority, budget=None, profile=False, options=None, resume_from=None, conversation_id=None):
+    """Run MagenticOne on this (background) thread, reporting into live; never touches st.session_state"""
     try:
-        # Update status
-        status_placeholder.markdown("""
-        <div class="status-processing">
-            🔄 Initializing Azure OpenAI client...
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Initialize model client
-        model_client = AzureOpenAIChatCompletionClient(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_KEY"),
-            azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            api_version=os.getenv("AZURE_API_VERSION")
-        )
-        
-        # Update status
-        status_placeholder.markdown("""
-        <div class="status-processing">
-            🌐 Starting MultimodalWebSurfer...
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Initialize web surfer
-        surfer = MultimodalWebSurfer(
-            "MultimodalWebSurfer",
-            model_client=model_client,
-            downloads_folder="./downs",
-            debug_dir="./debug",
-            headless=True,  # Headless for Streamlit
-            to_resize_viewport=True,
-            description="A web surfing assistant that can browse and interact with web pages.",
-            start_page="https://www.bing.com",
-            animate_actions=False,
-            browser_data_dir="./browser_data",
-        )
-        
-        # Update status
-        status_placeholder.markdown("""
-        <div class="status-processing">
-            🤖 Creating MagenticOne team...
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Create team
-        team = MagenticOneGroupChat([surfer], model_client=model_client)
-        
-        # Update status
-        status_placeholder.markdown("""
-        <div class="status-processing">
-            ✨ Processing your request...
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Process the request
-        result_parts = []
-        output_text = ""
-        
-        async for message in team.run_stream(task=user_input):
-            # Capture output
-            message_str = str(message)
-            result_parts.append(message_str)
+        # Create new event loop for this thread
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
+        reporter = StreamlitReporter(live)
+        
+        if conversation_id:
+            # Conversations run on their own loop so the browser outlives this thread's loop
+            conversation = get_conversations().get(conversation_id)
+            channel = RunChannel(new_run_id(), user_input)
+            live.run_id = channel.run_id
+            conversation.submit(channel, budget, options, user, priority)
+            live.result = loop.run_until_complete(follow(channel, reporter))
+            return
+        
+        if profile:
+            # Profiled runs always execute here, on their own
+            run_id = live.run_id = new_run_id()
             
-            # Create a formatted output display
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            output_text += f"[{timestamp}] {message_str}\n"
+            async def run():
+                async with get_scheduler().slot(user, priority):
+                    return await process_with_magnetic_one(user_input, reporter, budget, run_id, options, resume_from)
             
-            # Update output display (keep last 2000 characters to prevent overflow)
-            display_text = output_text[-2000:] if len(output_text) > 2000 else output_text
-            output_placeholder.markdown(f"""
-            <div class="output-container">{display_text}</div>
-            """, unsafe_allow_html=True)
+            live.result, live.profile = loop.run_until_complete(profile_run(run(), run_dir(run_id)))
+            return
         
-        # Final result
-        final_result = "\n".join(result_parts) if result_parts else "Task completed successfully!"
+        # New runs go to a worker process when the pool is enabled, else run on this thread's loop
+        pool = get_worker_pool()
         
-        # Update status to success
-        status_placeholder.markdown("""
-        <div class="status-success">
-            ✅ Task completed successfully!
-        </div>
-        """, unsafe_allow_html=True)
+        def start():
+            if pool is not None:
+                return pool.submit(user_input, budget, options, resume_from, user, priority)
+            return RunChannel(new_run_id(), user_input)
         
-        return final_result
+        # Join an identical task already in progress in any session instead of starting it again
+        if resume_from:
+            channel, leader = start(), True
+        else:
+            channel, leader = single_flight.run(user_input, start, budget, options)
+        live.run_id = channel.run_id
+        if pool is None and leader:
+            loop.create_task(execute(channel, budget, options, resume_from, user=user, priority=priority))
+        live.result = loop.run_until_complete(follow(channel, reporter))
         
     except Exception as e:
-        error_msg = f"Error: {str(e)}"
-        status_placeholder.markdown(f"""
-        <div class="status-error">
-            ❌ {error_msg}
-        </div>
-        """, unsafe_allow_html=True)
-        return error_msg
-        
+        live.result = f"I encountered an error: {str(e)}"
     finally:
-        # Cleanup
-        try:
-            if surfer:
-                if hasattr(surfer, 'close'):
-                    await surfer.close()
-                elif hasattr(surfer, '_browser') and surfer._browser:
-                    await surfer._browser.close()
-        except Exception as cleanup_error:
-            st.warning(f"Cleanup warning: {cleanup_error}")
-        
         # Cancel remaining tasks
         try:
-            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            tasks = asyncio.all_tasks(loop)
             for task in tasks:
                 task.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            await asyncio.sleep(0.1)
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(asyncio.sleep(0.1))
         except:
             pass
-
-def run_magnetic_one_async(user_input, status_placeholder, output_placeholder):
-    """Run MagenticOne in a separate thread"""
-    try:
-        # Create new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Run the async function
-        result = loop.run_until_complete(
-            process_with_magnetic_one(user_input, status_placeholder, output_placeholder)
-        )
-        
-        return result
-        
-    except Exception as e:
-        return f"Thread error: {str(e)}"
-    finally:
         try:
             loop.close()
         except:
             pass
+        live.done = True
 
-def main():
-    # Header
-    st.markdown("""
-    <div class="main-header">
-        <h1>🤖 MagenticOne AI Assistant</h1>
-        <p>Powered by Azure OpenAI • Web Browsing • Multi-Agent Collaboration</p>
+def render_monitor():
+    """Status and output panels; while a run is in progress they refresh on their own, without the rest of the page"""
+    live = st.session_state.live_run
+    if live is None:
+        kind, text, output = "success", "💭 Ready for your next request...", IDLE_OUTPUT
+    else:
+        (kind, text), output = live.status, live.output_text
+        for warning in live.warnings:
+            st.warning(warning)
+    st.markdown(f"""
+    <div class="status-{kind}">
+        {text}
     </div>
     """, unsafe_allow_html=True)
+    
+    st.subheader("🔍 Output Monitor")
+    st.markdown(f"""
+    <div class="output-container">{output}</div>
+    """, unsafe_allow_html=True)
+    
+    if live is not None and live.done:
+        # Put the answer into the chat
+        st.rerun()
+
+def finish_run(live):
+    """Move a finished run's answer and artifacts into the session"""
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": live.result or "The run ended without a result.",
+        "images": list(live.images)
+    })
+    st.session_state.last_run_id = live.run_id or st.session_state.last_run_id
+    if live.profile is not None:
+        st.session_state.last_profile = live.profile
+    st.session_state.live_run = None
+    st.session_state.resume_from = None
+    st.session_state.is_processing = False
+
+def main():
+    # A run that finished since the last full rerun goes into the chat first, so every panel sees it
+    if st.session_state.live_run is not None and st.session_state.live_run.done:
+        finish_run(st.session_state.live_run)
+    
+    # Header
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
 
     # Sidebar
     with st.sidebar:
@@ -330,15 +258,145 @@ def main():
         st.metric("Messages", len(st.session_state.messages))
         st.metric("Processing", "Yes" if st.session_state.is_processing else "No")
         
+        # Shared Azure OpenAI rate limiter
+        throttle = get_rate_limiter().stats
+        st.metric("Throttled wait", f"{throttle.throttled_wait_seconds:.1f}s",
+                  help=f"{throttle.throttled_requests} of {throttle.requests} model calls waited; "
+                       f"{throttle.rate_limit_responses} rate-limit responses")
+        
+        # Memory watchdog
+        watchdog = get_watchdog()
+        st.metric("Memory", f"{watchdog.total_rss / 2**20:.0f} MB", delta=watchdog.state, delta_color="off",
+                  help=f"App {watchdog.app_rss / 2**20:.0f} MB, browsers {watchdog.browser_rss / 2**20:.0f} MB")
+        
+        st.divider()
+        
+        # Budgets
+        st.subheader("⏱️ Run Budgets")
+        budget = st.session_state.budget
+        budget.max_turns = st.number_input("Max orchestrator turns", min_value=1, value=budget.max_turns)
+        budget.max_stalls = st.number_input("Max stalls", min_value=1, value=budget.max_stalls)
+        budget.max_navigations = st.number_input("Max page navigations (0 = unlimited)", min_value=0, value=budget.max_navigations or 0) or None
+        budget.max_download_bytes = st.number_input("Max bytes downloaded (0 = unlimited)", min_value=0, value=budget.max_download_bytes or 0, step=1_000_000) or None
+        budget.max_tokens = st.number_input("Max tokens (0 = unlimited)", min_value=0, value=budget.max_tokens or 0, step=10_000) or None
+        
+        st.divider()
+        
+        # Scheduling
+        st.subheader("🚦 Queue")
+        st.select_slider("Priority", options=list(PRIORITIES), value="normal", key="priority",
+                         help="Waiting runs with a higher priority start first")
+        queue = get_scheduler().snapshot()
+        st.caption(f"{queue['running']} runs in progress, {queue['queued']} waiting")
+        
+        st.divider()
+        
+        # Model client options
+        st.subheader("🧩 Model Calls")
+        options = st.session_state.options
+        options.stable_prefix = st.toggle("Stable prompt prefix", value=options.stable_prefix,
+                                          help="Keep the fixed part of every prompt byte-identical so Azure OpenAI prompt caching can reuse it")
+        options.surfer_mode = "text" if st.toggle("Text-only surfer", value=options.surfer_mode == "text",
+                                                  help="Read pages from their text and element list, and send screenshots only for pages that need them") else "multimodal"
+        options.context_budget = st.number_input("Context budget (tokens)", min_value=0, step=5000,
+                                                 value=options.context_budget,
+                                                 help="Drop old screenshots and turns from prompts above this size; 0 turns it off")
+        options.prefetch = st.toggle("Prefetch likely next pages", value=options.prefetch,
+                                     help="Load the best-matching links of the surfer's page in background tabs while the team thinks")
+        options.page_index = st.toggle("Search visited pages first", value=options.page_index,
+                                       help="Index the text of every visited page and let the team answer from it before browsing")
+        options.coding_agents = st.toggle("Coding agents", value=options.coding_agents,
+                                          help="Add FileSurfer, Coder and ComputerTerminal; code runs on pre-warmed, sandboxed workers")
+        if options.coding_agents:
+            # Starts warming the code workers before the first run needs them
+            get_code_pool()
+        last_run = read_summary(st.session_state.last_run_id) if st.session_state.last_run_id else None
+        if last_run:
+            st.caption(f"Last run: {last_run['model_calls']} calls, {last_run['prompt_tokens']} prompt tokens, "
+                       f"{last_run['cached_ratio']:.0%} cached, peak browser memory "
+                       f"{last_run['peak_browser_rss'] / 2**20:.0f} MB")
+            for mode, stats in last_run.get("surfer_modes", {}).items():
+                st.caption(f"Surfer {mode}: {stats['steps']} steps, {stats['seconds'] / stats['steps']:.1f}s each, "
+                           f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens")
+        
+        st.divider()
+
+        # Transcript export
+        last_run_id = st.session_state.last_run_id
+        if last_run_id and os.path.exists(transcript_path(last_run_id)):
+            st.subheader("📜 Transcript")
+            transcript_format = st.radio("Format", list(FORMATS), horizontal=True, key="transcript_format")
+            # Built only when clicked; Streamlit holds the compressed file, never the plain transcript
+            st.download_button("⬇️ Download transcript (.gz)",
+                               lambda: b"".join(export_transcript(last_run_id, transcript_format)),
+                               file_name=export_filename(last_run_id, transcript_format),
+                               mime="application/gzip", use_container_width=True)
+            st.divider()
+        
+        # Conversation
+        st.subheader("💬 Conversation")
+        keep_conversation = st.toggle("Keep conversation", key="keep_conversation",
+                                      help="Keep the team, its context and the open browser page between messages")
+        conversation_id = st.session_state.conversation_id
+        conversation = get_conversations().peek(conversation_id) if conversation_id else None
+        if conversation_id and not keep_conversation:
+            get_conversations().end(conversation_id)
+            st.session_state.conversation_id = None
+        elif conversation is not None:
+            st.caption(f"{conversation.runs} messages so far" + (f", on {conversation.url}" if conversation.url else ""))
+            if st.button("⏹️ End conversation", use_container_width=True, disabled=st.session_state.is_processing):
+                get_conversations().end(conversation_id)
+                st.session_state.conversation_id = None
+                st.rerun()
+        
+        st.divider()
+        
+        # Checkpoints
+        st.subheader("💾 Checkpoints")
+        st.toggle("Follow up on last run", key="follow_up",
+                  help="Give the next message to the last finished run's team instead of starting from scratch")
+        resumable = [meta for meta in list_checkpoints() if is_resumable(meta)][:5]
+        for meta in resumable:
+            label = meta["task"] if len(meta["task"]) <= 40 else meta["task"][:40] + "..."
+            if st.button(f"▶️ {label}", key=f"resume_{meta['run_id']}", use_container_width=True,
+                         help=f"Resume after turn {meta['turns']} ({meta['status']})",
+                         disabled=st.session_state.is_processing):
+                st.session_state.resume_from = meta["run_id"]
+                st.session_state.messages.append({"role": "user", "content": f"↩️ Resume: {meta['task']}"})
+                st.session_state.is_processing = True
+                st.rerun()
+        if not resumable:
+            st.caption("No interrupted runs")
+        
+        st.divider()
+        
+        # Profiling
+        st.subheader("🐞 Debug")
+        st.toggle("Profile runs", key="profile_runs",
+                  help="Run each request under a sampling profiler (CPU time and asyncio waits)")
+        profile = st.session_state.last_profile
+        if profile:
+            st.caption(f"Last profile: {profile['duration_seconds']:.1f}s wall, "
+                       f"{profile['cpu_seconds']:.1f}s CPU, {profile['await_seconds']:.1f}s awaiting")
+            st.dataframe(profile["top_functions"], hide_index=True, use_container_width=True)
+            with open(profile["folded_path"], "rb") as folded_file:
+                st.download_button("⬇️ Flamegraph (folded stacks)", folded_file.read(),
+                                   file_name="profile.folded", use_container_width=True)
+        
         st.divider()
         
         # Controls
         if st.button("🗑️ Clear Chat", use_container_width=True, type="secondary"):
+            if st.session_state.conversation_id:
+                get_conversations().end(st.session_state.conversation_id)
+                st.session_state.conversation_id = None
             st.session_state.messages = []
             st.session_state.processing_logs = []
             st.rerun()
         
         if st.button("🔄 Reset Session", use_container_width=True, type="secondary"):
+            if st.session_state.conversation_id:
+                get_conversations().end(st.session_state.conversation_id)
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
@@ -354,20 +412,9 @@ def main():
         
         with chat_container:
             if not st.session_state.messages:
-                st.markdown("""
-                <div class="welcome-container">
-                    <h3>👋 Welcome to MagenticOne!</h3>
-                    <p>Ask me anything and I'll help you with web research, analysis, and more.</p>
-                    <p><strong>Try asking:</strong></p>
-                    <ul style="text-align: left; max-width: 400px; margin: 0 auto;">
-                        <li>"Summarize the latest AI research papers"</li>
-                        <li>"What's trending in technology today?"</li>
-                        <li>"Find information about quantum computing"</li>
-                    </ul>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(WELCOME_HTML, unsafe_allow_html=True)
             else:
-                for message in st.session_state.messages:
+                for index, message in enumerate(st.session_state.messages):
                     if message["role"] == "user":
                         st.markdown(f"""
                         <div class="user-message">
@@ -382,35 +429,14 @@ def main():
                             {message["content"]}
                         </div>
                         """, unsafe_allow_html=True)
+                        if message.get("images"):
+                            render_screenshots(message["images"], index)
     
     with col2:
         st.header("📊 Processing Status")
         
-        # Status display
-        status_container = st.empty()
-        
-        st.subheader("🔍 Output Monitor")
-        output_container = st.empty()
-        
-        if not st.session_state.is_processing:
-            status_container.markdown("""
-            <div class="status-success">
-                💭 Ready for your next request...
-            </div>
-            """, unsafe_allow_html=True)
-            
-            output_container.markdown("""
-            <div class="output-container">Waiting for processing to begin...
-
-This monitor will show real-time output from the AI agents
-as they work on your request.
-
-You'll see:
-• Agent initialization
-• Web browsing activities  
-• AI reasoning processes
-• Task completion status</div>
-            """, unsafe_allow_html=True)
+        # Only this fragment reruns while a run is in progress
+        st.fragment(run_every=1.0 if st.session_state.is_processing else None)(render_monitor)()
 
     # Chat input at the bottom
     if user_input := st.chat_input(
@@ -423,38 +449,52 @@ You'll see:
             "content": user_input
         })
         
+        # Refuse new runs while memory is above the high-water mark
+        admitted, reason = get_watchdog().admit()
+        if not admitted:
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": f"The server is low on memory ({reason}). Please try again in a few minutes."
+            })
+            st.rerun()
+        
+        # Keep the team and browser between messages, or continue the last run's checkpoint
+        last_run_id = st.session_state.last_run_id
+        if st.session_state.get("keep_conversation"):
+            st.session_state.conversation_id = st.session_state.conversation_id or new_run_id()
+        elif st.session_state.get("follow_up") and last_run_id:
+            last_checkpoint = read_meta(last_run_id)
+            if last_checkpoint and last_checkpoint["status"] == "finished":
+                st.session_state.resume_from = last_run_id
+        
         # Set processing state
         st.session_state.is_processing = True
         st.rerun()
 
-    # Process the request if we're in processing state
-    if st.session_state.is_processing and st.session_state.messages:
+    # Start the request in the background; the monitor fragment follows it
+    if st.session_state.is_processing and st.session_state.live_run is None and st.session_state.messages:
         latest_message = st.session_state.messages[-1]
         
         if latest_message["role"] == "user":
-            try:
-                # Process in background thread
-                result = run_magnetic_one_async(
-                    latest_message["content"],
-                    status_container,
-                    output_container
-                )
-                
-                # Add response
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": result
-                })
-                
-            except Exception as e:
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": f"I encountered an error: {str(e)}"
-                })
-            
-            finally:
-                st.session_state.is_processing = False
-                st.rerun()
+            live = st.session_state.live_run = LiveRun()
+            threading.Thread(
+                target=run_magnetic_one_async,
+                args=(live, latest_message["content"], st.session_state.user_id,
+                      PRIORITIES[st.session_state.get("priority", "normal")]),
+                kwargs=dict(
+                    # Copies: the sidebar keeps editing the session's objects while the run is in progress
+                    budget=replace(st.session_state.budget),
+                    profile=st.session_state.get("profile_runs", False),
+                    options=replace(st.session_state.options),
+                    resume_from=st.session_state.resume_from,
+                    conversation_id=st.session_state.conversation_id if st.session_state.get("keep_conversation") else None,
+                ),
+                name="magentic-run",
+                daemon=True,
+            ).start()
+            st.rerun()
+        else:
+            st.session_state.is_processing = False
 
 if __name__ == "__main__":
     main()
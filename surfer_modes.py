@@ -0,0 +1,162 @@
+import functools
+import io
+import time
+from dataclasses import asdict, dataclass
+
+from PIL import Image
+from prometheus_client import Counter, Histogram
+
+from model_client import ChatCompletionClientWrapper
+
+MODES = ("text", "multimodal")
+MIN_TEXT_CHARS = 200
+# Share of the viewport that canvas, video or embedded content may cover before a screenshot is needed
+MAX_VISUAL_SHARE = 0.3
+SCREENSHOT_SENTENCE = "\nHere is a screenshot of the page."
+
+STEP_DURATION = Histogram("magentic_surfer_step_duration_seconds", "Surfer step latency by mode", ["mode"],
+                          buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, float("inf")))
+SURFER_TOKENS = Counter("magentic_surfer_tokens", "Surfer model tokens by mode", ["mode", "kind"])
+MODE_FALLBACKS = Counter("magentic_surfer_text_fallbacks", "Text-mode steps that needed a screenshot", ["reason"])
+
+# Reads how much of the page is text and how much is visual-only content
+PROBE_SCRIPT = """() => {
+    const viewport = window.innerWidth * window.innerHeight || 1;
+    let visual = 0;
+    for (const el of document.querySelectorAll("canvas, video, embed, object, iframe")) {
+        const r = el.getBoundingClientRect();
+        const w = Math.max(0, Math.min(r.right, window.innerWidth) - Math.max(r.left, 0));
+        const h = Math.max(0, Math.min(r.bottom, window.innerHeight) - Math.max(r.top, 0));
+        visual += w * h;
+    }
+    return {
+        contentType: document.contentType,
+        textLength: document.body ? document.body.innerText.trim().length : 0,
+        visualShare: visual / viewport,
+    };
+}"""
+
+
+@dataclass
+class ModeStats:
+    steps: int = 0
+    seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class SurferModeClient(ChatCompletionClientWrapper):
+    """The surfer's model client: hides vision while the surfer works from text, and counts tokens per mode"""
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.mode = "multimodal"
+        self.stats = {mode: ModeStats() for mode in MODES}
+
+    @property
+    def model_info(self):
+        info = dict(self._client.model_info)
+        if self.mode == "text":
+            # The surfer then prompts with the page text and element list instead of a screenshot
+            info["vision"] = False
+        return info
+
+    async def create(self, messages, **kwargs):
+        result = await self._client.create(messages, **kwargs)
+        stats = self.stats[self.mode]
+        stats.prompt_tokens += result.usage.prompt_tokens
+        stats.completion_tokens += result.usage.completion_tokens
+        SURFER_TOKENS.labels(self.mode, "prompt").inc(result.usage.prompt_tokens)
+        SURFER_TOKENS.labels(self.mode, "completion").inc(result.usage.completion_tokens)
+        return result
+
+    def take(self):
+        """Per-mode stats since the last call, for the run summary"""
+        stats = {mode: {**asdict(stats), "seconds": round(stats.seconds, 2)}
+                 for mode, stats in self.stats.items() if stats.steps}
+        self.stats = {mode: ModeStats() for mode in MODES}
+        return stats
+
+
+@functools.lru_cache(maxsize=8)
+def _blank_png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def _blank_screenshot(page, *args, **kwargs):
+    # Same size as the viewport, so element boxes still map to visible/above/below
+    size = page.viewport_size or {"width": 1440, "height": 900}
+    return _blank_png(size["width"], size["height"])
+
+
+async def _screenshot_reason(page):
+    """Why the page needs a screenshot, or None if its text is enough"""
+    try:
+        probe = await page.evaluate(PROBE_SCRIPT)
+    except Exception:
+        return "probe_failed"
+    if probe["contentType"] not in ("text/html", "application/xhtml+xml", "text/plain"):
+        return "not_html"
+    if probe["textLength"] < MIN_TEXT_CHARS:
+        return "little_text"
+    if probe["visualShare"] > MAX_VISUAL_SHARE:
+        return "visual_content"
+    return None
+
+
+def _without_images(content):
+    if isinstance(content, str):
+        return content
+    text = "\n".join(part for part in content if isinstance(part, str))
+    return text.replace(SCREENSHOT_SENTENCE, "")
+
+
+def use_surfer_modes(surfer, client, text_first):
+    """Run surfer steps from page text when text_first, falling back to screenshots per page.
+
+    In a text step the surfer's model sees no image, Playwright screenshots
+    are replaced by a blank image and the step's reply carries no screenshot.
+    A step runs multimodal when the page is not HTML, has little text, or is
+    mostly canvas, video or embedded content.
+    """
+    original_generate_reply = surfer._generate_reply
+    original_execute_tool = surfer._execute_tool
+
+    async def _execute_tool(*args, **kwargs):
+        content = await original_execute_tool(*args, **kwargs)
+        return _without_images(content) if client.mode == "text" else content
+
+    async def _generate_reply(*args, **kwargs):
+        if not surfer.did_lazy_init:
+            await surfer._lazy_init()
+        client.mode = "multimodal"
+        if text_first:
+            reason = await _screenshot_reason(surfer._page)
+            if reason is None:
+                client.mode = "text"
+            else:
+                MODE_FALLBACKS.labels(reason).inc()
+        mode = client.mode
+        page = surfer._page
+        # Another wrapper (tracing) may have its own screenshot on the page
+        saved = page.__dict__.get("screenshot")
+        if mode == "text":
+            page.screenshot = functools.partial(_blank_screenshot, page)
+        started = time.perf_counter()
+        try:
+            return await original_generate_reply(*args, **kwargs)
+        finally:
+            if mode == "text":
+                if saved is None:
+                    del page.screenshot
+                else:
+                    page.screenshot = saved
+            elapsed = time.perf_counter() - started
+            STEP_DURATION.labels(mode).observe(elapsed)
+            client.stats[mode].steps += 1
+            client.stats[mode].seconds += elapsed
+
+    surfer._generate_reply = _generate_reply
+    surfer._execute_tool = _execute_tool
@@ -0,0 +1,31 @@
+from autogen_agentchat.messages import StopMessage, TextMessage
+
+from budgets import best_effort_answer
+
+
+def test_best_effort_answer_skips_trailing_surfer_error():
+    messages = [
+        TextMessage(source="user", content="Find the opening hours of the city library"),
+        TextMessage(source="MagenticOneOrchestrator", content="Please open the library's website and read its hours."),
+        TextMessage(source="MultimodalWebSurfer", content="The site lists Mon-Fri 9:00-18:00."),
+        TextMessage(source="MultimodalWebSurfer",
+                    content="Web surfing error:\n\nTraceback (most recent call last):\n  File ...\nTimeoutError"),
+        StopMessage(source="BudgetTermination", content="Budget exhausted: token budget of 1000 used up"),
+    ]
+    answer = best_effort_answer(messages, "token budget of 1000 used up")
+    assert "Traceback" not in answer
+    assert "Please open the library's website" in answer
+
+
+def test_best_effort_answer_falls_back_to_other_agents():
+    messages = [
+        TextMessage(source="user", content="task"),
+        TextMessage(source="MultimodalWebSurfer", content="The site lists Mon-Fri 9:00-18:00."),
+        TextMessage(source="MultimodalWebSurfer", content="Web surfing error:\n\nTraceback (most recent call last):"),
+    ]
+    assert "Mon-Fri 9:00-18:00" in best_effort_answer(messages, "stall limit reached")
+
+
+def test_best_effort_answer_without_any_answer():
+    messages = [TextMessage(source="MultimodalWebSurfer", content="Web surfing error:\n\nTraceback")]
+    assert "before any answer was produced" in best_effort_answer(messages, "turn limit reached")
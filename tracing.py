@@ -0,0 +1,190 @@
+import functools
+import os
+import threading
+from contextlib import contextmanager
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Status, StatusCode
+
+from web_surfer import add_launch_hook
+
+ORCHESTRATOR_NAME = "MagenticOneOrchestrator"
+
+# PlaywrightController coroutines traced as browser actions, by span name
+BROWSER_ACTIONS = {
+    "visit_page": "browser.navigate",
+    "back": "browser.back",
+    "click_id": "browser.click",
+    "hover_id": "browser.hover",
+    "fill_id": "browser.type",
+    "scroll_id": "browser.scroll",
+    "page_up": "browser.page_up",
+    "page_down": "browser.page_down",
+    "get_webpage_text": "browser.extract_text",
+    "get_page_markdown": "browser.extract_markdown",
+}
+
+tracer = trace.get_tracer("magentic_one_app")
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a local file, one JSON object per line"""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, spans):
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock, open(self._path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def setup_tracing():
+    """Install the tracer provider selected by TRACING_EXPORTER (jsonl, otlp or none)"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        exporter_name = os.getenv("TRACING_EXPORTER", "none").lower()
+        if exporter_name == "jsonl":
+            exporter = JsonLinesSpanExporter(os.getenv("TRACING_JSONL_PATH", "./traces/spans.jsonl"))
+        elif exporter_name == "otlp":
+            # Endpoint comes from OTEL_EXPORTER_OTLP_ENDPOINT (default localhost:4317)
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        else:
+            return
+        ratio = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": os.getenv("TRACING_SERVICE_NAME", "magentic-one-app")}),
+            sampler=ParentBased(TraceIdRatioBased(ratio)),
+        )
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+
+
+def _preview(text, limit=200):
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class RunTracer:
+    """Spans for one run: the run, each orchestrator turn, and work inside a turn.
+
+    Model calls and browser actions happen in tasks owned by the agent runtime,
+    so their parent is taken from here rather than from the current context.
+    """
+
+    def __init__(self, task, **attributes):
+        self.run_span = tracer.start_span(
+            "magentic.run", attributes={"magentic.task": _preview(task), **attributes}
+        )
+        self._turn_span = None
+        self.turns = 0
+
+    def context(self):
+        return trace.set_span_in_context(self._turn_span or self.run_span)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        with tracer.start_as_current_span(name, context=self.context(), attributes=attributes) as span:
+            yield span
+
+    def _end_turn(self):
+        if self._turn_span is not None:
+            self._turn_span.end()
+            self._turn_span = None
+
+    def on_message(self, message):
+        """Start a new turn span for every orchestrator message"""
+        source = getattr(message, "source", None)
+        if source == ORCHESTRATOR_NAME:
+            self._end_turn()
+            self.turns += 1
+            self._turn_span = tracer.start_span(
+                "magentic.turn",
+                context=trace.set_span_in_context(self.run_span),
+                attributes={"magentic.turn": self.turns, "magentic.instruction": _preview(str(message.content))},
+            )
+        elif source is not None and self._turn_span is not None:
+            self._turn_span.add_event("agent_message", {"source": source, "type": type(message).__name__})
+
+    def end(self, stop_reason=None, error=None):
+        self._end_turn()
+        self.run_span.set_attribute("magentic.turns", self.turns)
+        if stop_reason:
+            self.run_span.set_attribute("magentic.stop_reason", stop_reason)
+        if error is not None:
+            self.run_span.record_exception(error)
+            self.run_span.set_status(Status(StatusCode.ERROR, str(error)))
+        self.run_span.end()
+
+
+class CurrentRunTracer:
+    """Forwards spans to the RunTracer of whichever run is current.
+
+    A conversation keeps its model client and surfer across runs, so they are
+    traced through this instead of a single run's tracer.
+    """
+
+    def __init__(self):
+        self.current = None
+
+    def context(self):
+        return self.current.context()
+
+    def span(self, name, **attributes):
+        return self.current.span(name, **attributes)
+
+
+def _traced_action(run_tracer, span_name, method):
+    @functools.wraps(method)
+    async def wrapper(page, *args, **kwargs):
+        with run_tracer.span(span_name, **{"browser.url": getattr(page, "url", "")}) as span:
+            if span_name == "browser.navigate" and args:
+                span.set_attribute("browser.target_url", str(args[0]))
+            return await method(page, *args, **kwargs)
+
+    return wrapper
+
+
+def _traced_screenshot(run_tracer, page):
+    screenshot = page.screenshot
+
+    @functools.wraps(screenshot)
+    async def wrapper(*args, **kwargs):
+        with run_tracer.span("browser.screenshot", **{"browser.url": page.url}):
+            return await screenshot(*args, **kwargs)
+
+    page.screenshot = wrapper
+
+
+def trace_surfer(surfer, run_tracer):
+    """Emit a span for every browser action and screenshot the surfer takes"""
+    controller = getattr(surfer, "_playwright_controller", None)
+    if controller is not None:
+        for method_name, span_name in BROWSER_ACTIONS.items():
+            method = getattr(controller, method_name, None)
+            if method is not None:
+                setattr(controller, method_name, _traced_action(run_tracer, span_name, method))
+
+    def attach(surfer):
+        for page in surfer._context.pages:
+            _traced_screenshot(run_tracer, page)
+        surfer._context.on("page", lambda page: _traced_screenshot(run_tracer, page))
+
+    add_launch_hook(surfer, attach)
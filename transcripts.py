@@ -0,0 +1,87 @@
+import json
+import os
+import time
+import zlib
+
+from autogen_agentchat.base import TaskResult
+from prometheus_client import Counter
+
+from runs import RUNS_DIR, read_summary, run_dir
+
+TRANSCRIPT_FILE = "messages.ndjson"
+CHUNK_SIZE = 64 * 1024
+# Media type and file extension of each export format
+FORMATS = {"ndjson": ("application/x-ndjson", "ndjson"), "markdown": ("text/markdown", "md")}
+
+EXPORTED_BYTES = Counter("magentic_transcript_export_bytes", "Compressed bytes of transcript exports", ["format"])
+
+
+def transcript_path(run_id):
+    return os.path.join(RUNS_DIR, run_id, TRANSCRIPT_FILE)
+
+
+def _full_text(message, view):
+    # The view's text is cut for display; the transcript keeps everything
+    if view.answer is not None:
+        return view.answer
+    if not isinstance(message, TaskResult) and hasattr(message, "to_text"):
+        return message.to_text()
+    return view.text
+
+
+class TranscriptWriter:
+    """Appends every streamed message of a run to runs/<run_id>/messages.ndjson as it arrives"""
+
+    def __init__(self, run_id):
+        self._file = open(os.path.join(run_dir(run_id), TRANSCRIPT_FILE), "a", encoding="utf-8")
+
+    def write(self, message, view):
+        record = {"time": round(time.time(), 3), "source": view.source, "type": view.type,
+                  "content": _full_text(message, view), "images": view.images}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _markdown(run_id, lines):
+    summary = read_summary(run_id)
+    yield f"# Run {run_id}\n\n"
+    if summary:
+        yield f"**Task:** {summary['task']}\n\n**Outcome:** {summary['outcome']}\n\n"
+    for line in lines:
+        record = json.loads(line)
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"]))
+        yield f"## {record['source']} · {record['type']} · {when}\n\n{record['content']}\n\n"
+        if record["images"]:
+            yield f"_{len(record['images'])} screenshot(s) not included_\n\n"
+
+
+def export_transcript(run_id, format="ndjson", chunk_size=CHUNK_SIZE):
+    """Yield the run's transcript as gzip-compressed chunks of about chunk_size bytes.
+
+    The transcript is read one message at a time, so memory use does not
+    grow with its length. Runs still in progress export what they have
+    streamed so far. Raises FileNotFoundError for unknown runs.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip framing
+    with open(transcript_path(run_id), encoding="utf-8") as f:
+        pieces = f if format == "ndjson" else _markdown(run_id, f)
+        chunk, size = [], 0
+        for piece in pieces:
+            data = compressor.compress(piece.encode("utf-8"))
+            if data:
+                chunk.append(data)
+                size += len(data)
+            if size >= chunk_size:
+                EXPORTED_BYTES.labels(format).inc(size)
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        chunk.append(compressor.flush())
+        EXPORTED_BYTES.labels(format).inc(size + len(chunk[-1]))
+        yield b"".join(chunk)
+
+
+def export_filename(run_id, format):
+    return f"transcript-{run_id}.{FORMATS[format][1]}.gz"
@@ -0,0 +1,149 @@
+"""Static HTML and CSS of the Streamlit app, kept out of its render path"""
+
+# Custom CSS for better styling
+APP_CSS = """
+<style>
+    .main-header {
+        text-align: center;
+        padding: 2rem 0;
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white;
+        border-radius: 15px;
+        margin-bottom: 2rem;
+        box-shadow: 0 4px 15px rgba(0,0,0,0.2);
+    }
+    
+    .user-message {
+        background: linear-gradient(135deg, #007bff, #0056b3);
+        color: white;
+        padding: 1rem 1.5rem;
+        border-radius: 20px 20px 5px 20px;
+        margin: 1rem 0;
+        margin-left: 3rem;
+        box-shadow: 0 3px 10px rgba(0,123,255,0.3);
+        animation: slideInRight 0.3s ease;
+    }
+    
+    .assistant-message {
+        background: linear-gradient(145deg, #ffffff, #f8f9fa);
+        color: #333;
+        padding: 1rem 1.5rem;
+        border-radius: 20px 20px 20px 5px;
+        margin: 1rem 0;
+        margin-right: 3rem;
+        box-shadow: 0 3px 10px rgba(0,0,0,0.1);
+        border-left: 4px solid #28a745;
+        animation: slideInLeft 0.3s ease;
+    }
+    
+    .status-success {
+        background: linear-gradient(135deg, #28a745, #20c997);
+        color: white;
+        padding: 0.8rem 1.2rem;
+        border-radius: 25px;
+        margin: 0.5rem 0;
+        text-align: center;
+        font-weight: bold;
+        box-shadow: 0 2px 8px rgba(40,167,69,0.3);
+    }
+    
+    .status-processing {
+        background: linear-gradient(135deg, #ffc107, #fd7e14);
+        color: white;
+        padding: 0.8rem 1.2rem;
+        border-radius: 25px;
+        margin: 0.5rem 0;
+        text-align: center;
+        font-weight: bold;
+        animation: pulse 1.5s infinite;
+    }
+    
+    .status-error {
+        background: linear-gradient(135deg, #dc3545, #c82333);
+        color: white;
+        padding: 0.8rem 1.2rem;
+        border-radius: 25px;
+        margin: 0.5rem 0;
+        text-align: center;
+        font-weight: bold;
+        box-shadow: 0 2px 8px rgba(220,53,69,0.3);
+    }
+    
+    .output-container {
+        background: linear-gradient(145deg, #1e1e1e, #2d2d2d);
+        color: #00ff00;
+        padding: 1rem;
+        border-radius: 10px;
+        font-family: 'Courier New', monospace;
+        font-size: 0.85rem;
+        max-height: 400px;
+        overflow-y: auto;
+        border: 1px solid #444;
+        white-space: pre-wrap;
+    }
+    
+    @keyframes slideInRight {
+        from { transform: translateX(100%); opacity: 0; }
+        to { transform: translateX(0); opacity: 1; }
+    }
+    
+    @keyframes slideInLeft {
+        from { transform: translateX(-100%); opacity: 0; }
+        to { transform: translateX(0); opacity: 1; }
+    }
+    
+    @keyframes pulse {
+        0%, 100% { transform: scale(1); }
+        50% { transform: scale(1.05); }
+    }
+    
+    .metric-card {
+        background: linear-gradient(145deg, #ffffff, #f1f3f4);
+        padding: 1rem;
+        border-radius: 10px;
+        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+        border-left: 4px solid #007bff;
+        margin: 0.5rem 0;
+    }
+    
+    .welcome-container {
+        text-align: center; 
+        padding: 2rem; 
+        color: #666;
+        background: linear-gradient(145deg, #f8f9fa, #ffffff);
+        border-radius: 15px;
+        margin: 2rem 0;
+    }
+</style>
+"""
+
+HEADER_HTML = """
+<div class="main-header">
+    <h1>🤖 MagenticOne AI Assistant</h1>
+    <p>Powered by Azure OpenAI • Web Browsing • Multi-Agent Collaboration</p>
+</div>
+"""
+
+WELCOME_HTML = """
+<div class="welcome-container">
+    <h3>👋 Welcome to MagenticOne!</h3>
+    <p>Ask me anything and I'll help you with web research, analysis, and more.</p>
+    <p><strong>Try asking:</strong></p>
+    <ul style="text-align: left; max-width: 400px; margin: 0 auto;">
+        <li>"Summarize the latest AI research papers"</li>
+        <li>"What's trending in technology today?"</li>
+        <li>"Find information about quantum computing"</li>
+    </ul>
+</div>
+"""
+
+IDLE_OUTPUT = """Waiting for processing to begin...
+
+This monitor will show real-time output from the AI agents
+as they work on your request.
+
+You'll see:
+• Agent initialization
+• Web browsing activities  
+• AI reasoning processes
+• Task completion status"""
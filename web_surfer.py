@@ -0,0 +1,203 @@
+import asyncio
+import os
+from dataclasses import dataclass
+
+import psutil
+from autogen_ext.agents.web_surfer import MultimodalWebSurfer
+
+
+def create_surfer(model_client, **overrides):
+    """Create the MultimodalWebSurfer used by the app"""
+    options = dict(
+        downloads_folder="./downs",
+        debug_dir="./debug",
+        headless=True,
+        to_resize_viewport=True,
+        description="A web surfing assistant that can browse and interact with web pages.",
+        start_page=os.getenv("SURFER_START_PAGE", "https://www.bing.com"),
+        animate_actions=False,
+        # An empty SURFER_BROWSER_DATA_DIR gives every browser a fresh profile
+        browser_data_dir=os.getenv("SURFER_BROWSER_DATA_DIR", "./browser_data") or None,
+    )
+    options.update(overrides)
+    return MultimodalWebSurfer("MultimodalWebSurfer", model_client=model_client, **options)
+
+
+def _driver_pid(surfer):
+    """PID of the Playwright driver the surfer started; Chromium runs in its process tree"""
+    try:
+        return surfer._playwright._impl_obj._connection._transport._proc.pid
+    except AttributeError:
+        return None
+
+
+async def _launch(surfer, original_lazy_init):
+    """Run the surfer's lazy init and record the browser process tree it started"""
+    if getattr(surfer, "_recycle_requested", False):
+        # Relaunch on the page the old browser was showing
+        surfer._recycle_requested = False
+        if surfer._page is not None:
+            surfer.start_page = surfer._page.url
+        await surfer.close()
+    await original_lazy_init()
+    # Other threads hand recycle requests to the loop the browser runs on
+    surfer._browser_loop = asyncio.get_running_loop()
+    pid = _driver_pid(surfer)
+    surfer._browser_pids = [pid] if pid is not None else []
+
+
+def _wrap_lazy_init(surfer):
+    if getattr(surfer, "_launch_hooks", None) is not None:
+        return
+    surfer._launch_hooks = []
+    original_lazy_init = surfer._lazy_init
+
+    async def _lazy_init():
+        await _launch(surfer, original_lazy_init)
+        for launch_hook in list(surfer._launch_hooks):
+            result = launch_hook(surfer)
+            if hasattr(result, "__await__"):
+                await result
+
+    surfer._lazy_init = _lazy_init
+    original_generate_reply = surfer._generate_reply
+
+    async def _generate_reply(*args, **kwargs):
+        # A requested recycle takes effect here, before the turn touches the browser
+        if getattr(surfer, "_recycle_requested", False) and surfer.did_lazy_init:
+            surfer.did_lazy_init = False
+        return await original_generate_reply(*args, **kwargs)
+
+    surfer._generate_reply = _generate_reply
+
+
+def add_launch_hook(surfer, hook):
+    """Call hook(surfer) every time the surfer launches its browser.
+
+    The surfer starts Chromium lazily on its first turn, so listeners on the
+    browser context can only be attached once `_lazy_init` has run.
+    """
+    _wrap_lazy_init(surfer)
+    surfer._launch_hooks.append(hook)
+
+
+def add_close_hook(surfer, hook):
+    """Call hook(surfer) after the surfer's close() has run, even if it failed"""
+    hooks = getattr(surfer, "_close_hooks", None)
+    if hooks is None:
+        hooks = surfer._close_hooks = []
+        original_close = surfer.close
+
+        async def close():
+            try:
+                await original_close()
+            finally:
+                for close_hook in list(surfer._close_hooks):
+                    result = close_hook(surfer)
+                    if hasattr(result, "__await__"):
+                        await result
+
+        surfer.close = close
+    hooks.append(hook)
+
+
+def browser_processes(surfer):
+    """Live processes (Playwright driver and Chromium tree) started by a surfer"""
+    processes = []
+    for pid in getattr(surfer, "_browser_pids", []):
+        try:
+            root = psutil.Process(pid)
+            processes.append(root)
+            processes.extend(root.children(recursive=True))
+        except psutil.NoSuchProcess:
+            pass
+    return processes
+
+
+def _mark_recycle(surfer):
+    if surfer.did_lazy_init:
+        _wrap_lazy_init(surfer)
+        surfer._recycle_requested = True
+
+
+def request_recycle(surfer):
+    """Restart the surfer's browser at the start of its next turn; safe to call from any thread.
+
+    The request is handed to the event loop the browser runs on, and only
+    acted on when the surfer's next turn starts, so a browser is never closed
+    underneath an action in progress.
+    """
+    loop = getattr(surfer, "_browser_loop", None)
+    if loop is None or loop.is_closed():
+        return
+    try:
+        loop.call_soon_threadsafe(_mark_recycle, surfer)
+    except RuntimeError:
+        # The loop closed in the meantime
+        pass
+
+
+@dataclass
+class BrowserUsage:
+    """Navigation and network counters for one surfer's browser"""
+
+    navigations: int = 0
+    bytes_downloaded: int = 0
+    last_url: str = ""
+
+
+def _speculative(surfer, frame):
+    return frame.page in getattr(surfer, "_speculative_pages", ())
+
+
+def mark_speculative(surfer, page):
+    """Leave a page the surfer has not asked for, such as a prefetch tab, out of its BrowserUsage"""
+    if getattr(surfer, "_speculative_pages", None) is None:
+        surfer._speculative_pages = set()
+    surfer._speculative_pages.add(page)
+
+
+def unmark_speculative(surfer, page, bytes_downloaded=None):
+    """Stop leaving page out; with bytes_downloaded, charge its earlier load as one navigation"""
+    pages = getattr(surfer, "_speculative_pages", None)
+    if pages is None or page not in pages:
+        return
+    pages.discard(page)
+    usage = getattr(surfer, "_browser_usage", None)
+    if usage is not None and bytes_downloaded is not None:
+        usage.navigations += 1
+        usage.bytes_downloaded += bytes_downloaded
+        usage.last_url = page.url
+
+
+def track_browser_usage(surfer):
+    """Count main-frame navigations and response bytes for a surfer"""
+    usage = surfer._browser_usage = BrowserUsage()
+
+    def on_request(request):
+        try:
+            if _speculative(surfer, request.frame):
+                return
+            if request.is_navigation_request() and request.frame.parent_frame is None:
+                usage.navigations += 1
+                usage.last_url = request.url
+        except Exception:
+            pass
+
+    def on_response(response):
+        try:
+            if _speculative(surfer, response.frame):
+                return
+        except Exception:
+            pass
+        # Content-Length is cheap to read; bodies are never buffered here
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            usage.bytes_downloaded += int(length)
+
+    def attach(surfer):
+        surfer._context.on("request", on_request)
+        surfer._context.on("response", on_response)
+
+    add_launch_hook(surfer, attach)
+    return usage
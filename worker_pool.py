@@ -0,0 +1,243 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+from prometheus_client import Counter, Gauge
+
+from run_channel import ChannelReporter, RunChannel, queue_status
+from runs import new_run_id
+from scheduler import QueueFull, get_scheduler
+
+WORKER_RUNS = Gauge("magentic_worker_runs", "Runs in progress on each worker process", ["worker"])
+WORKER_RESTARTS = Counter("magentic_worker_restarts", "Worker processes restarted after exiting")
+
+# Limits that are shared out between the workers instead of applying to each one
+SHARED_LIMITS = ("AZURE_OPENAI_RPM", "AZURE_OPENAI_TPM")
+# Runs are admitted by the supervisor's scheduler, so workers start whatever they are sent
+SCHEDULER_LIMITS = ("SCHEDULER_MAX_RUNS", "SCHEDULER_MAX_RUNS_PER_USER", "SCHEDULER_MAX_QUEUE",
+                    "SCHEDULER_MAX_QUEUED_PER_USER")
+
+
+class _QueueChannel:
+    """Worker-side stand-in for RunChannel that forwards events to the supervisor"""
+
+    def __init__(self, run_id, task, events):
+        self.run_id = run_id
+        self.task = task
+        self._events = events
+
+    def publish(self, event, data):
+        self._events.put((self.run_id, event, data))
+
+    def finish(self, outcome, result):
+        self._events.put((self.run_id, None, {"outcome": outcome, "result": result}))
+
+
+async def _serve(commands, events):
+    """Start a run for every "run" command until told to stop"""
+    from run_channel import execute
+
+    loop = asyncio.get_running_loop()
+    runs = {}
+    while True:
+        command = await loop.run_in_executor(None, commands.get)
+        if command[0] == "stop":
+            break
+        if command[0] == "run":
+            _, run_id, task, budget, options, resume_from, user, priority = command
+            channel = _QueueChannel(run_id, task, events)
+            runs[run_id] = asyncio.create_task(execute(channel, budget, options, resume_from, user=user, priority=priority))
+            runs[run_id].add_done_callback(lambda _, run_id=run_id: runs.pop(run_id, None))
+        elif command[0] == "cancel" and command[1] in runs:
+            runs[command[1]].cancel()
+    for task in runs.values():
+        task.cancel()
+    await asyncio.gather(*runs.values(), return_exceptions=True)
+
+
+def _worker_main(env, commands, events):
+    """Entry point of a worker process: one event loop, model client and set of browsers"""
+    os.environ.update(env)
+    from dotenv import load_dotenv
+
+    import metrics
+    from code_pool import get_code_pool
+    from run_options import RunOptions
+    from tracing import setup_tracing
+
+    load_dotenv()
+    metrics.start_metrics_server()
+    setup_tracing()
+    if RunOptions.from_env().coding_agents:
+        get_code_pool()
+    asyncio.run(_serve(commands, events))
+
+
+@dataclass
+class Worker:
+    index: int
+    process: object
+    commands: object
+    runs: set = field(default_factory=set)
+
+
+class WorkerPool:
+    """Runs tasks in N worker processes and streams their events back into RunChannels.
+
+    Runs wait for a slot in the supervisor's scheduler, so its global and
+    per-user limits hold across all workers. Once admitted, a run goes to the
+    worker with the fewest runs in progress and keeps its slot until it
+    finishes. A worker that exits is restarted, and its runs finish with an
+    error; they can be resumed from their checkpoints.
+    """
+
+    def __init__(self, processes):
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._waiting = {}
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="worker-pool-scheduler", daemon=True).start()
+        self.workers = [self._start(index, processes) for index in range(processes)]
+        threading.Thread(target=self._route_events, name="worker-pool-events", daemon=True).start()
+        threading.Thread(target=self._monitor, name="worker-pool-monitor", daemon=True).start()
+
+    def _start(self, index, processes):
+        env = dict.fromkeys(SCHEDULER_LIMITS, "0")
+        for name in SHARED_LIMITS:
+            if os.getenv(name):
+                env[name] = str(float(os.environ[name]) / processes)
+        metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+        # Workers export their own metrics on the ports after the app's
+        env["METRICS_PORT"] = str(metrics_port + 1 + index if metrics_port else 0)
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, args=(env, commands, self._events), name=f"magentic-worker-{index}", daemon=True
+        )
+        process.start()
+        WORKER_RUNS.labels(str(index)).set(0)
+        return Worker(index, process, commands)
+
+    def submit(self, task, budget=None, options=None, resume_from=None, user=None, priority=0):
+        """Queue a run for a worker and return its RunChannel"""
+        channel = RunChannel(new_run_id(), task)
+        command = ("run", channel.run_id, task, budget, options, resume_from, user, priority)
+        with self._lock:
+            self._waiting[channel.run_id] = asyncio.run_coroutine_threadsafe(
+                self._schedule(channel, command, user or "anonymous", priority), self._loop
+            )
+        return channel
+
+    async def _schedule(self, channel, command, user, priority):
+        """Hold a scheduler slot for the run from its dispatch until it finishes"""
+        finished = asyncio.Event()
+        try:
+            async with get_scheduler().slot(user, priority, queue_status(ChannelReporter(channel))):
+                with self._lock:
+                    self._waiting.pop(channel.run_id, None)
+                    worker = min(self.workers, key=lambda worker: len(worker.runs))
+                    worker.runs.add(channel.run_id)
+                    self._channels[channel.run_id] = (channel, worker, finished)
+                    WORKER_RUNS.labels(str(worker.index)).set(len(worker.runs))
+                worker.commands.put(command)
+                await finished.wait()
+        except QueueFull as e:
+            ChannelReporter(channel).status("error", f"⛔ {e}")
+            channel.finish("rejected", f"⛔ {e}")
+        except asyncio.CancelledError:
+            # Cancelled while still queued
+            channel.finish("cancelled", None)
+        finally:
+            with self._lock:
+                self._waiting.pop(channel.run_id, None)
+
+    def cancel(self, run_id):
+        with self._lock:
+            entry = self._channels.get(run_id)
+            waiting = self._waiting.get(run_id)
+        if entry is not None:
+            entry[1].commands.put(("cancel", run_id))
+            return True
+        if waiting is not None:
+            waiting.cancel()
+            return True
+        return False
+
+    def _finish(self, run_id, outcome, result):
+        with self._lock:
+            entry = self._channels.pop(run_id, None)
+            if entry is not None:
+                channel, worker, finished = entry
+                worker.runs.discard(run_id)
+                WORKER_RUNS.labels(str(worker.index)).set(len(worker.runs))
+        if entry is not None:
+            channel.finish(outcome, result)
+            # Frees the run's scheduler slot
+            self._loop.call_soon_threadsafe(finished.set)
+
+    def _route_events(self):
+        while True:
+            try:
+                run_id, event, data = self._events.get()
+            except (EOFError, OSError):
+                return
+            if event is None:
+                self._finish(run_id, data["outcome"], data["result"])
+                continue
+            with self._lock:
+                entry = self._channels.get(run_id)
+            if entry is not None:
+                entry[0].publish(event, data)
+
+    def _monitor(self):
+        while not self._closed:
+            time.sleep(1.0)
+            for position, worker in enumerate(list(self.workers)):
+                if worker.process.is_alive() or self._closed:
+                    continue
+                print(f"Worker {worker.index} exited with code {worker.process.exitcode}; restarting")
+                WORKER_RESTARTS.inc()
+                for run_id in list(worker.runs):
+                    self._finish(run_id, "error", f"Error: worker process exited with code "
+                                                  f"{worker.process.exitcode}; resume the run from its checkpoint")
+                with self._lock:
+                    self.workers[position] = self._start(worker.index, len(self.workers))
+
+    def shutdown(self, timeout=10.0):
+        self._closed = True
+        with self._lock:
+            waiting = list(self._waiting.values())
+        for future in waiting:
+            future.cancel()
+        for worker in self.workers:
+            try:
+                worker.commands.put(("stop",))
+            except (ValueError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the process-wide pool, or None when WORKER_PROCESSES is 0 (run in-process)"""
+    global _pool
+    processes = int(os.getenv("WORKER_PROCESSES", "0"))
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(processes)
+            atexit.register(_pool.shutdown)
+        return _pool